@@ -1,5 +1,7 @@
+from typing import Iterable, Iterator, Optional, Union
+
 from .client import AnymindClient
-from .types import ChatResponse
+from .types import BatchResult, ChatResponse
 
 
 class Agent:
@@ -37,3 +39,40 @@ class Agent:
         result: ChatResponse = self.client.post(endpoint, payload)
         return result["content"]
 
+
+    def chat_batch(
+        self,
+        messages: Iterable[Union[str, dict]],
+        concurrency: Optional[int] = None,
+    ) -> Iterator[BatchResult]:
+        """
+        Sends many messages in one request and yields results as they complete.
+
+        Each message is either a string (sent to this agent/chat) or a dict with
+        `content` and optional `chat_id`, `agent_id` and `id`. Results arrive in
+        completion order; use `index` (or your `id`) to match them to inputs.
+        Messages for the same chat are processed in order on the server.
+        A failed item yields a result with status "error" instead of raising.
+        """
+
+        items = []
+        for message in messages:
+            if isinstance(message, str):
+                message = {"content": message}
+            items.append(
+                {
+                    "agent_id": message.get("agent_id", self.agent_id),
+                    "chat_id": message.get("chat_id", self.chat_id),
+                    "content": message["content"],
+                    "id": message.get("id"),
+                }
+            )
+
+        payload = {"items": items}
+        if concurrency is not None:
+            payload["concurrency"] = concurrency
+
+        for record in self.client.post_ndjson("/api/v1/agents/batch/messages", payload, timeout=300):
+            if record.get("done"):
+                break
+            yield record
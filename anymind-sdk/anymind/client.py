@@ -1,3 +1,6 @@
+import json
+from typing import Iterator
+
 import requests
 from .errors import AuthenticationError, AnymindRuntimeError
 
@@ -7,17 +10,14 @@ class AnymindClient:
         self.wallet_address = wallet_address
         self.base_url = base_url.rstrip("/")
 
-    def post(self, path: str, payload: dict) -> dict:
-        resp = requests.post(
-            f"{self.base_url}{path}",
-            json=payload,
-            headers={
-                "X-Wallet-Address": self.wallet_address,
-                "Content-Type": "application/json",
-            },
-            timeout=30,
-        )
+    def _headers(self) -> dict:
+        return {
+            "X-Wallet-Address": self.wallet_address,
+            "Content-Type": "application/json",
+        }
 
+    @staticmethod
+    def _raise_for_status(resp: requests.Response) -> None:
         if resp.status_code == 401:
             raise AuthenticationError("Wallet address required or invalid")
 
@@ -27,5 +27,30 @@ class AnymindClient:
         if resp.status_code != 200:
             raise AnymindRuntimeError(f"API error ({resp.status_code}): {resp.text}")
 
+    def post(self, path: str, payload: dict) -> dict:
+        resp = requests.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            headers=self._headers(),
+            timeout=30,
+        )
+        self._raise_for_status(resp)
         return resp.json()
 
+    def post_ndjson(self, path: str, payload: dict, timeout: float = 30) -> Iterator[dict]:
+        """
+        POST and yield newline-delimited JSON records as the server streams them.
+        `timeout` bounds connect and the gap between records, not the whole stream.
+        """
+        with requests.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            headers=self._headers(),
+            timeout=timeout,
+            stream=True,
+        ) as resp:
+            self._raise_for_status(resp)
+            for line in resp.iter_lines():
+                if line:
+                    yield json.loads(line)
+
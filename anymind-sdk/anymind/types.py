@@ -7,3 +7,16 @@ class ChatResponse(TypedDict):
     usage: Optional[Dict[str, Any]]
     metadata: Optional[Dict[str, Any]]
 
+
+
+class BatchResult(TypedDict, total=False):
+    index: int
+    id: Optional[str]
+    agent_id: str
+    chat_id: str
+    status: str  # "ok" | "error"
+    status_code: int
+    content: str
+    model: str
+    usage: Optional[Dict[str, Any]]
+    error: str
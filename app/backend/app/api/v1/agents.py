@@ -1,23 +1,151 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Optional, List, Dict, Any
 from app.models.schemas import (
     Chat, ChatCreate, ChatUpdate, Message, MessageCreate,
-    Agent, AgentCreate, AgentUpdate, LLMResponse, CapsuleCreate, StakingCreate
+    Agent, AgentCreate, AgentUpdate, LLMResponse, CapsuleCreate, StakingCreate,
+    BatchMessageItem, BatchMessageRequest, FanOutRequest
 )
 from app.services.agent_service import AgentService
 from app.services.llm_service import LLMService
 from app.services.capsule_service import CapsuleService
 from app.services.wallet_service import WalletService
+from app.services.usage_service import UsageService
+from app.services.response_cache_service import CACHE_HIT, CacheLookup
+from app.services.admission_service import (
+    AdmissionRejected,
+    AdmissionTicket,
+    Priority,
+    get_admission_controller,
+)
 from app.core.auth_dependencies import get_wallet_address
+from app.core.config import settings
+from app.core.sse import sse_event, ndjson_line, coalesce_chunks
 from datetime import datetime
+import asyncio
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+AGGREGATOR_INSTRUCTIONS = (
+    "Several assistants answered the same question. Merge their answers into one "
+    "accurate response: keep points they agree on, resolve or flag disagreements, "
+    "and drop anything unsupported."
+)
+
+
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=e.reason,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def _admit(wallet_address: Optional[str], agent: Agent, priority: Priority) -> Optional[AdmissionTicket]:
+    """Reserve an LLM slot for this wallet/provider or raise 429 with Retry-After."""
+    if not settings.ADMISSION_ENABLED:
+        return None
+    try:
+        return await get_admission_controller().acquire(
+            wallet_address,
+            LLMService.resolve_provider(agent, agent.id),
+            priority,
+        )
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+
+
+def _release(ticket: Optional[AdmissionTicket]) -> None:
+    if ticket is not None:
+        get_admission_controller().release(ticket)
+
+
+def _turn_history(chat: Chat, message: MessageCreate) -> List[Dict[str, str]]:
+    history = [{"role": m.role.value, "content": m.content} for m in chat.messages]
+    history.append({"role": message.role.value, "content": message.content})
+    return history
+
+
+async def _check_turn_cache(
+    llm_service: LLMService,
+    actual_agent_id: str,
+    agent: Agent,
+    chat: Chat,
+    message: MessageCreate
+) -> Optional[CacheLookup]:
+    """Response cache lookup for a turn, done before admission: hits need no LLM slot."""
+    return await llm_service.check_response_cache(
+        actual_agent_id,
+        _turn_history(chat, message),
+        agent,
+        getattr(chat, 'web_search_enabled', False)
+    )
+
+
+def _is_hit(cache_lookup: Optional[CacheLookup]) -> bool:
+    return bool(cache_lookup and cache_lookup.status == CACHE_HIT)
+
+
+async def _complete_turn(
+    service: AgentService,
+    llm_service: LLMService,
+    actual_agent_id: str,
+    agent: Agent,
+    chat: Chat,
+    message: MessageCreate,
+    wallet_address: str,
+    response: Optional[Response] = None,
+    cache_lookup: Optional[CacheLookup] = None
+) -> LLMResponse:
+    """Persist the user message, run the completion and persist the answer."""
+    chat_id = chat.id
+    
+    # Save user message first
+    user_msg = await service.add_message(chat_id, message, wallet_address)
+    
+    # Get LLM response with memory integration
+    messages_history = _turn_history(chat, message)
+    
+    try:
+        # Get memory_size from chat
+        memory_size = chat.memory_size.value if hasattr(chat.memory_size, 'value') else str(chat.memory_size)
+        
+        # Get capsule_id from chat for memory scope isolation
+        capsule_id = chat.capsule_id if hasattr(chat, 'capsule_id') else None
+        
+        # Get web_search_enabled from chat
+        web_search_enabled = getattr(chat, 'web_search_enabled', False)
+        
+        llm_response = await llm_service.get_completion(
+            agent_id=actual_agent_id,  # Use the actual agent_id from chat
+            messages=messages_history,
+            agent_config=agent,
+            chat_id=chat_id,  # Pass chat_id for memory retrieval
+            memory_size=memory_size,  # Pass memory_size setting
+            capsule_id=capsule_id,  # Pass capsule_id for memory scope isolation
+            web_search_enabled=web_search_enabled,  # Pass web_search_enabled flag
+            wallet_address=wallet_address,  # Usage rollups per wallet
+            memory_engine=chat.memory_engine,  # mem0 or lite extraction (per chat)
+            cache_lookup=cache_lookup
+        )
+        
+        # Save assistant message
+        assistant_msg = MessageCreate(role="assistant", content=llm_response.content)
+        await service.add_message(chat_id, assistant_msg, wallet_address)
+        
+        cache_status = (llm_response.metadata or {}).get("cache")
+        if cache_status and response is not None:
+            response.headers["X-Cache"] = cache_status.upper()
+        return llm_response
+    except Exception as e:
+        # Log error but don't remove user message (user can see it failed)
+        # logger.error(f"Error getting LLM response: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to get AI response: {str(e)}")
+
 
 @router.get("/", response_model=List[Agent])
 async def list_agents(wallet_address: Optional[str] = Depends(get_wallet_address)):
@@ -36,6 +164,319 @@ async def create_agent(agent: AgentCreate, wallet_address: Optional[str] = Depen
     return await service.create_agent(agent, wallet_address)
 
 
+@router.post("/batch/messages")
+async def send_messages_batch(
+    batch: BatchMessageRequest,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """
+    Send many messages (same or different chats) and stream results back as NDJSON.
+
+    Items run concurrently (capped by `concurrency` / BATCH_MAX_CONCURRENCY); items that
+    target the same chat run in request order so each turn sees the previous answer.
+    Each line carries the item's `index`, echoed `id` and its own `status`.
+    """
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+    if len(batch.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {settings.BATCH_MAX_ITEMS} items)")
+    
+    concurrency = min(batch.concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+    
+    # Group by chat, preserving order within each chat
+    by_chat: Dict[str, List[int]] = {}
+    for index, item in enumerate(batch.items):
+        by_chat.setdefault(item.chat_id, []).append(index)
+    
+    async def run_item(index: int, item: BatchMessageItem) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "index": index,
+            "id": item.id,
+            "agent_id": item.agent_id,
+            "chat_id": item.chat_id,
+        }
+        service = AgentService()
+        try:
+            chat = await service.get_chat(item.chat_id, wallet_address)
+            if not chat:
+                raise HTTPException(status_code=404, detail="Chat not found")
+            actual_agent_id = chat.agent_id if chat.agent_id else item.agent_id
+            agent = await service.get_agent(actual_agent_id, wallet_address)
+            if not agent:
+                raise HTTPException(status_code=404, detail="Agent not found")
+            
+            llm_service = LLMService()
+            message = MessageCreate(role="user", content=item.content)
+            cache_lookup = await _check_turn_cache(llm_service, actual_agent_id, agent, chat, message)
+            
+            # Batch work yields to interactive traffic; wait and retry instead of failing fast.
+            # Cache hits need no LLM slot.
+            ticket = None
+            for attempt in range(3):
+                if _is_hit(cache_lookup):
+                    break
+                try:
+                    ticket = await _admit(wallet_address, agent, Priority.BATCH)
+                    break
+                except HTTPException as e:
+                    if e.status_code != 429 or attempt == 2:
+                        raise
+                    await asyncio.sleep(int((e.headers or {}).get("Retry-After", "1")))
+            try:
+                llm_response = await _complete_turn(
+                    service,
+                    llm_service,
+                    actual_agent_id,
+                    agent,
+                    chat,
+                    message,
+                    wallet_address,
+                    cache_lookup=cache_lookup,
+                )
+            finally:
+                _release(ticket)
+            result.update(
+                status="ok",
+                status_code=200,
+                content=llm_response.content,
+                model=llm_response.model,
+                usage=llm_response.usage,
+            )
+        except HTTPException as e:
+            result.update(status="error", status_code=e.status_code, error=str(e.detail))
+        except Exception as e:
+            result.update(status="error", status_code=500, error=str(e))
+        return result
+    
+    async def run_chat(indexes: List[int]) -> None:
+        for index in indexes:
+            async with semaphore:
+                await results.put(await run_item(index, batch.items[index]))
+    
+    async def generate_results():
+        tasks = [asyncio.create_task(run_chat(indexes)) for indexes in by_chat.values()]
+        succeeded = 0
+        try:
+            for _ in range(len(batch.items)):
+                result = await results.get()
+                if result["status"] == "ok":
+                    succeeded += 1
+                yield ndjson_line(result)
+            yield ndjson_line({
+                "done": True,
+                "total": len(batch.items),
+                "succeeded": succeeded,
+                "failed": len(batch.items) - succeeded,
+            })
+        finally:
+            # Client went away (or we are done): stop outstanding work
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    return StreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/fanout/messages/stream")
+async def send_message_fanout(
+    request: FanOutRequest,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """
+    Send one prompt to several agents concurrently and stream their answers (SSE).
+
+    Events are tagged with the target `index`, `agent_id` and `chat_id`, and chunks from
+    different agents interleave as they arrive. Web search runs once and is shared by every
+    target whose chat has it enabled; memory stays scoped per agent/chat. With an
+    `aggregator`, that agent merges the answers once all targets finish (events tagged
+    `"source": "aggregator"`).
+    """
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+    if len(request.targets) > settings.FANOUT_MAX_TARGETS:
+        raise HTTPException(status_code=413, detail=f"Too many targets (max {settings.FANOUT_MAX_TARGETS})")
+    
+    chat_ids = [t.chat_id for t in request.targets]
+    if len(set(chat_ids)) != len(chat_ids):
+        raise HTTPException(status_code=400, detail="Each target must use a different chat")
+    
+    service = AgentService()
+    llm_service = LLMService()
+    
+    # Resolve every target before streaming so ownership errors are plain HTTP errors
+    targets: List[Dict[str, Any]] = []
+    for index, target in enumerate(request.targets):
+        chat = await service.get_chat(target.chat_id, wallet_address)
+        if not chat:
+            raise HTTPException(status_code=404, detail=f"Chat not found (chat_id: {target.chat_id})")
+        actual_agent_id = chat.agent_id if chat.agent_id else target.agent_id
+        agent = await service.get_agent(actual_agent_id, wallet_address)
+        if not agent:
+            raise HTTPException(status_code=404, detail=f"Agent not found (agent_id: {actual_agent_id})")
+        targets.append({"index": index, "chat": chat, "agent": agent, "agent_id": actual_agent_id})
+    
+    aggregator_agent = None
+    aggregator_chat = None
+    if request.aggregator:
+        aggregator_agent = await service.get_agent(request.aggregator.agent_id, wallet_address)
+        if not aggregator_agent:
+            raise HTTPException(status_code=404, detail=f"Agent not found (agent_id: {request.aggregator.agent_id})")
+        if request.aggregator.chat_id:
+            aggregator_chat = await service.get_chat(request.aggregator.chat_id, wallet_address)
+            if not aggregator_chat:
+                raise HTTPException(status_code=404, detail=f"Chat not found (chat_id: {request.aggregator.chat_id})")
+    
+    message = MessageCreate(role="user", content=request.content)
+    
+    async def run_target(target: Dict[str, Any], events: asyncio.Queue, answers: Dict[int, str], web_context: Optional[str]) -> None:
+        chat = target["chat"]
+        agent = target["agent"]
+        tag = {"index": target["index"], "agent_id": target["agent_id"], "chat_id": chat.id}
+        ticket = None
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        try:
+            ticket = await _admit(wallet_address, agent, Priority.INTERACTIVE)
+            await service.add_message(chat.id, message, wallet_address)
+            
+            messages_history = [{"role": m.role.value, "content": m.content} for m in chat.messages]
+            messages_history.append({"role": message.role.value, "content": message.content})
+            memory_size = chat.memory_size.value if hasattr(chat.memory_size, 'value') else str(chat.memory_size)
+            
+            stream = llm_service.get_completion_stream(
+                agent_id=target["agent_id"],
+                messages=messages_history,
+                agent_config=agent,
+                chat_id=chat.id,
+                memory_size=memory_size,
+                capsule_id=getattr(chat, 'capsule_id', None),
+                web_search_enabled=getattr(chat, 'web_search_enabled', False),
+                usage=usage,
+                wallet_address=wallet_address,
+                web_search_context=web_context,
+                memory_engine=chat.memory_engine
+            )
+            async for chunk in coalesce_chunks(
+                stream,
+                max_delay_ms=settings.STREAM_COALESCE_MS,
+                max_chars=settings.STREAM_COALESCE_MAX_CHARS,
+            ):
+                parts.append(chunk)
+                await events.put(sse_event({**tag, "content": chunk}))
+            
+            full_content = "".join(parts)
+            if full_content:
+                assistant_msg = MessageCreate(role="assistant", content=full_content)
+                await service.add_message(chat.id, assistant_msg, wallet_address)
+                answers[target["index"]] = full_content
+            await events.put(sse_event({**tag, "done": True, "usage": usage or None}))
+        except HTTPException as e:
+            await events.put(sse_event({**tag, "error": str(e.detail), "status_code": e.status_code}))
+        except Exception as e:
+            await events.put(sse_event({**tag, "error": str(e)}))
+        finally:
+            _release(ticket)
+            # One sentinel per target tells the merger this branch is finished
+            await events.put(None)
+    
+    def aggregator_prompt(answers: Dict[int, str]) -> List[Dict[str, str]]:
+        sections = [
+            f"### {targets[index]['agent'].display_name}\n{answer}"
+            for index, answer in sorted(answers.items())
+        ]
+        instructions = request.aggregator.instructions or AGGREGATOR_INSTRUCTIONS
+        history = [{"role": m.role.value, "content": m.content} for m in aggregator_chat.messages] if aggregator_chat else []
+        return history + [{
+            "role": "user",
+            "content": f"{instructions}\n\nQuestion:\n{request.content}\n\nAnswers:\n\n" + "\n\n".join(sections),
+        }]
+    
+    async def generate_stream():
+        events: asyncio.Queue = asyncio.Queue()
+        answers: Dict[int, str] = {}
+        tasks: List[asyncio.Task] = []
+        try:
+            # Web results depend only on the prompt, so search once for all targets
+            web_context = None
+            if any(getattr(t["chat"], 'web_search_enabled', False) for t in targets):
+                web_context = await llm_service.fetch_web_context(request.content)
+            
+            tasks = [asyncio.create_task(run_target(t, events, answers, web_context)) for t in targets]
+            pending = len(tasks)
+            while pending:
+                event = await events.get()
+                if event is None:
+                    pending -= 1
+                    continue
+                yield event
+            
+            if aggregator_agent and answers:
+                tag = {"source": "aggregator", "agent_id": aggregator_agent.id}
+                ticket = None
+                parts: List[str] = []
+                usage: Dict[str, Any] = {}
+                try:
+                    ticket = await _admit(wallet_address, aggregator_agent, Priority.INTERACTIVE)
+                    stream = llm_service.get_completion_stream(
+                        agent_id=aggregator_agent.id,
+                        messages=aggregator_prompt(answers),
+                        agent_config=aggregator_agent,
+                        chat_id=aggregator_chat.id if aggregator_chat else None,
+                        usage=usage,
+                        wallet_address=wallet_address
+                    )
+                    async for chunk in coalesce_chunks(
+                        stream,
+                        max_delay_ms=settings.STREAM_COALESCE_MS,
+                        max_chars=settings.STREAM_COALESCE_MAX_CHARS,
+                    ):
+                        parts.append(chunk)
+                        yield sse_event({**tag, "content": chunk})
+                    
+                    full_content = "".join(parts)
+                    if aggregator_chat and full_content:
+                        await service.add_message(aggregator_chat.id, message, wallet_address)
+                        await service.add_message(
+                            aggregator_chat.id,
+                            MessageCreate(role="assistant", content=full_content),
+                            wallet_address
+                        )
+                    yield sse_event({**tag, "done": True, "usage": usage or None})
+                except HTTPException as e:
+                    yield sse_event({**tag, "error": str(e.detail), "status_code": e.status_code})
+                except Exception as e:
+                    yield sse_event({**tag, "error": str(e)})
+                finally:
+                    _release(ticket)
+            
+            yield sse_event({
+                "done": True,
+                "completed": len(answers),
+                "failed": len(targets) - len(answers),
+            })
+        finally:
+            # Client went away (or we are done): stop outstanding branches
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.put("/{agent_id}", response_model=Agent)
 async def update_agent(
     agent_id: str,
@@ -124,6 +565,7 @@ async def send_message(
     agent_id: str,
     chat_id: str,
     message: MessageCreate,
+    response: Response,
     wallet_address: Optional[str] = Depends(get_wallet_address)
 ):
     """Send a message to an agent and get response"""
@@ -151,42 +593,19 @@ async def send_message(
     if not agent:
         raise HTTPException(status_code=404, detail=f"Agent not found (agent_id: {actual_agent_id})")
     
-    # Save user message first
-    user_msg = await service.add_message(chat_id, message, wallet_address)
-    
-    # Get LLM response with memory integration
-    messages_history = [{"role": m.role.value, "content": m.content} for m in chat.messages]
-    messages_history.append({"role": message.role.value, "content": message.content})
+    # Reserve an LLM slot before persisting anything (429 + Retry-After when saturated);
+    # cache hits need no LLM slot
+    cache_lookup = await _check_turn_cache(llm_service, actual_agent_id, agent, chat, message)
+    ticket = None
+    if not _is_hit(cache_lookup):
+        ticket = await _admit(wallet_address, agent, Priority.STANDARD)
     
     try:
-        # Get memory_size from chat
-        memory_size = chat.memory_size.value if hasattr(chat.memory_size, 'value') else str(chat.memory_size)
-        
-        # Get capsule_id from chat for memory scope isolation
-        capsule_id = chat.capsule_id if hasattr(chat, 'capsule_id') else None
-        
-        # Get web_search_enabled from chat
-        web_search_enabled = getattr(chat, 'web_search_enabled', False)
-        
-        response = await llm_service.get_completion(
-            agent_id=actual_agent_id,  # Use the actual agent_id from chat
-            messages=messages_history,
-            agent_config=agent,
-            chat_id=chat_id,  # Pass chat_id for memory retrieval
-            memory_size=memory_size,  # Pass memory_size setting
-            capsule_id=capsule_id,  # Pass capsule_id for memory scope isolation
-            web_search_enabled=web_search_enabled  # Pass web_search_enabled flag
+        return await _complete_turn(
+            service, llm_service, actual_agent_id, agent, chat, message, wallet_address, response, cache_lookup
         )
-        
-        # Save assistant message
-        assistant_msg = MessageCreate(role="assistant", content=response.content)
-        await service.add_message(chat_id, assistant_msg, wallet_address)
-        
-        return response
-    except Exception as e:
-        # Log error but don't remove user message (user can see it failed)
-        # logger.error(f"Error getting LLM response: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to get AI response: {str(e)}")
+    finally:
+        _release(ticket)
 
 
 @router.post("/{agent_id}/chats/{chat_id}/messages/stream")
@@ -220,9 +639,6 @@ async def send_message_stream(
     if not agent:
         raise HTTPException(status_code=404, detail=f"Agent not found (agent_id: {actual_agent_id})")
     
-    # Save user message first
-    user_msg = await service.add_message(chat_id, message, wallet_address)
-    
     # Get LLM response with memory integration
     messages_history = [{"role": m.role.value, "content": m.content} for m in chat.messages]
     messages_history.append({"role": message.role.value, "content": message.content})
@@ -232,41 +648,77 @@ async def send_message_stream(
     capsule_id = chat.capsule_id if hasattr(chat, 'capsule_id') else None
     web_search_enabled = getattr(chat, 'web_search_enabled', False)
     
+    # Resolve the response cache up front so the hit/miss header can be sent
+    cache_lookup = await llm_service.check_response_cache(
+        actual_agent_id, messages_history, agent, web_search_enabled
+    )
+    
+    # Interactive streams get the highest priority; cache hits need no LLM slot
+    ticket = None
+    if not _is_hit(cache_lookup):
+        ticket = await _admit(wallet_address, agent, Priority.INTERACTIVE)
+    
+    try:
+        # Save user message first
+        user_msg = await service.add_message(chat_id, message, wallet_address)
+    except Exception:
+        _release(ticket)
+        raise
+    
     async def generate_stream():
-        full_content = ""
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
         try:
-            async for chunk in llm_service.get_completion_stream(
+            stream = llm_service.get_completion_stream(
                 agent_id=actual_agent_id,
                 messages=messages_history,
                 agent_config=agent,
                 chat_id=chat_id,
                 memory_size=memory_size,
                 capsule_id=capsule_id,
-                web_search_enabled=web_search_enabled
+                web_search_enabled=web_search_enabled,
+                cache_lookup=cache_lookup,
+                usage=usage,
+                wallet_address=wallet_address,
+                memory_engine=chat.memory_engine
+            )
+            # Optionally merge tiny deltas into fewer SSE frames (first token is never delayed)
+            async for chunk in coalesce_chunks(
+                stream,
+                max_delay_ms=settings.STREAM_COALESCE_MS,
+                max_chars=settings.STREAM_COALESCE_MAX_CHARS,
             ):
-                full_content += chunk
+                parts.append(chunk)
                 # Send chunk as SSE
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
+                yield sse_event({"content": chunk})
             
             # Save assistant message after streaming completes
+            full_content = "".join(parts)
             if full_content:
                 assistant_msg = MessageCreate(role="assistant", content=full_content)
                 await service.add_message(chat_id, assistant_msg, wallet_address)
             
-            # Send completion signal
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            # Send completion signal (with token usage and timings)
+            yield sse_event({"done": True, "usage": usage or None})
         except Exception as e:
             # logger.error(f"Error in streaming: {e}", exc_info=True)
-            error_data = json.dumps({'error': str(e)})
-            yield f"data: {error_data}\n\n"
+            yield sse_event({"error": str(e)})
+        finally:
+            _release(ticket)
+    
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Disable buffering for nginx
+    }
+    if cache_lookup:
+        headers["X-Cache"] = cache_lookup.status.upper()
     
     return StreamingResponse(
         generate_stream(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",  # Disable buffering for nginx
-        }
+        headers=headers,
+        # Also release if the client disconnects before the stream starts (release is idempotent)
+        background=BackgroundTask(_release, ticket)
     )
 
 
@@ -284,13 +736,36 @@ async def get_messages(
     return chat.messages
 
 
+@router.get("/{agent_id}/usage")
+async def get_agent_usage(
+    agent_id: str,
+    days: int = Query(7, ge=1, le=90),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Daily token usage and latency rollups for an agent"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+    
+    service = AgentService()
+    agent = await service.get_agent(agent_id, wallet_address)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    return {
+        "agent_id": agent_id,
+        "days": UsageService().get_rollups("agent", agent_id, days),
+    }
+
+
 @router.get("/{agent_id}/chats/{chat_id}/memories")
 async def get_chat_memories(
     agent_id: str,
     chat_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     wallet_address: Optional[str] = Depends(get_wallet_address)
 ):
-    """Get all stored memories for a chat (for verification/tracking)"""
+    """List a chat's stored memories page by page (for verification/tracking)"""
     if not wallet_address:
         raise HTTPException(status_code=401, detail="Wallet address required")
     
@@ -308,18 +783,24 @@ async def get_chat_memories(
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # Get all memories for this chat
+    # Scroll this chat's memories straight from Qdrant
     from app.services.memory_service import MemoryService
     memory_service = MemoryService()
     # Get capsule_id from chat for memory filtering
     capsule_id = chat.capsule_id if hasattr(chat, 'capsule_id') else None
-    memories = memory_service.get_all_chat_memories(actual_agent_id, chat_id, capsule_id)
+    try:
+        memories, next_cursor = memory_service.list_chat_memories(
+            actual_agent_id, chat_id, capsule_id, limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return {
         "chat_id": chat_id,
         "agent_id": actual_agent_id,
         "memory_count": len(memories),
         "memories": memories,
+        "next_cursor": next_cursor,
         "using_platform": memory_service.use_platform
     }
 
@@ -0,0 +1,91 @@
+"""
+API endpoints for shared blackboard memory between agents
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from app.core.auth_dependencies import get_wallet_address
+from app.models.schemas import BlackboardEntryCreate
+from app.services.agent_service import AgentService
+from app.services.blackboard_service import BlackboardService
+
+router = APIRouter()
+
+
+def _get_service() -> BlackboardService:
+    try:
+        return BlackboardService()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/{board_id}/entries")
+async def list_blackboard_entries(
+    board_id: str,
+    since: int = Query(0, ge=0, description="Only entries with seq greater than this cursor"),
+    limit: int = Query(100, ge=1, le=500),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """
+    List blackboard entries oldest first.
+    Pass the last `seq` you have seen as `since` to fetch only new entries.
+    """
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    entries = await _get_service().list_entries(wallet_address, board_id, since_seq=since, limit=limit)
+    cursor = entries[-1]["seq"] if entries else since
+    return {"board_id": board_id, "entries": entries, "cursor": cursor}
+
+
+@router.post("/{board_id}/entries")
+async def write_blackboard_entry(
+    board_id: str,
+    entry: BlackboardEntryCreate,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Post a finding; near-duplicates are merged into the existing entry"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    if entry.author_agent_id:
+        agent = await AgentService().get_agent(entry.author_agent_id, wallet_address)
+        if not agent:
+            raise HTTPException(status_code=404, detail="Agent not found")
+
+    try:
+        result = await _get_service().write(
+            wallet_address,
+            board_id,
+            entry.content,
+            author_agent_id=entry.author_agent_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"entry": result.entry, "duplicate": result.duplicate}
+
+
+@router.get("/{board_id}/search")
+async def search_blackboard(
+    board_id: str,
+    q: str = Query(..., min_length=1),
+    k: int = Query(5, ge=1, le=50),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Semantic search over a blackboard"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    return {"board_id": board_id, "entries": await _get_service().search(wallet_address, board_id, q, k=k)}
+
+
+@router.delete("/{board_id}")
+async def clear_blackboard(
+    board_id: str,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Delete every entry on a blackboard"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    await _get_service().clear(wallet_address, board_id)
+    return {"message": "Blackboard cleared"}
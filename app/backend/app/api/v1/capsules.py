@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import Optional, List
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Optional, List
 from app.models.schemas import Capsule, CapsuleCreate, CapsuleUpdate
 from app.services.capsule_service import CapsuleService
 from app.core.auth_dependencies import get_wallet_address
+from app.core.config import settings
+from app.core.sse import sse_event, coalesce_chunks
 
 router = APIRouter()
 
@@ -85,3 +88,49 @@ async def query_capsule(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+
+@router.post("/{capsule_id}/query/stream")
+async def query_capsule_stream(
+    capsule_id: str,
+    query: dict,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Query a capsule (requires payment) and stream the answer (Server-Sent Events)"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    service = CapsuleService()
+    try:
+        # Payment is verified before the stream opens, so failures are plain 400s
+        plan = await service.prepare_query(
+            capsule_id,
+            query.get("prompt", ""),
+            wallet_address,
+            payment_signature=query.get("payment_signature"),
+            amount_paid=query.get("amount_paid")
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def generate_stream():
+        usage: Dict[str, Any] = {}
+        try:
+            async for chunk in coalesce_chunks(
+                service.stream_answer(plan, usage, wallet_address),
+                max_delay_ms=settings.STREAM_COALESCE_MS,
+                max_chars=settings.STREAM_COALESCE_MAX_CHARS,
+            ):
+                yield sse_event({"content": chunk})
+            yield sse_event({"done": True, "usage": usage or None, "memory": plan.memory_stats or None})
+        except Exception as e:
+            yield sse_event({"error": str(e)})
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Cache": "HIT" if plan.cached_answer is not None else "MISS",
+        },
+    )
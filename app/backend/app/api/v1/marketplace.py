@@ -1,21 +1,64 @@
-from fastapi import APIRouter, Query
-from typing import Optional, List
-from app.models.schemas import Capsule, MarketplaceFilters
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from typing import Any, Awaitable, Callable, Dict, Optional, List
+from app.core.cache import CachedValue
+from app.core.config import settings
+from app.models.schemas import Capsule, MarketplaceFacets, MarketplaceFilters, SimilarCapsulesBatchRequest
+from app.services.marketplace_cache import marketplace_cache
 from app.services.marketplace_service import MarketplaceService
 
 router = APIRouter()
 
 
+def _not_modified(request: Request, entry: CachedValue) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= entry.last_modified
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def _cached_response(
+    request: Request,
+    key: tuple,
+    factory: Callable[[], Awaitable[Any]],
+    encode: Callable[[Any], Any] = jsonable_encoder,
+    ttl_seconds: Optional[float] = None,
+    headers: Optional[Callable[[Any], Dict[str, str]]] = None,
+) -> Response:
+    """Serve a marketplace read from `marketplace_cache`, answering 304 when the client copy is current"""
+    entry = await marketplace_cache.get_or_set(key, factory, encode, ttl_seconds)
+    max_age = int(marketplace_cache.ttl_seconds if ttl_seconds is None else ttl_seconds)
+    out_headers = {
+        "ETag": entry.etag,
+        "Last-Modified": format_datetime(entry.last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={max_age}",
+        **(headers(entry.value) if headers else {}),
+    }
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=out_headers)
+    return Response(content=entry.body, media_type="application/json", headers=out_headers)
+
+
 @router.get("/", response_model=List[Capsule])
 async def browse_marketplace(
+    request: Request,
     category: Optional[str] = Query(None),
     min_reputation: Optional[float] = Query(None),
     max_price: Optional[float] = Query(None),
     sort_by: Optional[str] = Query("popular"),
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
 ):
-    """Browse marketplace capsules with filters"""
+    """Browse marketplace capsules with filters; the next page's cursor is in X-Next-Cursor"""
     import logging
     logger = logging.getLogger(__name__)
     
@@ -29,33 +72,73 @@ async def browse_marketplace(
     )
     
     service = MarketplaceService()
-    result = await service.browse_capsules(filters, limit, offset)
-    logger.info(f"Marketplace browse returned {len(result)} capsules")
-    return result
+    key = ("browse", category, min_reputation, max_price, sort_by, limit, offset, cursor)
+    try:
+        return await _cached_response(
+            request,
+            key,
+            lambda: service.browse_capsules(filters, limit, offset, cursor),
+            encode=lambda page: jsonable_encoder(page[0]),
+            headers=lambda page: {"X-Next-Cursor": page[1]} if page[1] else {},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/trending", response_model=List[Capsule])
-async def get_trending(limit: int = Query(10, ge=1, le=50)):
+async def get_trending(request: Request, limit: int = Query(10, ge=1, le=50)):
     """Get trending capsules"""
     service = MarketplaceService()
-    return await service.get_trending_capsules(limit)
+    return await _cached_response(request, ("trending", limit), lambda: service.get_trending_capsules(limit))
 
 
 @router.get("/categories", response_model=List[str])
-async def get_categories():
+async def get_categories(request: Request):
     """Get all available categories"""
     service = MarketplaceService()
-    return await service.get_categories()
+    return await _cached_response(
+        request, ("categories",), service.get_categories,
+        ttl_seconds=settings.MARKETPLACE_FACET_CACHE_TTL_SECONDS,
+    )
+
+
+@router.get("/facets", response_model=MarketplaceFacets)
+async def get_facets(request: Request):
+    """Category and price-bucket counts for the filter sidebar"""
+    service = MarketplaceService()
+    return await _cached_response(
+        request, ("facets",), service.get_facets,
+        ttl_seconds=settings.MARKETPLACE_FACET_CACHE_TTL_SECONDS,
+    )
 
 
 @router.get("/search", response_model=List[Capsule])
 async def search_capsules(
     q: str = Query(..., min_length=1),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000)
 ):
-    """Search capsules by name or description"""
+    """Semantic + keyword search over capsule names and descriptions"""
+    service = MarketplaceService()
+    return await service.search_capsules(q, limit, offset)
+
+
+@router.post("/similar/batch", response_model=Dict[str, List[Capsule]])
+async def get_similar_capsules_batch(request: SimilarCapsulesBatchRequest):
+    """Similar staked capsules for each id (listing pages); unknown ids are omitted"""
+    service = MarketplaceService()
+    limit = min(request.limit, settings.MARKETPLACE_SIMILAR_PRECOMPUTE)
+    return await service.get_similar_capsules(request.capsule_ids, limit)
+
+
+@router.get("/{capsule_id}/similar", response_model=List[Capsule])
+async def get_similar_capsules(capsule_id: str, limit: int = Query(6, ge=1, le=20)):
+    """Staked capsules most similar to this one"""
     service = MarketplaceService()
-    return await service.search_capsules(q, limit)
+    result = await service.get_similar_capsules([capsule_id], min(limit, settings.MARKETPLACE_SIMILAR_PRECOMPUTE))
+    if capsule_id not in result:
+        raise HTTPException(status_code=404, detail="Capsule not found")
+    return result[capsule_id]
 
 
 @router.get("/debug")
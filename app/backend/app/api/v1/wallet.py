@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import Optional, List
-from app.models.schemas import WalletBalance, Earnings, StakingInfo, StakingCreate
+from app.models.schemas import WalletBalance, WalletBalancesRequest, Earnings, StakingInfo, StakingCreate
 from app.services.wallet_service import WalletService
+from app.services.usage_service import UsageService
 from app.core.auth_dependencies import get_wallet_address
 
 router = APIRouter()
@@ -18,6 +19,19 @@ async def get_balance(wallet_address: Optional[str] = Depends(get_wallet_address
     return balance
 
 
+@router.post("/balances", response_model=List[WalletBalance])
+async def get_balances(
+    request: WalletBalancesRequest,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Get balances for several wallets in one call (dashboards, leaderboards)"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+    
+    service = WalletService()
+    return await service.get_balances(request.wallet_addresses)
+
+
 @router.get("/earnings", response_model=Earnings)
 async def get_earnings(
     wallet_address: Optional[str] = Depends(get_wallet_address),
@@ -54,3 +68,18 @@ async def create_staking(
     service = WalletService()
     return await service.create_staking(staking, wallet_address)
 
+
+
+@router.get("/usage")
+async def get_usage(
+    days: int = Query(7, ge=1, le=90),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Daily LLM token usage and latency rollups for a wallet"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+    
+    return {
+        "wallet_address": wallet_address,
+        "days": UsageService().get_rollups("wallet", wallet_address, days),
+    }
@@ -0,0 +1,115 @@
+"""
+API endpoints for multi-agent workflows (DAGs of agent steps)
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from app.core.auth_dependencies import get_wallet_address
+from app.models.schemas import WorkflowRun, WorkflowRunCreate, WorkflowStatus
+from app.services.workflow_service import (
+    WorkflowService,
+    WorkflowValidationError,
+    cancel_run,
+    is_run_active,
+    start_run,
+)
+
+router = APIRouter()
+
+
+@router.post("/", response_model=WorkflowRun)
+async def create_workflow_run(
+    data: WorkflowRunCreate,
+    wait: bool = Query(False, description="Block until the run finishes instead of running in the background"),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """
+    Create a workflow run and start executing it.
+    Independent steps run concurrently; poll GET /{run_id} for progress unless `wait` is set.
+    """
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    service = WorkflowService()
+    try:
+        run = await service.create_run(data, wallet_address)
+    except WorkflowValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    task = start_run(run.id, wallet_address)
+    if wait:
+        await task
+    return await service.get_run(run.id, wallet_address)
+
+
+@router.get("/", response_model=List[WorkflowRun])
+async def list_workflow_runs(
+    limit: int = Query(50, ge=1, le=200),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """List workflow runs for the wallet, newest first"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    return await WorkflowService().list_runs(wallet_address, limit)
+
+
+@router.get("/{run_id}", response_model=WorkflowRun)
+async def get_workflow_run(
+    run_id: str,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Get a workflow run with per-step status and outputs"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    run = await WorkflowService().get_run(run_id, wallet_address)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    return run
+
+
+@router.post("/{run_id}/resume", response_model=WorkflowRun)
+async def resume_workflow_run(
+    run_id: str,
+    wait: bool = Query(False),
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """
+    Resume a failed, cancelled or interrupted run.
+    Completed steps keep their outputs; only the remaining steps execute.
+    """
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    service = WorkflowService()
+    run = await service.get_run(run_id, wallet_address)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    if is_run_active(run_id):
+        raise HTTPException(status_code=409, detail="Workflow run is already running")
+    if run.status == WorkflowStatus.COMPLETED:
+        return run
+
+    service.reset_unfinished(run)
+    task = start_run(run_id, wallet_address)
+    if wait:
+        await task
+    return await service.get_run(run_id, wallet_address)
+
+
+@router.post("/{run_id}/cancel", response_model=WorkflowRun)
+async def cancel_workflow_run(
+    run_id: str,
+    wallet_address: Optional[str] = Depends(get_wallet_address)
+):
+    """Cancel a running workflow; in-flight steps are reset so the run can be resumed"""
+    if not wallet_address:
+        raise HTTPException(status_code=401, detail="Wallet address required")
+
+    service = WorkflowService()
+    run = await service.get_run(run_id, wallet_address)
+    if not run:
+        raise HTTPException(status_code=404, detail="Workflow run not found")
+    if not await cancel_run(run_id):
+        raise HTTPException(status_code=409, detail="Workflow run is not running")
+    return await service.get_run(run_id, wallet_address)
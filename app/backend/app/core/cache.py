@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.core import fastjson
+
+
+@dataclass
+class CachedValue:
+    """A cached result plus the validators used for conditional GETs."""
+
+    value: Any
+    body: bytes  # JSON-encoded value
+    etag: str
+    last_modified: datetime
+    expires_at: float
+
+
+class TTLCache:
+    """
+    In-process async cache for read-heavy endpoints.
+
+    - Entries expire after `ttl_seconds` (overridable per call) and are evicted LRU
+      beyond `max_entries`.
+    - Singleflight: concurrent misses for the same key share one computation.
+    - `invalidate()` drops everything and makes in-flight computations discard
+      their result, so a write is never followed by a stale fill.
+    - Values are stored JSON-encoded (`encode` must return something fastjson can dump)
+      with a content ETag and Last-Modified for 304 revalidation.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedValue]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self._generation += 1
+
+    def get(self, key: Hashable) -> Optional[CachedValue]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _build(self, value: Any, encode: Callable[[Any], Any], ttl_seconds: Optional[float]) -> CachedValue:
+        body = fastjson.dumps(encode(value))
+        return CachedValue(
+            value=value,
+            body=body,
+            etag='"' + hashlib.sha1(body).hexdigest() + '"',
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            expires_at=time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds),
+        )
+
+    def _store(self, key: Hashable, entry: CachedValue) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        encode: Callable[[Any], Any] = lambda value: value,
+        ttl_seconds: Optional[float] = None,
+    ) -> CachedValue:
+        """Store a value computed outside `get_or_set` (e.g. the result of a finished stream)."""
+        entry = self._build(value, encode, ttl_seconds)
+        self._store(key, entry)
+        return entry
+
+    async def get_or_set(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = lambda value: value,
+        ttl_seconds: Optional[float] = None,
+    ) -> CachedValue:
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # this waiter itself was cancelled
+                # The computing request went away; compute it here instead
+                return await self.get_or_set(key, factory, encode, ttl_seconds)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            entry = self._build(await factory(), encode, ttl_seconds)
+            if generation == self._generation:
+                self._store(key, entry)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved so an unawaited future doesn't warn
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            if not future.done():
+                # The computing request was cancelled; its waiters retry themselves
+                future.cancel()
@@ -105,13 +105,123 @@ class Settings(BaseSettings):
     
     # LLM API Keys
     OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY", "")
-    
+
+    # Streaming (SSE): coalesce tiny deltas into fewer frames. 0 disables each limit.
+    STREAM_COALESCE_MS: int = int(os.getenv("STREAM_COALESCE_MS", "0"))
+    STREAM_COALESCE_MAX_CHARS: int = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "0"))
+
+    # Semantic response cache (opt-in per agent)
+    RESPONSE_CACHE_SIMILARITY: float = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+    RESPONSE_CACHE_DEFAULT_TTL_SECONDS: int = int(os.getenv("RESPONSE_CACHE_DEFAULT_TTL_SECONDS", "3600"))
+
+    # Admission control for LLM calls (per-wallet / per-provider concurrency + bounded priority queue)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+    ADMISSION_WALLET_CONCURRENCY: int = int(os.getenv("ADMISSION_WALLET_CONCURRENCY", "8"))
+    ADMISSION_PROVIDER_CONCURRENCY: int = int(os.getenv("ADMISSION_PROVIDER_CONCURRENCY", "64"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+    ADMISSION_WALLET_MAX_QUEUE: int = int(os.getenv("ADMISSION_WALLET_MAX_QUEUE", "16"))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+
+    # Batch completions (SDK/offline workloads)
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+    # Multi-agent fan-out (one prompt, several agents concurrently)
+    FANOUT_MAX_TARGETS: int = int(os.getenv("FANOUT_MAX_TARGETS", "8"))
+
+    # Multi-agent workflows (DAG of agent steps)
+    WORKFLOW_MAX_STEPS: int = int(os.getenv("WORKFLOW_MAX_STEPS", "32"))
+    WORKFLOW_MAX_CONCURRENCY: int = int(os.getenv("WORKFLOW_MAX_CONCURRENCY", "4"))
+    WORKFLOW_STEP_TIMEOUT_SECONDS: float = float(os.getenv("WORKFLOW_STEP_TIMEOUT_SECONDS", "120"))
+    WORKFLOW_STEP_CACHE_TTL_SECONDS: int = int(os.getenv("WORKFLOW_STEP_CACHE_TTL_SECONDS", "86400"))
+
+    # Shared blackboard memory (dedup threshold and entries injected per workflow step).
+    # Entry seq comes from a per-process counter, so since_seq polling assumes one worker.
+    BLACKBOARD_DEDUP_SIMILARITY: float = float(os.getenv("BLACKBOARD_DEDUP_SIMILARITY", "0.92"))
+    BLACKBOARD_CONTEXT_ENTRIES: int = int(os.getenv("BLACKBOARD_CONTEXT_ENTRIES", "5"))
+
+    # Memory context: native semantic recall over chat messages, fused with mem0 (RRF)
+    SEMANTIC_RECALL_ENABLED: bool = os.getenv("SEMANTIC_RECALL_ENABLED", "True").lower() == "true"
+    # agent: recall from the agent's other chats; chat: off (the chat itself is already prompt history)
+    SEMANTIC_RECALL_SCOPE: str = os.getenv("SEMANTIC_RECALL_SCOPE", "agent")  # agent | chat
+    SEMANTIC_RECALL_K: int = int(os.getenv("SEMANTIC_RECALL_K", "8"))
+    MEMORY_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("MEMORY_CONTEXT_TOKEN_BUDGET", "600"))  # Medium; Small x0.5, Large x2
+
+    # Memory retrieval over mem0_memories: over-fetch, score threshold, recency decay, MMR
+    MEMORY_RETRIEVAL_OVERFETCH: int = int(os.getenv("MEMORY_RETRIEVAL_OVERFETCH", "40"))
+    MEMORY_MIN_SCORE: float = float(os.getenv("MEMORY_MIN_SCORE", "0.3"))
+    MEMORY_RECENCY_HALF_LIFE_DAYS: float = float(os.getenv("MEMORY_RECENCY_HALF_LIFE_DAYS", "30"))
+    MEMORY_RECENCY_WEIGHT: float = float(os.getenv("MEMORY_RECENCY_WEIGHT", "0.3"))  # 0 = similarity only
+    MEMORY_MMR_LAMBDA: float = float(os.getenv("MEMORY_MMR_LAMBDA", "0.7"))  # 1 = relevance only
+
+    # Per-chat in-process cache of retrieved memories; reused while queries stay on topic
+    MEMORY_HOT_CACHE_MAX_CHATS: int = int(os.getenv("MEMORY_HOT_CACHE_MAX_CHATS", "512"))  # 0 = disabled
+    MEMORY_HOT_CACHE_TTL_SECONDS: float = float(os.getenv("MEMORY_HOT_CACHE_TTL_SECONDS", "120"))
+    MEMORY_HOT_CACHE_QUERY_SIMILARITY: float = float(os.getenv("MEMORY_HOT_CACHE_QUERY_SIMILARITY", "0.75"))
+    # Recently embedded texts (the same user message is embedded for memory, recall and cache lookups)
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))  # 0 = disabled
+
+    # Memory extraction engine: "mem0" (LLM extraction every turn) or "lite" (local heuristics,
+    # batched mem0 extraction every N turns). Chats can override via memory_engine.
+    MEMORY_ENGINE: str = os.getenv("MEMORY_ENGINE", "mem0")
+    LITE_MEMORY_MAX_PER_TURN: int = int(os.getenv("LITE_MEMORY_MAX_PER_TURN", "3"))
+    LITE_MEMORY_DEDUP_SIMILARITY: float = float(os.getenv("LITE_MEMORY_DEDUP_SIMILARITY", "0.9"))
+    LITE_MEMORY_LLM_EVERY_N_TURNS: int = int(os.getenv("LITE_MEMORY_LLM_EVERY_N_TURNS", "10"))  # 0 = never
+
+    # Usage rollups are buffered per process and flushed on this interval
+    USAGE_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "5"))
+
+    # Background consolidation of near-duplicate memories (incremental, rate-limited)
+    MEMORY_CONSOLIDATION_ENABLED: bool = os.getenv("MEMORY_CONSOLIDATION_ENABLED", "True").lower() == "true"
+    MEMORY_CONSOLIDATION_INTERVAL_SECONDS: float = float(os.getenv("MEMORY_CONSOLIDATION_INTERVAL_SECONDS", "3600"))
+    MEMORY_CONSOLIDATION_SIMILARITY: float = float(os.getenv("MEMORY_CONSOLIDATION_SIMILARITY", "0.95"))
+    MEMORY_CONSOLIDATION_BATCH_SIZE: int = int(os.getenv("MEMORY_CONSOLIDATION_BATCH_SIZE", "256"))
+    MEMORY_CONSOLIDATION_POINTS_PER_SECOND: float = float(os.getenv("MEMORY_CONSOLIDATION_POINTS_PER_SECOND", "1000"))  # 0 = unthrottled
+
     # Mem0 (open-source). We do NOT use the hosted platform (Qdrant is the only persistence layer).
     MEM0_ENABLED: bool = os.getenv("MEM0_ENABLED", "True").lower() == "true"
     
+    # Marketplace search: vector similarity plus a boost for full-text name/description matches
+    MARKETPLACE_SEARCH_NAME_BOOST: float = float(os.getenv("MARKETPLACE_SEARCH_NAME_BOOST", "0.3"))
+    MARKETPLACE_SEARCH_DESCRIPTION_BOOST: float = float(os.getenv("MARKETPLACE_SEARCH_DESCRIPTION_BOOST", "0.15"))
+    
+    # Marketplace read cache (in-process, invalidated by capsule/staking writes; ETag/304)
+    MARKETPLACE_CACHE_TTL_SECONDS: float = float(os.getenv("MARKETPLACE_CACHE_TTL_SECONDS", "30"))
+    MARKETPLACE_CACHE_MAX_ENTRIES: int = int(os.getenv("MARKETPLACE_CACHE_MAX_ENTRIES", "1024"))
+
+    # Marketplace facets (category counts + price buckets); cached longer than other reads
+    MARKETPLACE_FACET_CACHE_TTL_SECONDS: float = float(os.getenv("MARKETPLACE_FACET_CACHE_TTL_SECONDS", "300"))
+    MARKETPLACE_PRICE_BUCKETS: str = os.getenv("MARKETPLACE_PRICE_BUCKETS", "0.01,0.05,0.1,0.5,1")  # boundaries, SOL
+
+    # Similar capsules: precomputed neighbour lists, refreshed when vectors change or lists expire
+    MARKETPLACE_SIMILAR_PRECOMPUTE: int = int(os.getenv("MARKETPLACE_SIMILAR_PRECOMPUTE", "20"))
+    MARKETPLACE_SIMILAR_TTL_SECONDS: float = float(os.getenv("MARKETPLACE_SIMILAR_TTL_SECONDS", "86400"))
+
+    # Trending leaderboard: exponentially decayed query/stake activity
+    TRENDING_HALF_LIFE_HOURS: float = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "48"))
+    TRENDING_QUERY_WEIGHT: float = float(os.getenv("TRENDING_QUERY_WEIGHT", "1.0"))
+    TRENDING_STAKE_WEIGHT: float = float(os.getenv("TRENDING_STAKE_WEIGHT", "5.0"))  # per staked SOL
+    
+    # Paid capsule queries: memory budget and per-capsule answer cache
+    CAPSULE_QUERY_MEMORY_SIZE: str = os.getenv("CAPSULE_QUERY_MEMORY_SIZE", "Large")  # Small | Medium | Large
+    CAPSULE_ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("CAPSULE_ANSWER_CACHE_TTL_SECONDS", "3600"))
+    CAPSULE_ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("CAPSULE_ANSWER_CACHE_MAX_ENTRIES", "2048"))
+    
     # Solana
     SOLANA_RPC_URL: str = os.getenv("SOLANA_RPC_URL", "https://api.devnet.solana.com")
     SOLANA_NETWORK: str = os.getenv("SOLANA_NETWORK", "devnet")
+    # Shared RPC client: calls within the window are sent as one JSON-RPC batch
+    SOLANA_RPC_BATCH_WINDOW_MS: float = float(os.getenv("SOLANA_RPC_BATCH_WINDOW_MS", "5"))
+    SOLANA_RPC_MAX_BATCH: int = int(os.getenv("SOLANA_RPC_MAX_BATCH", "50"))
+    SOLANA_RPC_TIMEOUT_SECONDS: float = float(os.getenv("SOLANA_RPC_TIMEOUT_SECONDS", "10"))
+    # Per-endpoint request budget (calls per second, batch entries count individually); 0 disables
+    SOLANA_RPC_RATE_LIMIT_RPS: float = float(os.getenv("SOLANA_RPC_RATE_LIMIT_RPS", "10"))
+    SOLANA_RPC_RATE_LIMIT_BURST: float = float(os.getenv("SOLANA_RPC_RATE_LIMIT_BURST", "20"))
+    SOLANA_BALANCE_CACHE_TTL_SECONDS: float = float(os.getenv("SOLANA_BALANCE_CACHE_TTL_SECONDS", "15"))
+    # Payment signature verdicts kept in memory (all of them are persisted in Qdrant)
+    # Claims (one query per signature) are read from Qdrant, but without compare-and-set
+    # replay protection is only exact with a single API worker
+    PAYMENT_VERDICT_CACHE_SIZE: int = int(os.getenv("PAYMENT_VERDICT_CACHE_SIZE", "10000"))
     
     # JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
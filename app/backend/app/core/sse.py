@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core import fastjson
+
+
+def sse_event(payload: Dict[str, Any]) -> bytes:
+    """Encode a payload as a single Server-Sent Events data frame."""
+    return b"data: " + fastjson.dumps(payload) + b"\n\n"
+
+
+def ndjson_line(payload: Dict[str, Any]) -> bytes:
+    """Encode a payload as one newline-delimited JSON record."""
+    return fastjson.dumps(payload) + b"\n"
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[str],
+    max_delay_ms: int = 0,
+    max_chars: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Merge tiny stream deltas into fewer, larger chunks.
+
+    - The first chunk is always forwarded immediately (time-to-first-token is unaffected).
+    - Afterwards chunks are buffered until `max_delay_ms` has elapsed since the first
+      buffered chunk or `max_chars` have accumulated, whichever comes first.
+    - With both limits <= 0 this is a plain passthrough.
+
+    The source iterator is drained by a dedicated task so the flush timer can fire
+    while the provider is still producing the next delta.
+    """
+    if max_delay_ms <= 0 and max_chars <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _pump() -> None:
+        try:
+            async for chunk in chunks:
+                await queue.put(("chunk", chunk))
+        except Exception as e:
+            await queue.put(("error", e))
+        finally:
+            await queue.put(("end", None))
+
+    loop = asyncio.get_running_loop()
+    delay = max_delay_ms / 1000.0 if max_delay_ms > 0 else None
+    producer = asyncio.create_task(_pump())
+
+    buf: List[str] = []
+    size = 0
+    deadline = None
+    first = True
+    try:
+        while True:
+            timeout = None
+            if buf and deadline is not None:
+                timeout = max(0.0, deadline - loop.time())
+            try:
+                kind, item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+                deadline = None
+                continue
+
+            if kind == "end":
+                break
+            if kind == "error":
+                if buf:
+                    yield "".join(buf)
+                    buf.clear()
+                raise item
+
+            if first:
+                first = False
+                yield item
+                continue
+
+            buf.append(item)
+            size += len(item)
+            if deadline is None and delay is not None:
+                deadline = loop.time() + delay
+            if max_chars > 0 and size >= max_chars:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+                deadline = None
+
+        if buf:
+            yield "".join(buf)
+    finally:
+        if not producer.done():
+            producer.cancel()
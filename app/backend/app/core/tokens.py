@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+try:
+    import tiktoken  # type: ignore
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # pragma: no cover - optional dependency
+    _encoding = None
+
+# Per-message framing overhead used by OpenAI-style chat formats.
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count for budgeting/accounting when the provider does not report usage.
+    Uses tiktoken (cl100k_base) when installed, otherwise ~4 characters per token.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(str(b.get("text") or "") for b in content if isinstance(b, dict))
+    return str(content or "")
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(_MESSAGE_OVERHEAD_TOKENS + count_tokens(_content_text(m.get("content"))) for m in messages)
@@ -15,6 +15,11 @@ class MemorySize(str, Enum):
     LARGE = "Large"
 
 
+class MemoryEngine(str, Enum):
+    MEM0 = "mem0"  # mem0 LLM extraction on every turn
+    LITE = "lite"  # Local salient-sentence extraction; periodic batched mem0 extraction
+
+
 # Message Models
 class Message(BaseModel):
     id: Optional[str] = None
@@ -41,6 +46,7 @@ class Chat(BaseModel):
     capsule_id: Optional[str] = None  # Capsule scope for memory isolation
     user_wallet: Optional[str] = None
     web_search_enabled: bool = False  # Enable web search via Tavily
+    memory_engine: Optional[MemoryEngine] = None  # Falls back to MEMORY_ENGINE
 
 
 class ChatCreate(BaseModel):
@@ -49,12 +55,14 @@ class ChatCreate(BaseModel):
     capsule_id: Optional[str] = None  # Optional capsule scope
     memory_size: MemorySize = MemorySize.SMALL
     web_search_enabled: bool = False
+    memory_engine: Optional[MemoryEngine] = None
 
 
 class ChatUpdate(BaseModel):
     name: Optional[str] = None
     memory_size: Optional[MemorySize] = None
     web_search_enabled: Optional[bool] = None
+    memory_engine: Optional[MemoryEngine] = None
 
 
 # Agent Models
@@ -67,6 +75,8 @@ class Agent(BaseModel):
     model: Optional[str] = None
     user_wallet: Optional[str] = None
     api_key: Optional[str] = None  # Only included when needed, not in responses
+    response_cache_enabled: bool = False  # Opt-in semantic response cache
+    response_cache_ttl_seconds: Optional[int] = None  # Falls back to RESPONSE_CACHE_DEFAULT_TTL_SECONDS
 
 
 class AgentCreate(BaseModel):
@@ -75,11 +85,15 @@ class AgentCreate(BaseModel):
     platform: str
     api_key: str
     model: Optional[str] = None
+    response_cache_enabled: bool = False
+    response_cache_ttl_seconds: Optional[int] = Field(None, ge=1)
 
 
 class AgentUpdate(BaseModel):
     display_name: Optional[str] = None
     model: Optional[str] = None
+    response_cache_enabled: Optional[bool] = None
+    response_cache_ttl_seconds: Optional[int] = Field(None, ge=1)
 
 
 # Capsule Models
@@ -122,6 +136,27 @@ class MarketplaceFilters(BaseModel):
     sort_by: Optional[str] = "popular"  # popular, newest, price_low, price_high, rating
 
 
+class SimilarCapsulesBatchRequest(BaseModel):
+    capsule_ids: List[str] = Field(..., min_length=1, max_length=50)
+    limit: int = Field(6, ge=1, le=20)
+
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: Optional[float] = None  # None = open-ended
+    count: int
+
+
+class MarketplaceFacets(BaseModel):
+    categories: List[FacetCount]
+    price_buckets: List[PriceBucket]
+
+
 # Wallet Models
 class WalletBalance(BaseModel):
     wallet_address: str
@@ -129,6 +164,10 @@ class WalletBalance(BaseModel):
     currency: str = "SOL"
 
 
+class WalletBalancesRequest(BaseModel):
+    wallet_addresses: List[str] = Field(..., min_length=1, max_length=100)
+
+
 class Earnings(BaseModel):
     wallet_address: str
     total_earnings: float
@@ -157,6 +196,104 @@ class LLMResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+# Batch Models
+class BatchMessageItem(BaseModel):
+    agent_id: str
+    chat_id: str
+    content: str
+    id: Optional[str] = None  # Client correlation id, echoed back in the result
+
+
+class BatchMessageRequest(BaseModel):
+    items: List[BatchMessageItem] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+
+class FanOutTarget(BaseModel):
+    agent_id: str
+    chat_id: str
+
+
+class FanOutAggregator(BaseModel):
+    agent_id: str
+    chat_id: Optional[str] = None  # If set, the merged answer is saved to this chat
+    instructions: Optional[str] = None
+
+
+class FanOutRequest(BaseModel):
+    content: str
+    targets: List[FanOutTarget] = Field(..., min_length=1)
+    aggregator: Optional[FanOutAggregator] = None
+
+
+# Workflow Models
+class WorkflowStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class WorkflowStepStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    SKIPPED = "skipped"  # An upstream step failed
+
+
+class WorkflowStep(BaseModel):
+    id: str = Field(..., min_length=1, max_length=64)
+    agent_id: str
+    # Template; "{{input}}" is the run input and "{{<step id>}}" a dependency's output
+    prompt: str
+    depends_on: List[str] = []
+    system_prompt: Optional[str] = None
+    timeout_seconds: Optional[float] = Field(None, gt=0)
+
+
+class WorkflowStepState(BaseModel):
+    status: WorkflowStepStatus = WorkflowStepStatus.PENDING
+    output: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    input_hash: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class WorkflowRunCreate(BaseModel):
+    name: Optional[str] = None
+    input: str
+    steps: List[WorkflowStep] = Field(..., min_length=1)
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    blackboard: bool = False  # Steps share findings through a blackboard
+    blackboard_id: Optional[str] = None  # Defaults to the run id; reuse to share across runs
+
+
+class WorkflowRun(BaseModel):
+    id: str
+    name: Optional[str] = None
+    status: WorkflowStatus
+    input: str
+    steps: List[WorkflowStep]
+    step_states: Dict[str, WorkflowStepState]
+    max_concurrency: Optional[int] = None
+    blackboard_id: Optional[str] = None
+    user_wallet: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    error: Optional[str] = None
+
+
+# Blackboard Models
+class BlackboardEntryCreate(BaseModel):
+    content: str = Field(..., min_length=1)
+    author_agent_id: Optional[str] = None
+
+
 # API Response Models
 class APIResponse(BaseModel):
     success: bool
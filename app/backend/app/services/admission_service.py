@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+import heapq
+import itertools
+import math
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+
+    INTERACTIVE = 0  # streaming chat UI
+    STANDARD = 1  # request/response (SDK send_message)
+    BATCH = 2  # batch / offline workloads
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; map to HTTP 429 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionTicket:
+    wallet: str
+    provider: str
+    priority: Priority
+    granted_at: float = field(default_factory=time.monotonic)
+    released: bool = False
+
+
+@dataclass
+class _Waiter:
+    wallet: str
+    provider: str
+    priority: Priority
+    future: asyncio.Future
+    cancelled: bool = False
+
+
+class AdmissionController:
+    """
+    In-process admission control in front of LLM calls.
+
+    - Per-wallet and per-provider concurrency limits.
+    - A bounded wait queue ordered by (priority, arrival); on every release the
+      highest-priority waiter whose wallet *and* provider have capacity is admitted,
+      so one wallet at its limit never blocks other wallets queued behind it.
+    - Fast rejection (AdmissionRejected) when the global or per-wallet queue is full,
+      or when a waiter exceeds the queue timeout.
+
+    All state is touched from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        wallet_limit: int,
+        provider_limit: int,
+        max_queue: int,
+        wallet_max_queue: int,
+        queue_timeout: float,
+    ) -> None:
+        self.wallet_limit = wallet_limit
+        self.provider_limit = provider_limit
+        self.max_queue = max_queue
+        self.wallet_max_queue = wallet_max_queue
+        self.queue_timeout = queue_timeout
+
+        self._wallet_active: Dict[str, int] = defaultdict(int)
+        self._provider_active: Dict[str, int] = defaultdict(int)
+        self._wallet_queued: Dict[str, int] = defaultdict(int)
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        # EWMA of how long a slot is held; drives the Retry-After estimate.
+        self._avg_hold_seconds = 5.0
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "active_by_provider": {k: v for k, v in self._provider_active.items() if v},
+            "active_wallets": sum(1 for v in self._wallet_active.values() if v),
+            "queued": sum(1 for _, _, w in self._waiters if not w.cancelled),
+            "avg_hold_seconds": round(self._avg_hold_seconds, 2),
+        }
+
+    def retry_after(self, provider: Optional[str] = None) -> int:
+        queued = sum(1 for _, _, w in self._waiters if not w.cancelled and (provider is None or w.provider == provider))
+        estimate = self._avg_hold_seconds * (queued + 1) / max(1, self.provider_limit)
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    # ------------------------------------------------------------------
+    # Acquire / release
+    # ------------------------------------------------------------------
+
+    def _has_capacity(self, wallet: str, provider: str) -> bool:
+        return (
+            self._wallet_active[wallet] < self.wallet_limit
+            and self._provider_active[provider] < self.provider_limit
+        )
+
+    def _grant(self, wallet: str, provider: str, priority: Priority) -> AdmissionTicket:
+        self._wallet_active[wallet] += 1
+        self._provider_active[provider] += 1
+        return AdmissionTicket(wallet=wallet, provider=provider, priority=priority)
+
+    async def acquire(
+        self,
+        wallet: Optional[str],
+        provider: str,
+        priority: Priority = Priority.STANDARD,
+    ) -> AdmissionTicket:
+        wallet = wallet or "anonymous"
+
+        # Waiters are dispatched on every release, so spare capacity here means
+        # nobody eligible is queued ahead of this request.
+        if self._has_capacity(wallet, provider):
+            return self._grant(wallet, provider, priority)
+
+        live_waiters = sum(1 for _, _, w in self._waiters if not w.cancelled)
+        if live_waiters >= self.max_queue:
+            raise AdmissionRejected("Server is at capacity, please retry", self.retry_after(provider))
+        if self._wallet_queued[wallet] >= self.wallet_max_queue:
+            raise AdmissionRejected("Too many concurrent requests for this wallet", self.retry_after(provider))
+
+        waiter = _Waiter(
+            wallet=wallet,
+            provider=provider,
+            priority=priority,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), waiter))
+        self._wallet_queued[wallet] += 1
+
+        try:
+            return await asyncio.wait_for(waiter.future, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted in the same tick we gave up: hand the slot back.
+                self.release(waiter.future.result())
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                self._wallet_queued[wallet] -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected("Timed out waiting for capacity", self.retry_after(provider)) from e
+            raise
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """Return a slot. Idempotent, so it is safe to call from several cleanup paths."""
+        if ticket.released:
+            return
+        ticket.released = True
+        self._wallet_active[ticket.wallet] = max(0, self._wallet_active[ticket.wallet] - 1)
+        self._provider_active[ticket.provider] = max(0, self._provider_active[ticket.provider] - 1)
+
+        held = time.monotonic() - ticket.granted_at
+        self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        remaining: List[Tuple[int, int, _Waiter]] = []
+        for item in sorted(self._waiters):
+            waiter = item[2]
+            if waiter.cancelled or waiter.future.done():
+                continue
+            if self._has_capacity(waiter.wallet, waiter.provider):
+                self._wallet_queued[waiter.wallet] -= 1
+                waiter.future.set_result(self._grant(waiter.wallet, waiter.provider, waiter.priority))
+            else:
+                remaining.append(item)
+        # A sorted list is a valid heap.
+        self._waiters = remaining
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        wallet: Optional[str],
+        provider: str,
+        priority: Priority = Priority.STANDARD,
+    ) -> AsyncIterator[AdmissionTicket]:
+        ticket = await self.acquire(wallet, provider, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+
+# -------------------------------------------------------------------------
+# Process-wide singleton
+# -------------------------------------------------------------------------
+
+_admission_singleton: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _admission_singleton
+    if _admission_singleton is None:
+        _admission_singleton = AdmissionController(
+            wallet_limit=settings.ADMISSION_WALLET_CONCURRENCY,
+            provider_limit=settings.ADMISSION_PROVIDER_CONCURRENCY,
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            wallet_max_queue=settings.ADMISSION_WALLET_MAX_QUEUE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        )
+    return _admission_singleton
@@ -20,6 +20,7 @@ from app.models.schemas import (
 from app.services.chat_service import ChatService
 from app.services.message_service import MessageService
 from app.services.qdrant_service import get_qdrant_service, make_base_payload
+from app.services.response_cache_service import ResponseCacheService
 
 
 def _utc_now() -> datetime:
@@ -72,6 +73,8 @@ class AgentService:
                     model=payload.get("model"),
                     user_wallet=payload.get("wallet") or payload.get("user_wallet"),
                     api_key=None,  # never expose
+                    response_cache_enabled=bool(payload.get("response_cache_enabled") or False),
+                    response_cache_ttl_seconds=payload.get("response_cache_ttl_seconds"),
                 )
             )
         return agents
@@ -98,6 +101,8 @@ class AgentService:
             model=payload.get("model"),
             user_wallet=payload.get("wallet") or payload.get("user_wallet"),
             api_key=api_key,
+            response_cache_enabled=bool(payload.get("response_cache_enabled") or False),
+            response_cache_ttl_seconds=payload.get("response_cache_ttl_seconds"),
         )
 
     async def create_agent(self, agent_data: AgentCreate, wallet_address: str) -> Agent:
@@ -125,6 +130,8 @@ class AgentService:
             "user_wallet": wallet_address,
             "updated_at": _iso(now),
             "api_key_configured": True,
+            "response_cache_enabled": agent_data.response_cache_enabled,
+            "response_cache_ttl_seconds": agent_data.response_cache_ttl_seconds,
         }
 
         self.qdrant.upsert_record(self.COLLECTION, agent_id, payload)
@@ -139,6 +146,8 @@ class AgentService:
             model=agent_data.model,
             user_wallet=wallet_address,
             api_key=None,
+            response_cache_enabled=agent_data.response_cache_enabled,
+            response_cache_ttl_seconds=agent_data.response_cache_ttl_seconds,
         )
 
     async def update_agent(self, agent_id: str, agent_update: AgentUpdate, wallet_address: str) -> Agent:
@@ -152,12 +161,24 @@ class AgentService:
         if agent_update.display_name is not None:
             payload["display_name"] = agent_update.display_name
             payload["description"] = agent_update.display_name
+        config_changed = False
         if agent_update.model is not None:
+            config_changed = config_changed or payload.get("model") != agent_update.model
             payload["model"] = agent_update.model
+        if agent_update.response_cache_enabled is not None:
+            config_changed = config_changed or bool(payload.get("response_cache_enabled")) != agent_update.response_cache_enabled
+            payload["response_cache_enabled"] = agent_update.response_cache_enabled
+        if agent_update.response_cache_ttl_seconds is not None:
+            config_changed = config_changed or payload.get("response_cache_ttl_seconds") != agent_update.response_cache_ttl_seconds
+            payload["response_cache_ttl_seconds"] = agent_update.response_cache_ttl_seconds
 
         payload["updated_at"] = _iso(_utc_now())
         self.qdrant.upsert_record(self.COLLECTION, agent_id, payload)
 
+        # Cached answers were produced under the old config; drop them.
+        if config_changed:
+            ResponseCacheService.invalidate_agent(agent_id)
+
         return Agent(
             id=agent_id,
             name=str(payload.get("name") or ""),
@@ -167,6 +188,8 @@ class AgentService:
             model=payload.get("model"),
             user_wallet=payload.get("wallet"),
             api_key=None,
+            response_cache_enabled=bool(payload.get("response_cache_enabled") or False),
+            response_cache_ttl_seconds=payload.get("response_cache_ttl_seconds"),
         )
 
     async def delete_agent(self, agent_id: str, wallet_address: str) -> bool:
@@ -179,8 +202,17 @@ class AgentService:
         for chat in chats:
             await self.delete_chat(chat.id, wallet_address)
 
+        # Sweep any memory vectors left behind by chats that no longer exist
+        try:
+            from app.services.memory_service import MemoryService
+            MemoryService().delete_agent_memories(agent_id)
+        except Exception:
+            # Memory is optional; agent deletion should still proceed
+            pass
+
         # Delete the agent record
         self.qdrant.delete_by_id(self.COLLECTION, agent_id)
+        ResponseCacheService.invalidate_agent(agent_id)
         return True
 
     # ------------------------------------------------------------------
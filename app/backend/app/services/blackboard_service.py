@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.services.embedding_service import EmbeddingService
+from app.services.qdrant_service import QdrantService, get_qdrant_service, make_base_payload
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+
+_seq_lock = threading.Lock()
+_last_seq = 0
+
+
+def _next_seq() -> int:
+    """
+    Strictly increasing write sequence (microsecond clock, bumped on ties).
+
+    The counter is per process: ordering across several API workers is only as
+    good as their clocks, so a poller may miss a write that lands with a lower
+    seq than one it already saw. Blackboard polling assumes a single worker.
+    """
+    global _last_seq
+    with _seq_lock:
+        _last_seq = max(_last_seq + 1, time.time_ns() // 1000)
+        return _last_seq
+
+
+@dataclass
+class BlackboardWrite:
+    """Outcome of a write: the entry id and whether it merged into an existing entry."""
+
+    entry: Dict[str, Any]
+    duplicate: bool
+
+
+class BlackboardService:
+    """
+    Shared memory scope ("blackboard") that several agents read from and write to.
+
+    - Entries live in the `blackboard` collection, keyed by wallet + board_id
+      (a workflow run id or any client-chosen name).
+    - Every write gets a monotonic `seq`, so readers index incrementally by asking
+      only for entries newer than the last seq they saw. A merged duplicate gets a
+      fresh seq too, so pollers pick up new contributors / confirmations.
+      Sequences come from a per-process counter (see `_next_seq`): incremental
+      polling is exact on a single worker only.
+    - Writes are deduplicated: an exact (normalized) match is found by hash without
+      an embedding call, a near match by vector similarity
+      (BLACKBOARD_DEDUP_SIMILARITY). Duplicates are merged into the existing entry
+      (contributors / confirmations) instead of being stored again.
+    """
+
+    COLLECTION = "blackboard"
+
+    def __init__(self) -> None:
+        self.qdrant = get_qdrant_service()
+        self.embedder = EmbeddingService()
+
+    @staticmethod
+    def _board_conditions(wallet: str, board_id: str) -> List[qm.FieldCondition]:
+        return [
+            qm.FieldCondition(key="wallet", match=qm.MatchValue(value=wallet)),
+            qm.FieldCondition(key="board_id", match=qm.MatchValue(value=board_id)),
+        ]
+
+    @staticmethod
+    def _entry(payload: Dict[str, Any], score: Optional[float] = None) -> Dict[str, Any]:
+        entry = {
+            "id": payload.get("id"),
+            "board_id": payload.get("board_id"),
+            "seq": payload.get("seq"),
+            "content": payload.get("content"),
+            "author_agent_id": payload.get("author_agent_id"),
+            "contributors": payload.get("contributors") or [],
+            "confirmations": int(payload.get("confirmations") or 1),
+            "source": payload.get("source"),
+            "created_at": payload.get("created_at"),
+            "updated_at": payload.get("updated_at"),
+        }
+        if score is not None:
+            entry["score"] = score
+        return entry
+
+    def _merge_duplicate(self, record_id: Any, payload: Dict[str, Any], author_agent_id: Optional[str]) -> Dict[str, Any]:
+        contributors = list(payload.get("contributors") or [])
+        if author_agent_id and author_agent_id not in contributors:
+            contributors.append(author_agent_id)
+        update = {
+            "contributors": contributors,
+            "confirmations": int(payload.get("confirmations") or 1) + 1,
+            "seq": _next_seq(),
+            "updated_at": _utc_now_iso(),
+        }
+        self.qdrant.set_payload(self.COLLECTION, record_id, update)
+        return self._entry({**payload, **update})
+
+    # ------------------------------------------------------------------
+    # Write
+    # ------------------------------------------------------------------
+
+    async def write(
+        self,
+        wallet: str,
+        board_id: str,
+        content: str,
+        author_agent_id: Optional[str] = None,
+        source: Optional[Dict[str, Any]] = None,
+    ) -> BlackboardWrite:
+        content = (content or "").strip()
+        if not content:
+            raise ValueError("Blackboard entry content is empty")
+
+        content_hash = hashlib.sha256(_normalize(content).encode("utf-8")).hexdigest()
+        conditions = self._board_conditions(wallet, board_id)
+
+        # Exact duplicate: no embedding needed
+        exact, _ = self.qdrant.query_by_filter(
+            self.COLLECTION,
+            qfilter=qm.Filter(must=conditions + [qm.FieldCondition(key="hash", match=qm.MatchValue(value=content_hash))]),
+            limit=1,
+        )
+        if exact and exact[0].payload:
+            return BlackboardWrite(self._merge_duplicate(exact[0].id, exact[0].payload, author_agent_id), True)
+
+        vec = await self.embedder.embed_text(content, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        near = self.qdrant.search(
+            self.COLLECTION,
+            vector_name=QdrantService.BLACKBOARD_VECTOR_NAME,
+            query_vector=vec,
+            qfilter=qm.Filter(must=conditions),
+            limit=1,
+            score_threshold=settings.BLACKBOARD_DEDUP_SIMILARITY,
+        )
+        if near and near[0].payload:
+            return BlackboardWrite(self._merge_duplicate(near[0].id, near[0].payload, author_agent_id), True)
+
+        entry_id = str(uuid.uuid4())
+        payload = {
+            **make_base_payload("blackboard_entry"),
+            "id": entry_id,
+            "wallet": wallet,
+            "board_id": board_id,
+            "seq": _next_seq(),
+            "content": content,
+            "hash": content_hash,
+            "author_agent_id": author_agent_id,
+            "contributors": [author_agent_id] if author_agent_id else [],
+            "confirmations": 1,
+            "source": source,
+        }
+        self.qdrant.upsert_record(
+            self.COLLECTION,
+            entry_id,
+            payload,
+            vector={QdrantService.BLACKBOARD_VECTOR_NAME: vec},
+        )
+        return BlackboardWrite(self._entry(payload), False)
+
+    # ------------------------------------------------------------------
+    # Read
+    # ------------------------------------------------------------------
+
+    async def list_entries(
+        self,
+        wallet: str,
+        board_id: str,
+        since_seq: int = 0,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Entries written after `since_seq`, oldest first (incremental polling)."""
+        must = self._board_conditions(wallet, board_id)
+        if since_seq:
+            must.append(qm.FieldCondition(key="seq", range=qm.Range(gt=since_seq)))
+
+        points, _ = self.qdrant.query_by_filter(
+            self.COLLECTION,
+            qfilter=qm.Filter(must=must),
+            limit=limit,
+            order_by=qm.OrderBy(key="seq", direction=qm.Direction.ASC),
+        )
+        return [self._entry(p.payload) for p in points if p.payload]
+
+    async def search(
+        self,
+        wallet: str,
+        board_id: str,
+        query: str,
+        k: int = 5,
+        exclude_author: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        vec = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        qfilter = qm.Filter(must=self._board_conditions(wallet, board_id))
+        if exclude_author:
+            qfilter.must_not = [qm.FieldCondition(key="author_agent_id", match=qm.MatchValue(value=exclude_author))]
+        hits = self.qdrant.search(
+            self.COLLECTION,
+            vector_name=QdrantService.BLACKBOARD_VECTOR_NAME,
+            query_vector=vec,
+            qfilter=qfilter,
+            limit=k,
+        )
+        return [self._entry(h.payload, score=h.score) for h in hits if h.payload]
+
+    async def clear(self, wallet: str, board_id: str) -> None:
+        self.qdrant.delete_by_filter(self.COLLECTION, qm.Filter(must=self._board_conditions(wallet, board_id)))
+
+    @staticmethod
+    def format_context(entries: List[Dict[str, Any]]) -> str:
+        if not entries:
+            return ""
+        lines = [f"- {e.get('content')}" for e in entries if e.get("content")]
+        return "Shared findings from collaborating agents:\n" + "\n".join(lines)
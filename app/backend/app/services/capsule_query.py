@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.schemas import Agent, Capsule
+
+CAPSULE_INSTRUCTION = (
+    "Answer the question using the capsule's knowledge provided with it. "
+    "If that knowledge does not cover the question, say so instead of guessing."
+)
+
+# Answers to paid capsule queries, keyed by (capsule_id, knowledge version, prompt hash).
+# The version changes whenever the capsule's content or its memories change, so an entry
+# never outlives the knowledge it was generated from; the TTL bounds everything else.
+answer_cache = TTLCache(settings.CAPSULE_ANSWER_CACHE_TTL_SECONDS, settings.CAPSULE_ANSWER_CACHE_MAX_ENTRIES)
+
+AnswerKey = Tuple[str, str, str]
+
+
+def answer_key(capsule_id: str, version: str, prompt: str) -> AnswerKey:
+    normalized = " ".join(prompt.lower().split())
+    return (capsule_id, version, hashlib.sha256(normalized.encode("utf-8")).hexdigest())
+
+
+def capsule_persona(capsule: Capsule) -> str:
+    lines = [f"You are the knowledge capsule \"{capsule.name}\"."]
+    if capsule.description:
+        lines.append(capsule.description)
+    if capsule.category:
+        lines.append(f"Category: {capsule.category}.")
+    lines.append(CAPSULE_INSTRUCTION)
+    return "\n".join(lines)
+
+
+def fallback_agent(capsule: Capsule, agent_id: Optional[str]) -> Agent:
+    """Platform defaults for capsules without a (readable) agent behind them."""
+    return Agent(
+        id=agent_id or capsule.id,
+        name=capsule.name,
+        display_name=capsule.name,
+        platform="openrouter",
+        api_key_configured=False,
+    )
+
+
+@dataclass
+class CapsuleQueryPlan:
+    """Everything needed to answer a verified capsule query: a cached answer or a ready prompt."""
+
+    capsule: Capsule
+    agent_id: str
+    agent_config: Agent
+    cache_key: AnswerKey
+    # The claimed payment; settled once the answer is complete, released if it never is
+    payment_signature: str
+    amount_paid: float
+    cached_answer: Optional[str] = None
+    prompt: List[Dict[str, Any]] = field(default_factory=list)
+    memory_stats: Dict[str, Any] = field(default_factory=dict)
@@ -1,16 +1,35 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timezone
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 
-import httpx
 from qdrant_client.http import models as qm
 
 from app.core.config import settings
-from app.models.schemas import Capsule, CapsuleCreate, CapsuleUpdate
+from app.models.schemas import Agent, Capsule, CapsuleCreate, CapsuleUpdate
+from app.services.agent_service import AgentService
+from app.services.capsule_query import (
+    AnswerKey,
+    CapsuleQueryPlan,
+    answer_cache,
+    answer_key,
+    capsule_persona,
+    fallback_agent,
+)
 from app.services.embedding_service import EmbeddingService
+from app.services.llm_service import LLMService
+from app.services.marketplace_cache import invalidate_marketplace_cache
+from app.services.memory_fusion import fuse_memory_context, mem0_items
+from app.services.memory_retrieval import MemoryRetriever, RetrievalResult
+from app.services.memory_service import MEM0_COLLECTION
+from app.services.payment_verification import get_payment_verifier
+from app.services.prompt_builder import PromptContext, build_prompt
 from app.services.qdrant_service import QdrantService, get_qdrant_service, make_base_payload
+from app.services.similar_capsules import schedule_similar_refresh
+from app.services.solana_rpc import LAMPORTS_PER_SOL
+from app.services.trending_service import TRENDING_FIELD, bump_trending, seed_trending
 
 
 def _utc_now() -> datetime:
@@ -32,6 +51,25 @@ def _dt(value: Any) -> datetime:
     return _utc_now()
 
 
+def backfill_capsule_agent_ids() -> int:
+    """Copy `metadata.agent_id` to the indexed top-level `agent_id` on capsules that predate it."""
+    qdrant = get_qdrant_service()
+    qfilter = qm.Filter(
+        must=[qm.IsEmptyCondition(is_empty=qm.PayloadField(key="agent_id"))],
+        must_not=[qm.IsEmptyCondition(is_empty=qm.PayloadField(key="metadata.agent_id"))],
+    )
+    updated = 0
+    while True:
+        # Updated points drop out of the filter, so always read the first page
+        points, _ = qdrant.query_by_filter(CapsuleService.COLLECTION, qfilter=qfilter, limit=256)
+        if not points:
+            return updated
+        for p in points:
+            metadata = (p.payload or {}).get("metadata") or {}
+            qdrant.set_payload(CapsuleService.COLLECTION, p.id, {"agent_id": str(metadata.get("agent_id"))})
+            updated += 1
+
+
 class CapsuleService:
     COLLECTION = "capsules"
     EARNINGS_COLLECTION = "earnings"
@@ -64,13 +102,15 @@ class CapsuleService:
         return self._to_capsule(rec.payload)
 
     async def find_capsule_for_agent(self, wallet_address: str, agent_id: str) -> Optional[Capsule]:
-        # Qdrant nested payload filtering can vary by setup; keep it robust by scanning user's capsules.
-        capsules = await self.get_user_capsules(wallet_address)
-        for c in capsules:
-            md = c.metadata or {}
-            if isinstance(md, dict) and md.get("agent_id") == agent_id:
-                return c
-        return None
+        # Top-level agent_id (indexed); older capsules get it from metadata via backfill_capsule_agent_ids
+        qfilter = qm.Filter(must=[
+            qm.FieldCondition(key="creator_wallet", match=qm.MatchValue(value=wallet_address)),
+            qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id)),
+        ])
+        points, _ = self.qdrant.query_by_filter(self.COLLECTION, qfilter=qfilter, limit=1)
+        if not points or not points[0].payload:
+            return None
+        return self._to_capsule(points[0].payload)
 
     async def create_capsule(self, capsule_data: CapsuleCreate, wallet_address: str) -> Capsule:
         capsule_id = str(uuid.uuid4())
@@ -104,6 +144,8 @@ class CapsuleService:
             "reputation": 0.0,
             "query_count": 0,
             "rating": 0.0,
+            "content_version": 0,
+            TRENDING_FIELD: seed_trending(now),
             "updated_at": _iso(now),
             "metadata": capsule_data.metadata or {},
         }
@@ -114,6 +156,8 @@ class CapsuleService:
             payload,
             vector={QdrantService.CAPSULE_VECTOR_NAME: vec},
         )
+        invalidate_marketplace_cache()
+        schedule_similar_refresh(capsule_id)
 
         return self._to_capsule(payload)
 
@@ -138,6 +182,12 @@ class CapsuleService:
             payload["price"] = float(capsule_update.price_per_query)
         if capsule_update.metadata is not None:
             payload["metadata"] = capsule_update.metadata
+            if isinstance(capsule_update.metadata, dict) and "agent_id" in capsule_update.metadata:
+                # Keep the indexed copy in sync with metadata
+                payload["agent_id"] = capsule_update.metadata.get("agent_id")
+        if changed_for_embedding or capsule_update.metadata is not None:
+            # New knowledge version: cached answers for the old one are no longer served
+            payload["content_version"] = int(payload.get("content_version") or 0) + 1
 
         payload["updated_at"] = _iso(_utc_now())
 
@@ -151,6 +201,8 @@ class CapsuleService:
             self.qdrant.set_payload(self.COLLECTION, capsule_id, payload)
         else:
             self.qdrant.upsert_record(self.COLLECTION, capsule_id, payload, vector=vec)
+            schedule_similar_refresh(capsule_id)
+        invalidate_marketplace_cache()
         return await self.get_capsule(capsule_id)
 
     async def delete_capsule(self, capsule_id: str, wallet_address: str) -> None:
@@ -160,66 +212,175 @@ class CapsuleService:
         if existing.creator_wallet != wallet_address:
             return
         self.qdrant.delete_by_id(self.COLLECTION, capsule_id)
-
-    async def query_capsule(
+        invalidate_marketplace_cache()
+
+    async def _knowledge_version(self, capsule_id: str, payload: Dict[str, Any], agent_id: Optional[str]) -> str:
+        """Changes when the capsule's content is edited or its memories are added/removed."""
+        count = 0
+        if self.qdrant.client.collection_exists(MEM0_COLLECTION):
+            must = [qm.FieldCondition(key="capsule_id", match=qm.MatchValue(value=capsule_id))]
+            if agent_id:
+                must.append(qm.FieldCondition(key="user_id", match=qm.MatchValue(value=agent_id)))
+            count = await asyncio.to_thread(self.qdrant.count, MEM0_COLLECTION, qm.Filter(must=must))
+        return f"{int(payload.get('content_version') or 0)}:{count}"
+
+    async def _resolve_agent(self, capsule: Capsule, agent_id: Optional[str]) -> Agent:
+        if agent_id:
+            try:
+                agent = await AgentService().get_agent(agent_id, None)
+                if agent:
+                    return agent
+            except Exception:
+                pass
+        return fallback_agent(capsule, agent_id)
+
+    async def prepare_query(
         self,
         capsule_id: str,
         prompt: str,
         wallet_address: str,
-        payment_signature: Optional[str] = None,
-        amount_paid: Optional[float] = None,
-    ) -> dict:
-        capsule = await self.get_capsule(capsule_id)
-        if not capsule:
+        payment_signature: Optional[str],
+        amount_paid: Optional[float],
+    ) -> CapsuleQueryPlan:
+        """
+        Verify payment and assemble the answer for a capsule query. Every query must be
+        paid for with at least the capsule's price_per_query.
+        Payment verification, agent lookup and the cache check / memory retrieval run
+        concurrently; nothing is returned unless the payment checks out.
+        A payment signature pays for exactly one query; reuse raises PaymentReplayError.
+        The signature is claimed here and only settled by `stream_answer` once the answer
+        is complete; any failure before that releases it.
+        """
+        if not prompt or not prompt.strip():
+            raise Exception("Prompt is required")
+        if not payment_signature or amount_paid is None:
+            raise Exception("Payment is required: payment_signature and amount_paid")
+        rec = self.qdrant.get_by_id(self.COLLECTION, capsule_id)
+        if not rec or not rec.payload:
             raise Exception("Capsule not found")
+        payload = rec.payload
+        capsule = self._to_capsule(payload)
+        agent_id = payload.get("agent_id") or (capsule.metadata or {}).get("agent_id")
+        if float(amount_paid) < capsule.price_per_query:
+            raise Exception(f"Amount paid is below the capsule's price of {capsule.price_per_query} SOL")
+        async def _knowledge() -> Tuple[AnswerKey, Optional[str], Optional[RetrievalResult]]:
+            key = answer_key(capsule_id, await self._knowledge_version(capsule_id, payload, agent_id), prompt)
+            hit = answer_cache.get(key)
+            if hit is not None:
+                return key, hit.value, None
+            try:
+                retrieval = await MemoryRetriever().retrieve_capsule(
+                    capsule_id, prompt, settings.CAPSULE_QUERY_MEMORY_SIZE, agent_id
+                )
+            except Exception:
+                # Embeddings not configured -> answer from the capsule description alone
+                retrieval = RetrievalResult(memories=[])
+            return key, None, retrieval
+
+        verified, agent, (key, cached, retrieval) = await asyncio.gather(
+            self._verify_payment(payment_signature, wallet_address, capsule.creator_wallet, float(amount_paid)),
+            self._resolve_agent(capsule, agent_id),
+            _knowledge(),
+        )
+        if not verified:
+            raise Exception("Payment verification failed")
+        # Claimed only once every concurrent step has succeeded, so a failed sibling never
+        # leaves a claim behind. Raises PaymentReplayError if the signature already paid.
+        get_payment_verifier().claim(
+            payment_signature, wallet_address, capsule.creator_wallet, float(amount_paid), capsule_id
+        )
 
-        # Verify payment if signature provided
-        if payment_signature and amount_paid:
-            verified = await self._verify_payment(
-                payment_signature,
-                wallet_address,
-                capsule.creator_wallet,
-                float(amount_paid),
+        try:
+            plan = CapsuleQueryPlan(
+                capsule=capsule,
+                agent_id=agent.id,
+                agent_config=agent,
+                cache_key=key,
+                payment_signature=payment_signature,
+                amount_paid=float(amount_paid),
+                cached_answer=cached,
             )
-            if not verified:
-                raise Exception("Payment verification failed")
-
-            # Record earnings
-            await self._record_earnings(capsule_id, capsule.creator_wallet, float(amount_paid), source="usage")
-
-        # Increment query count
-        await self._increment_query_count(capsule_id)
+            if retrieval is not None:
+                messages = [
+                    {"role": "system", "content": capsule_persona(capsule)},
+                    {"role": "user", "content": prompt},
+                ]
+                memory_context = fuse_memory_context(
+                    [mem0_items(retrieval.memories)],
+                    history=messages,
+                    memory_size=settings.CAPSULE_QUERY_MEMORY_SIZE,
+                )
+                plan.prompt = build_prompt(messages, PromptContext(memory_context=memory_context), model=agent.model)
+                plan.memory_stats = retrieval.stats
+            return plan
+        except BaseException:
+            get_payment_verifier().release(payment_signature)
+            raise
+
+    async def stream_answer(
+        self,
+        plan: CapsuleQueryPlan,
+        usage: Optional[Dict[str, Any]] = None,
+        wallet_address: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Yield the answer for a prepared query; fresh answers are cached once complete.
+        The payment is settled (earnings, query count) only once the answer is complete;
+        if answering fails or the caller goes away first, its claim is released.
+        """
+        settled = False
+        try:
+            if plan.cached_answer is not None:
+                await self._settle(plan)
+                settled = True
+                yield plan.cached_answer
+                return
+            parts: List[str] = []
+            async for chunk in LLMService().stream_prompt(
+                plan.agent_id, plan.prompt, plan.agent_config, usage=usage, wallet_address=wallet_address
+            ):
+                parts.append(chunk)
+                yield chunk
+            answer = "".join(parts)
+            if not answer:
+                raise Exception("No answer was generated")
+            await self._settle(plan)
+            settled = True
+            answer_cache.set(plan.cache_key, answer)
+        except BaseException:
+            if not settled:
+                get_payment_verifier().release(plan.payment_signature)
+            raise
+
+    async def _settle(self, plan: CapsuleQueryPlan) -> None:
+        await self._record_earnings(plan.capsule.id, plan.capsule.creator_wallet, plan.amount_paid, source="usage")
+        await self._increment_query_count(plan.capsule.id)
 
-        # TODO: Implement memory retrieval and LLM query integration
+    async def query_capsule(
+        self,
+        capsule_id: str,
+        prompt: str,
+        wallet_address: str,
+        payment_signature: Optional[str],
+        amount_paid: Optional[float],
+    ) -> dict:
+        plan = await self.prepare_query(capsule_id, prompt, wallet_address, payment_signature, amount_paid)
+        usage: Dict[str, Any] = {}
+        parts = [chunk async for chunk in self.stream_answer(plan, usage, wallet_address)]
         return {
-            "response": f"Query processed for capsule '{capsule.name}'. Payment verified ({amount_paid or 0} SOL). LLM integration pending.",
+            "response": "".join(parts),
             "capsule_id": capsule_id,
-            "price_paid": amount_paid or 0,
+            "price_paid": float(amount_paid),
+            "cached": plan.cached_answer is not None,
+            "usage": usage or None,
+            "memory": plan.memory_stats or None,
         }
 
     async def _verify_payment(self, signature: str, sender: str, recipient: str, amount: float) -> bool:
-        """Verify Solana transaction on-chain (unchanged)"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    settings.SOLANA_RPC_URL,
-                    json={
-                        "jsonrpc": "2.0",
-                        "id": 1,
-                        "method": "getTransaction",
-                        "params": [signature, {"encoding": "json", "maxSupportedTransactionVersion": 0}],
-                    },
-                    timeout=10.0,
-                )
-                data = response.json()
-                if "result" not in data or not data["result"]:
-                    return False
-                tx = data["result"]
-                if not tx.get("meta") or tx["meta"].get("err"):
-                    return False
-                return True
-        except Exception:
-            return False
+        """Verify a Solana transfer on-chain (transactions are cached per signature)"""
+        return await get_payment_verifier().verify(
+            signature, sender, recipient, int(round(amount * LAMPORTS_PER_SOL))
+        )
 
     async def _record_earnings(self, capsule_id: str, wallet_address: str, amount: float, source: str) -> None:
         now = _utc_now()
@@ -243,11 +404,14 @@ class CapsuleService:
         rec = self.qdrant.get_by_id(self.COLLECTION, capsule_id)
         if not rec or not rec.payload:
             return
-        payload = rec.payload
-        current = float(payload.get("query_count") or 0)
-        payload["query_count"] = int(current + 1)
-        payload["updated_at"] = _iso(_utc_now())
-        self.qdrant.set_payload(self.COLLECTION, capsule_id, payload)
+        update: Dict[str, Any] = {
+            "query_count": int(rec.payload.get("query_count") or 0) + 1,
+            "updated_at": _iso(_utc_now()),
+        }
+        if TRENDING_FIELD in rec.payload:
+            update[TRENDING_FIELD] = rec.payload[TRENDING_FIELD]
+        bump_trending(update, settings.TRENDING_QUERY_WEIGHT)
+        self.qdrant.set_payload(self.COLLECTION, capsule_id, update)
 
     def _to_capsule(self, payload: Dict[str, Any]) -> Capsule:
         return Capsule(
@@ -6,7 +6,7 @@ from typing import List, Optional
 
 from qdrant_client.http import models as qm
 
-from app.models.schemas import Chat, ChatCreate, ChatUpdate, MemorySize
+from app.models.schemas import Chat, ChatCreate, ChatUpdate, MemoryEngine, MemorySize
 from app.services.message_service import MessageService
 from app.services.qdrant_service import get_qdrant_service, make_base_payload
 
@@ -19,6 +19,13 @@ def _iso(dt: datetime) -> str:
     return dt.isoformat()
 
 
+def _memory_engine(payload: dict) -> Optional[MemoryEngine]:
+    try:
+        return MemoryEngine(payload["memory_engine"]) if payload.get("memory_engine") else None
+    except ValueError:
+        return None
+
+
 class ChatService:
     COLLECTION = "chats"
 
@@ -48,6 +55,7 @@ class ChatService:
             "capsule_id": chat.capsule_id,
             "user_wallet": wallet,
             "web_search_enabled": getattr(chat, "web_search_enabled", False),
+            "memory_engine": chat.memory_engine.value if chat.memory_engine else None,
         }
 
         self.qdrant.upsert_record(self.COLLECTION, chat_id, payload)
@@ -64,6 +72,7 @@ class ChatService:
             capsule_id=chat.capsule_id,
             user_wallet=wallet,
             web_search_enabled=getattr(chat, "web_search_enabled", False),
+            memory_engine=chat.memory_engine,
         )
 
     async def list_chats(self, agent_id: str, wallet: Optional[str]) -> List[Chat]:
@@ -112,6 +121,7 @@ class ChatService:
                     capsule_id=payload.get("capsule_id"),
                     user_wallet=payload.get("wallet") or payload.get("user_wallet") or wallet,
                     web_search_enabled=bool(payload.get("web_search_enabled") or False),
+                    memory_engine=_memory_engine(payload),
                 )
             )
 
@@ -153,6 +163,7 @@ class ChatService:
             capsule_id=payload.get("capsule_id"),
             user_wallet=payload.get("wallet") or payload.get("user_wallet"),
             web_search_enabled=bool(payload.get("web_search_enabled") or False),
+            memory_engine=_memory_engine(payload),
         )
 
     async def update_chat(self, chat_id: str, chat_update: ChatUpdate, wallet: Optional[str]) -> Chat:
@@ -167,6 +178,8 @@ class ChatService:
             existing.memory_size = chat_update.memory_size
         if chat_update.web_search_enabled is not None:
             existing.web_search_enabled = chat_update.web_search_enabled
+        if chat_update.memory_engine is not None:
+            existing.memory_engine = chat_update.memory_engine
 
         rec = self.qdrant.get_by_id(self.COLLECTION, chat_id)
         payload = (rec.payload or {}) if rec else {}
@@ -177,6 +190,7 @@ class ChatService:
                 "title": existing.name,
                 "memory_size": existing.memory_size.value,
                 "web_search_enabled": existing.web_search_enabled,
+                "memory_engine": existing.memory_engine.value if existing.memory_engine else None,
                 "updated_at": _iso(_utc_now()),
             }
         )
@@ -1,11 +1,36 @@
 from __future__ import annotations
 
-from typing import List
+from collections import OrderedDict
+import threading
+from typing import List, Optional, Tuple
 
 import httpx
 
 from app.core.config import settings
 
+# Recently embedded texts, keyed by (model, text). One chat turn embeds the same user
+# message for memory retrieval, semantic recall and the response cache.
+_memo: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _memo_get(text: str) -> Optional[List[float]]:
+    key = (settings.OPENAI_EMBEDDING_MODEL, text)
+    with _memo_lock:
+        vec = _memo.get(key)
+        if vec is not None:
+            _memo.move_to_end(key)
+        return vec
+
+
+def _memo_put(text: str, vec: List[float]) -> None:
+    if settings.EMBEDDING_CACHE_SIZE <= 0:
+        return
+    with _memo_lock:
+        _memo[(settings.OPENAI_EMBEDDING_MODEL, text)] = vec
+        while len(_memo) > settings.EMBEDDING_CACHE_SIZE:
+            _memo.popitem(last=False)
+
 
 class EmbeddingService:
     """
@@ -22,6 +47,9 @@ class EmbeddingService:
         if not text:
             # Represent empty content deterministically
             return [0.0] * expected_dim
+        cached = _memo_get(text)
+        if cached is not None and len(cached) == expected_dim:
+            return cached
 
         async with httpx.AsyncClient(timeout=30.0) as client:
             resp = await client.post(
@@ -43,5 +71,38 @@ class EmbeddingService:
             raise RuntimeError(
                 f"Embedding dim mismatch: got {len(vec)} expected {expected_dim}"
             )
+        _memo_put(text, vec)
         return vec
 
+    async def embed_texts(self, texts: List[str], expected_dim: int = 1536) -> List[List[float]]:
+        """Embed several texts with a single API call (order preserved)."""
+        cleaned = [(t or "").strip() for t in texts]
+        vectors: List[List[float]] = [[0.0] * expected_dim for _ in cleaned]
+        pending = [i for i, t in enumerate(cleaned) if t]
+        if not pending:
+            return vectors
+
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            resp = await client.post(
+                "https://api.openai.com/v1/embeddings",
+                headers={
+                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "model": settings.OPENAI_EMBEDDING_MODEL,
+                    "input": [cleaned[i] for i in pending],
+                },
+            )
+            resp.raise_for_status()
+            data = resp.json()["data"]
+
+        for item in data:
+            vec = item["embedding"]
+            if len(vec) != expected_dim:
+                raise RuntimeError(
+                    f"Embedding dim mismatch: got {len(vec)} expected {expected_dim}"
+                )
+            vectors[pending[item["index"]]] = vec
+        return vectors
+
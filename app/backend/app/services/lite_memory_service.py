@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import hashlib
+import logging
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.models.schemas import MemoryEngine
+from app.services.embedding_service import EmbeddingService
+from app.services.memory_hot_cache import hot_cache
+from app.services.memory_service import MEM0_COLLECTION, MemoryService
+from app.services.qdrant_service import get_qdrant_service
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_FIRST_PERSON_RE = re.compile(r"\b(i|i'm|im|i've|i'd|i'll|me|my|mine|we|we're|our|ours)\b", re.IGNORECASE)
+_FACT_CUE_RE = re.compile(
+    r"\b(am|is|are|was|called|named|name|live|living|work|working|job|like|love|prefer|hate|dislike|"
+    r"favorite|favourite|want|need|plan|planning|goal|use|using|always|never|usually|allergic|"
+    r"born|birthday|deadline|budget|remember)\b",
+    re.IGNORECASE,
+)
+_FILLER_RE = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|ok|okay|sure|great|cool|yes|no|got it|sounds good)\b[\s!.,]*$",
+    re.IGNORECASE,
+)
+_PROPER_NOUN_RE = re.compile(r"(?<!^)(?<![.!?]\s)\b[A-Z][a-z]{2,}")
+_DIGIT_RE = re.compile(r"\d")
+
+# Sentences below this score are not worth remembering.
+_MIN_SALIENCE = 2.0
+_MIN_WORDS = 4
+_MAX_WORDS = 60
+
+_collection_ready = False
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def resolve_memory_engine(engine: Optional[str]) -> MemoryEngine:
+    """Per-chat engine, falling back to MEMORY_ENGINE."""
+    value = engine.value if isinstance(engine, MemoryEngine) else (engine or settings.MEMORY_ENGINE)
+    try:
+        return MemoryEngine(str(value).lower())
+    except ValueError:
+        return MemoryEngine.MEM0
+
+
+def salience(sentence: str, role: str) -> float:
+    """
+    Cheap score for "is this a durable fact worth remembering".
+    Favours first-person statements with fact/preference cues, names and numbers;
+    questions, greetings and very short/long sentences score 0.
+    """
+    text = sentence.strip()
+    words = text.split()
+    if not (_MIN_WORDS <= len(words) <= _MAX_WORDS):
+        return 0.0
+    if text.endswith("?") or _FILLER_RE.match(text):
+        return 0.0
+
+    score = 1.0 if role == "user" else 0.0
+    if _FIRST_PERSON_RE.search(text):
+        score += 1.5
+    if _FACT_CUE_RE.search(text):
+        score += 1.0
+    if _DIGIT_RE.search(text):
+        score += 0.5
+    score += min(1.0, 0.5 * len(_PROPER_NOUN_RE.findall(text)))
+    return score
+
+
+def extract_candidates(turn: List[Dict[str, str]], limit: int) -> List[str]:
+    """Top salient sentences of a turn (user + assistant), best first, deduplicated."""
+    scored: List[Tuple[float, int, str]] = []
+    seen = set()
+    position = 0
+    for message in turn:
+        role = message.get("role") or "user"
+        if role == "system":
+            continue
+        for sentence in _SENTENCE_SPLIT_RE.split(str(message.get("content") or "")):
+            sentence = sentence.strip(" -*\t")
+            key = " ".join(sentence.lower().split())
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            score = salience(sentence, role)
+            if score >= _MIN_SALIENCE:
+                scored.append((score, position, sentence))
+            position += 1
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [sentence for _, _, sentence in scored[:limit]]
+
+
+class LiteMemoryService:
+    """
+    Memory engine that avoids mem0's per-turn LLM extraction call.
+
+    - Each turn, salient sentences are picked with local heuristics, embedded in
+      one batch call and deduplicated by vector similarity against the chat's
+      existing memories (LITE_MEMORY_DEDUP_SIMILARITY) and against each other.
+    - Survivors are written straight to `mem0_memories` using mem0's payload layout
+      (data, hash, user_id=agent_id, chat_id...), so mem0 search and the lite
+      search both see them.
+    - Every LITE_MEMORY_LLM_EVERY_N_TURNS turns, mem0's LLM extraction runs once
+      over the last N turns to pick up facts the heuristics missed.
+    """
+
+    def __init__(self) -> None:
+        self.qdrant = get_qdrant_service()
+        self.embedder = EmbeddingService()
+        self._ensure_collection()
+
+    def _ensure_collection(self) -> None:
+        global _collection_ready
+        if _collection_ready:
+            return
+        if not self.qdrant.client.collection_exists(MEM0_COLLECTION):
+            # Same layout mem0 creates: one unnamed cosine vector
+            self.qdrant.client.create_collection(
+                collection_name=MEM0_COLLECTION,
+                vectors_config=qm.VectorParams(size=settings.QDRANT_MESSAGE_VECTOR_SIZE, distance=qm.Distance.COSINE),
+            )
+        # Also when mem0 created it after startup, which skipped the indexes
+        self.qdrant.ensure_payload_indexes(MEM0_COLLECTION)
+        _collection_ready = True
+
+    @staticmethod
+    def _scope_filter(agent_id: str, chat_id: str, capsule_id: Optional[str]) -> qm.Filter:
+        must = [
+            qm.FieldCondition(key="user_id", match=qm.MatchValue(value=agent_id)),
+            qm.FieldCondition(key="chat_id", match=qm.MatchValue(value=chat_id)),
+        ]
+        if capsule_id:
+            must.append(qm.FieldCondition(key="capsule_id", match=qm.MatchValue(value=capsule_id)))
+        return qm.Filter(must=must)
+
+    # ------------------------------------------------------------------
+    # Write
+    # ------------------------------------------------------------------
+
+    async def store_turn(
+        self,
+        agent_id: str,
+        chat_id: str,
+        messages: List[Dict[str, str]],
+        capsule_id: Optional[str] = None,
+    ) -> List[str]:
+        """Extract and store memories from the latest turn; returns the stored texts."""
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=None)
+        if last_user is None:
+            return []
+        turn = messages[last_user:]
+
+        stored: List[str] = []
+        candidates = extract_candidates(turn, settings.LITE_MEMORY_MAX_PER_TURN)
+        if candidates:
+            stored = await self._store_candidates(agent_id, chat_id, candidates, capsule_id)
+
+        await self._maybe_batch_extract(agent_id, chat_id, messages, capsule_id)
+        return stored
+
+    async def _store_candidates(
+        self,
+        agent_id: str,
+        chat_id: str,
+        candidates: List[str],
+        capsule_id: Optional[str],
+    ) -> List[str]:
+        vectors = await self.embedder.embed_texts(candidates, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        scope = self._scope_filter(agent_id, chat_id, capsule_id)
+        threshold = settings.LITE_MEMORY_DEDUP_SIMILARITY
+
+        points: List[qm.PointStruct] = []
+        accepted: List[List[float]] = []
+        for text, vec in zip(candidates, vectors):
+            if any(_cosine(vec, other) >= threshold for other in accepted):
+                continue
+            existing = self.qdrant.search(
+                MEM0_COLLECTION,
+                vector_name=None,
+                query_vector=vec,
+                qfilter=scope,
+                limit=1,
+                score_threshold=threshold,
+            )
+            if existing:
+                continue
+            accepted.append(vec)
+            payload: Dict[str, Any] = {
+                "data": text,
+                "hash": hashlib.md5(text.encode("utf-8")).hexdigest(),
+                "user_id": agent_id,
+                "agent_id": agent_id,
+                "chat_id": chat_id,
+                "created_at": _utc_now_iso(),
+                "source": MemoryEngine.LITE.value,
+            }
+            if capsule_id:
+                payload["capsule_id"] = capsule_id
+            points.append(qm.PointStruct(id=str(uuid.uuid4()), vector=vec, payload=payload))
+
+        if points:
+            self.qdrant.client.upsert(collection_name=MEM0_COLLECTION, points=points)
+            # Keep the chat's cached candidate set complete without a new search
+            hot_cache.merge(agent_id, chat_id, points)
+        return [p.payload["data"] for p in points]
+
+    async def _maybe_batch_extract(
+        self,
+        agent_id: str,
+        chat_id: str,
+        messages: List[Dict[str, str]],
+        capsule_id: Optional[str],
+    ) -> None:
+        every = settings.LITE_MEMORY_LLM_EVERY_N_TURNS
+        if every <= 0:
+            return
+        conversation = [m for m in messages if m.get("role") in ("user", "assistant")]
+        turns = sum(1 for m in conversation if m.get("role") == "user")
+        if turns == 0 or turns % every != 0:
+            return
+
+        memory_service = MemoryService()
+        if not memory_service._is_available():
+            return
+        # One LLM extraction over the last N turns instead of one per turn
+        window = conversation[-2 * every:]
+        await asyncio.to_thread(memory_service.store_chat_memory, agent_id, chat_id, window, capsule_id)
+
+    # ------------------------------------------------------------------
+    # Read
+    # ------------------------------------------------------------------
+
+    async def search(
+        self,
+        agent_id: str,
+        chat_id: str,
+        query: str,
+        limit: int = 5,
+        capsule_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """mem0-shaped results ({"id", "memory", "score"}) without going through mem0."""
+        if not query:
+            return []
+        vec = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        hits = self.qdrant.search(
+            MEM0_COLLECTION,
+            vector_name=None,
+            query_vector=vec,
+            qfilter=self._scope_filter(agent_id, chat_id, capsule_id),
+            limit=limit,
+        )
+        return [
+            {"id": str(h.id), "memory": (h.payload or {}).get("data", ""), "score": h.score}
+            for h in hits
+        ]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = sum(x * x for x in a) ** 0.5
+    nb = sum(y * y for y in b) ** 0.5
+    if not na or not nb:
+        return 0.0
+    return dot / (na * nb)
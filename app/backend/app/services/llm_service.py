@@ -1,15 +1,42 @@
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import Any, List, Dict, Optional, AsyncGenerator, Set
 from app.core.config import settings
-from app.models.schemas import Agent, LLMResponse
+from app.models.schemas import Agent, LLMResponse, MemoryEngine, Message
 from app.services.memory_service import MemoryService
+from app.services.lite_memory_service import LiteMemoryService, resolve_memory_engine
+from app.services.memory_fusion import fuse_memory_context, mem0_items, message_items
+from app.services.memory_retrieval import MemoryRetriever
+from app.services.message_service import MessageService
+from app.services.prompt_builder import PromptContext, build_prompt, normalize_usage
+from app.services.response_cache_service import (
+    CACHE_BYPASS,
+    CACHE_HIT,
+    CACHE_MISS,
+    CacheLookup,
+    ResponseCacheService,
+)
 from app.services.web_search_service import web_search, is_available as web_search_available
 
+from app.services.usage_service import UsageService
+from app.core import fastjson
+from app.core.tokens import count_message_tokens, count_tokens
+
+import asyncio
 import httpx
-import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Post-stream bookkeeping runs after the last chunk is handed out; keep references
+# so those tasks aren't garbage-collected mid-flight.
+_background: Set[asyncio.Task] = set()
+
+
+def _run_in_background(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
 
 def truncate_to_words(text: str, max_words: int = 100) -> str:
     words = text.split()
@@ -22,6 +49,328 @@ class LLMService:
     def __init__(self):
         self.openrouter_base = "https://openrouter.ai/api/v1"
         self.memory_service = MemoryService()
+        self._response_cache: Optional[ResponseCacheService] = None
+        self._lite_memory: Optional[LiteMemoryService] = None
+        self._retriever: Optional[MemoryRetriever] = None
+
+    # ---------------------------------------------------------------------
+    # RESPONSE CACHE
+    # ---------------------------------------------------------------------
+
+    def _get_response_cache(self) -> Optional[ResponseCacheService]:
+        if self._response_cache is None:
+            try:
+                self._response_cache = ResponseCacheService()
+            except Exception:
+                # Embeddings not configured -> cache unavailable
+                return None
+        return self._response_cache
+
+    async def check_response_cache(
+        self,
+        agent_id: str,
+        messages: List[Dict[str, str]],
+        agent_config: Agent,
+        web_search_enabled: bool = False
+    ) -> Optional[CacheLookup]:
+        """
+        Look up a cached answer for the final user message.
+        Returns None when the agent has not opted in.
+        Web-search chats and prompts with history always bypass.
+        """
+        if not ResponseCacheService.is_enabled(agent_config):
+            return None
+        if web_search_enabled:
+            return CacheLookup(status=CACHE_BYPASS)
+        cache = self._get_response_cache()
+        if cache is None:
+            return CacheLookup(status=CACHE_BYPASS)
+        try:
+            return await cache.lookup(agent_id, agent_config, messages)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return CacheLookup(status=CACHE_BYPASS)
+
+    async def _store_response_cache(
+        self,
+        agent_id: str,
+        messages: List[Dict[str, str]],
+        agent_config: Agent,
+        content: str,
+        cache_lookup: Optional[CacheLookup],
+        context: PromptContext
+    ) -> None:
+        if not cache_lookup or cache_lookup.status != CACHE_MISS or not content:
+            return
+        if context.memory_context or context.web_search_context:
+            # The answer drew on this chat's memories or live results; not reusable
+            return
+        cache = self._get_response_cache()
+        if cache is None:
+            return
+        try:
+            await cache.store(agent_id, agent_config, messages, content, vector=cache_lookup.vector)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    # ---------------------------------------------------------------------
+    # CONTEXT ASSEMBLY
+    # ---------------------------------------------------------------------
+
+    def _get_lite_memory(self) -> Optional[LiteMemoryService]:
+        if self._lite_memory is None:
+            try:
+                self._lite_memory = LiteMemoryService()
+            except Exception:
+                # Embeddings not configured -> lite engine unavailable
+                return None
+        return self._lite_memory
+
+    def _get_retriever(self) -> Optional[MemoryRetriever]:
+        if self._retriever is None:
+            try:
+                self._retriever = MemoryRetriever()
+            except Exception:
+                # Embeddings not configured -> fall back to mem0 search
+                return None
+        return self._retriever
+
+    async def fetch_web_context(self, query: str) -> str:
+        """Run a web search once so it can be shared across several completions."""
+        if not query or not web_search_available():
+            return ""
+        try:
+            logger.info(f"🔎 Performing web search for: {query[:50]}...")
+            # Tavily client is synchronous; keep it off the event loop.
+            context = await asyncio.to_thread(web_search, query, 5)
+            if context:
+                logger.info("✅ Web search completed successfully")
+            return context
+        except Exception as e:
+            # logger.warning(f"Web search failed: {e}")
+            return ""
+
+    def _retrieve_mem0(
+        self,
+        agent_id: str,
+        chat_id: str,
+        query: str,
+        memory_size: str,
+        capsule_id: Optional[str]
+    ) -> List[Dict]:
+        try:
+            return self.memory_service.get_chat_memories(
+                agent_id=agent_id,
+                chat_id=chat_id,
+                query=query,
+                memory_size=memory_size,
+                capsule_id=capsule_id
+            )
+        except Exception as e:
+            # logger.warning(f"Memory retrieval failed: {e}")
+            return []
+
+    async def _semantic_recall(
+        self,
+        agent_id: str,
+        chat_id: str,
+        query: str,
+        capsule_id: Optional[str],
+        wallet_address: Optional[str]
+    ) -> List[Message]:
+        """
+        Vector recall over the agent's other chats (no extraction call needed).
+        The current chat is sent in full as prompt history, so searching it only
+        returns messages the model already sees; recall is skipped in "chat" scope.
+        """
+        # Recall is wallet-scoped; without a wallet there is nothing safe to search
+        if not settings.SEMANTIC_RECALL_ENABLED or not query or not wallet_address:
+            return []
+        # Capsule chats are isolated; never recall across the agent's other chats for them
+        if settings.SEMANTIC_RECALL_SCOPE != "agent" or capsule_id:
+            return []
+        try:
+            return await MessageService().semantic_recall(
+                chat_id=chat_id,
+                agent_id=agent_id,
+                wallet=wallet_address,
+                query=query,
+                k=settings.SEMANTIC_RECALL_K,
+                across_chats=True,
+            )
+        except Exception as e:
+            # Embeddings not configured or search failed -> mem0 only
+            return []
+
+    async def _gather_context(
+        self,
+        agent_id: str,
+        messages: List[Dict[str, str]],
+        chat_id: Optional[str] = None,
+        memory_size: str = "Medium",
+        capsule_id: Optional[str] = None,
+        web_search_enabled: bool = False,
+        web_search_context: Optional[str] = None,
+        wallet_address: Optional[str] = None,
+        memory_engine: Optional[str] = None
+    ) -> PromptContext:
+        """
+        mem0 retrieval, semantic recall over chat messages and web search run concurrently.
+        The two memory sources are fused with reciprocal-rank fusion, deduplicated against
+        the prompt history and trimmed to the memory token budget.
+        A precomputed `web_search_context` (e.g. shared by a fan-out) skips the search.
+        """
+        user_message = messages[-1]["content"] if messages else ""
+        memory_stats: Dict[str, Any] = {}
+
+        async def _mem0() -> List[Dict]:
+            if not chat_id:
+                return []
+            # Both engines share mem0_memories; rerank it directly when embeddings are available
+            retriever = self._get_retriever()
+            if retriever is not None:
+                try:
+                    result = await retriever.retrieve(agent_id, chat_id, user_message, memory_size, capsule_id)
+                    memory_stats.update(result.stats)
+                    return result.memories
+                except Exception as e:
+                    # logger.warning(f"Memory retrieval failed: {e}")
+                    pass
+            if resolve_memory_engine(memory_engine) == MemoryEngine.LITE:
+                # Same collection, queried directly (works without mem0 configured)
+                lite = self._get_lite_memory()
+                if lite is None:
+                    return []
+                try:
+                    limit = {"Small": 3, "Medium": 5, "Large": 10}.get(memory_size, 5)
+                    return await lite.search(agent_id, chat_id, user_message, limit=limit, capsule_id=capsule_id)
+                except Exception as e:
+                    # logger.warning(f"Memory retrieval failed: {e}")
+                    return []
+            if not self.memory_service._is_available():
+                return []
+            return await asyncio.to_thread(
+                self._retrieve_mem0, agent_id, chat_id, user_message, memory_size, capsule_id
+            )
+
+        async def _recall() -> List[Message]:
+            if not chat_id:
+                return []
+            return await self._semantic_recall(agent_id, chat_id, user_message, capsule_id, wallet_address)
+
+        async def _web() -> str:
+            if not web_search_enabled:
+                return ""
+            if web_search_context is not None:
+                return web_search_context
+            return await self.fetch_web_context(user_message)
+
+        memories, recalled, web_context = await asyncio.gather(_mem0(), _recall(), _web())
+        memory_context = fuse_memory_context(
+            [mem0_items(memories), message_items(recalled)],
+            history=messages,
+            memory_size=memory_size,
+        )
+        return PromptContext(
+            memory_context=memory_context,
+            web_search_context=web_context,
+            memory_stats=memory_stats,
+        )
+
+    async def _store_memory(
+        self,
+        agent_id: str,
+        chat_id: Optional[str],
+        messages: List[Dict[str, str]],
+        full_content: str,
+        capsule_id: Optional[str] = None,
+        memory_engine: Optional[str] = None
+    ) -> None:
+        """
+        mem0 engine: LLM extraction on every turn (in a worker thread).
+        lite engine: local extraction + periodic batched mem0 extraction.
+        """
+        if not chat_id:
+            return
+        turn = messages + [{"role": "assistant", "content": full_content}]
+        try:
+            if resolve_memory_engine(memory_engine) == MemoryEngine.LITE:
+                lite = self._get_lite_memory()
+                if lite is not None:
+                    await lite.store_turn(agent_id, chat_id, turn, capsule_id)
+            elif self.memory_service._is_available():
+                await asyncio.to_thread(
+                    self.memory_service.store_chat_memory,
+                    agent_id=agent_id,
+                    chat_id=chat_id,
+                    messages=turn,
+                    capsule_id=capsule_id
+                )
+        except Exception as e:
+            # logger.warning(f"Memory storage failed: {e}")
+            pass
+
+    # ---------------------------------------------------------------------
+    # USAGE / LATENCY ACCOUNTING
+    # ---------------------------------------------------------------------
+
+    @staticmethod
+    def _finalize_usage(
+        raw_usage: Dict[str, Any],
+        prompt: List[Dict[str, Any]],
+        full_content: str,
+        started: float,
+        first_token_at: Optional[float]
+    ) -> Dict[str, Any]:
+        """
+        Provider-reported usage when available, otherwise a local tokenizer estimate,
+        plus time-to-first-token and total latency in milliseconds.
+        """
+        usage = normalize_usage(raw_usage)
+        if usage and usage.get("total_tokens"):
+            usage["estimated"] = False
+        else:
+            prompt_tokens = count_message_tokens(prompt)
+            completion_tokens = count_tokens(full_content)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cached_tokens": 0,
+                "estimated": True,
+            }
+        usage["ttft_ms"] = round((first_token_at - started) * 1000, 1) if first_token_at else None
+        usage["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return usage
+
+    async def _record_usage(
+        self,
+        agent_id: str,
+        wallet_address: Optional[str],
+        chat_id: Optional[str],
+        model: str,
+        usage: Dict[str, Any],
+        error: bool = False,
+        cache_hit: bool = False
+    ) -> None:
+        try:
+            # Only buffers the counts; they reach Qdrant on the periodic usage flush
+            UsageService().record(agent_id, wallet_address, chat_id, model, usage, error, cache_hit)
+        except Exception as e:
+            logger.warning(f"Usage accounting failed: {e}")
+
+    @staticmethod
+    def _cache_hit_usage(started: float) -> Dict[str, Any]:
+        elapsed = round((time.perf_counter() - started) * 1000, 1)
+        return {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cached_tokens": 0,
+            "estimated": False,
+            "ttft_ms": elapsed,
+            "latency_ms": elapsed,
+        }
 
     # ---------------------------------------------------------------------
     # PUBLIC NON-STREAM API
@@ -35,74 +384,75 @@ class LLMService:
         chat_id: Optional[str] = None,
         memory_size: str = "Medium",
         capsule_id: Optional[str] = None,
-        web_search_enabled: bool = False
+        web_search_enabled: bool = False,
+        wallet_address: Optional[str] = None,
+        web_search_context: Optional[str] = None,
+        memory_engine: Optional[str] = None,
+        cache_lookup: Optional[CacheLookup] = None
     ) -> LLMResponse:
         """
         Get a single completion (non-streaming).
         Collects the full response from the stream and returns it as LLMResponse.
+        Pass `cache_lookup` when the caller already checked the response cache.
         """
-        full_content = ""
+        started = time.perf_counter()
+        parts: List[str] = []
         model_name = agent_config.model or "google/gemma-3-27b-it:free"
-        
-        # Get memory context
-        memory_context = ""
-        if chat_id and self.memory_service._is_available():
-            try:
-                user_message = messages[-1]["content"] if messages else ""
-                memories = self.memory_service.get_chat_memories(
-                    agent_id=agent_id,
-                    chat_id=chat_id,
-                    query=user_message,
-                    memory_size=memory_size,
-                    capsule_id=capsule_id
-                )
-                memory_context = self.memory_service.format_memory_context(memories)
-            except Exception as e:
-                # logger.warning(f"Memory retrieval failed: {e}")
-                pass
-
-        # Get web search context if enabled
-        web_search_context = ""
-        if web_search_enabled and web_search_available():
-            try:
-                user_message = messages[-1]["content"] if messages else ""
-                if user_message:
-                    logger.info(f"🔎 Performing web search for: {user_message[:50]}...")
-                    web_search_context = web_search(user_message, k=5)
-                    if web_search_context:
-                        logger.info("✅ Web search completed successfully")
-            except Exception as e:
-                # logger.warning(f"Web search failed: {e}")
-                pass
-
-        enhanced_messages = self._inject_system_prompt(messages, memory_context, web_search_context)
-        
+
+        if cache_lookup is None:
+            cache_lookup = await self.check_response_cache(agent_id, messages, agent_config, web_search_enabled)
+        if cache_lookup and cache_lookup.status == CACHE_HIT:
+            usage = self._cache_hit_usage(started)
+            await self._record_usage(agent_id, wallet_address, chat_id, model_name, usage, cache_hit=True)
+            return LLMResponse(
+                content=cache_lookup.content or "",
+                model=model_name,
+                usage=usage,
+                metadata={"cache": CACHE_HIT}
+            )
+
+        context = await self._gather_context(
+            agent_id, messages, chat_id, memory_size, capsule_id, web_search_enabled, web_search_context,
+            wallet_address, memory_engine
+        )
+        prompt = build_prompt(messages, context, model=agent_config.model)
+
         # Collect all chunks from the stream
-        async for chunk in self._stream_completion(
-            enhanced_messages,
-            agent_config,
-            agent_id
-        ):
-            full_content += chunk
+        raw_usage: Dict[str, Any] = {}
+        first_token_at: Optional[float] = None
+        try:
+            async for chunk in self._stream_completion(
+                prompt,
+                agent_config,
+                agent_id,
+                usage=raw_usage
+            ):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(chunk)
+        except Exception:
+            usage = self._finalize_usage(raw_usage, prompt, "".join(parts), started, first_token_at)
+            await self._record_usage(agent_id, wallet_address, chat_id, model_name, usage, error=True)
+            raise
+        full_content = "".join(parts)
+        usage = self._finalize_usage(raw_usage, prompt, full_content, started, first_token_at)
 
         # Store memory after getting full response
-        if chat_id and self.memory_service._is_available():
-            try:
-                self.memory_service.store_chat_memory(
-                    agent_id=agent_id,
-                    chat_id=chat_id,
-                    messages=messages + [{"role": "assistant", "content": full_content}],
-                    capsule_id=capsule_id
-                )
-            except Exception as e:
-                # logger.warning(f"Memory storage failed: {e}")
-                pass
+        await self._store_memory(agent_id, chat_id, messages, full_content, capsule_id, memory_engine)
 
+        await self._store_response_cache(agent_id, messages, agent_config, full_content, cache_lookup, context)
+        await self._record_usage(agent_id, wallet_address, chat_id, model_name, usage)
+
+        metadata: Dict[str, Any] = {}
+        if cache_lookup:
+            metadata["cache"] = cache_lookup.status
+        if context.memory_stats:
+            metadata["memory"] = context.memory_stats
         return LLMResponse(
             content=full_content,
             model=model_name,
-            usage=None,
-            metadata=None
+            usage=usage,
+            metadata=metadata or None
         )
 
     # ---------------------------------------------------------------------
@@ -117,92 +467,169 @@ class LLMService:
         chat_id: Optional[str] = None,
         memory_size: str = "Medium",
         capsule_id: Optional[str] = None,
-        web_search_enabled: bool = False
+        web_search_enabled: bool = False,
+        cache_lookup: Optional[CacheLookup] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        wallet_address: Optional[str] = None,
+        web_search_context: Optional[str] = None,
+        memory_engine: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
-
-        memory_context = ""
-        if chat_id and self.memory_service._is_available():
-            try:
-                user_message = messages[-1]["content"] if messages else ""
-                memories = self.memory_service.get_chat_memories(
-                    agent_id=agent_id,
-                    chat_id=chat_id,
-                    query=user_message,
-                    memory_size=memory_size,
-                    capsule_id=capsule_id
+        """
+        Stream a completion chunk by chunk.
+        Pass `cache_lookup` when the caller already checked the response cache
+        (e.g. to set headers before the stream starts). If `usage` is given it is
+        filled with token usage and timings once the stream completes. Cache/memory
+        writes and usage accounting then run in the background, so the caller's final
+        frame is not held up by them.
+        `web_search_context` reuses search results gathered by the caller.
+        """
+        started = time.perf_counter()
+        model_name = agent_config.model or "google/gemma-3-27b-it:free"
+        if usage is None:
+            usage = {}
+
+        if cache_lookup is None:
+            cache_lookup = await self.check_response_cache(agent_id, messages, agent_config, web_search_enabled)
+        if cache_lookup and cache_lookup.status == CACHE_HIT:
+            usage.update(self._cache_hit_usage(started))
+            _run_in_background(
+                self._record_usage(agent_id, wallet_address, chat_id, model_name, dict(usage), cache_hit=True)
+            )
+            yield cache_lookup.content or ""
+            return
+
+        context = await self._gather_context(
+            agent_id, messages, chat_id, memory_size, capsule_id, web_search_enabled, web_search_context,
+            wallet_address, memory_engine
+        )
+        prompt = build_prompt(messages, context, model=agent_config.model)
+
+        parts: List[str] = []
+        raw_usage: Dict[str, Any] = {}
+        first_token_at: Optional[float] = None
+        completed = failed = False
+        try:
+            async for chunk in self._stream_completion(
+                prompt,
+                agent_config,
+                agent_id,
+                usage=raw_usage
+            ):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(chunk)
+                yield chunk
+            completed = True
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Also on client disconnect (GeneratorExit / cancellation): the tokens were spent
+            full_content = "".join(parts)
+            usage.update(self._finalize_usage(raw_usage, prompt, full_content, started, first_token_at))
+            if completed:
+                # `usage` is complete; the caller can send its final frame while these writes run
+                _run_in_background(self._after_stream(
+                    agent_id, messages, agent_config, full_content, cache_lookup, context, chat_id, capsule_id,
+                    memory_engine, wallet_address, model_name, dict(usage)
+                ))
+            else:
+                _run_in_background(
+                    self._record_usage(agent_id, wallet_address, chat_id, model_name, dict(usage), error=failed)
                 )
-                memory_context = self.memory_service.format_memory_context(memories)
-            except Exception as e:
-                # logger.warning(f"Memory retrieval failed: {e}")
-                pass
-
-        # Get web search context if enabled
-        web_search_context = ""
-        if web_search_enabled and web_search_available():
-            try:
-                user_message = messages[-1]["content"] if messages else ""
-                if user_message:
-                    logger.info(f"🔎 Performing web search for: {user_message[:50]}...")
-                    web_search_context = web_search(user_message, k=5)
-                    if web_search_context:
-                        logger.info("✅ Web search completed successfully")
-            except Exception as e:
-                # logger.warning(f"Web search failed: {e}")
-                pass
-
-        enhanced_messages = self._inject_system_prompt(messages, memory_context, web_search_context)
-
-        full_content = ""
-        async for chunk in self._stream_completion(
-            enhanced_messages,
-            agent_config,
-            agent_id
-        ):
-            full_content += chunk
-            yield chunk
 
-        if chat_id and self.memory_service._is_available():
-            try:
-                self.memory_service.store_chat_memory(
-                    agent_id=agent_id,
-                    chat_id=chat_id,
-                    messages=messages + [{"role": "assistant", "content": full_content}],
-                    capsule_id=capsule_id
-                )
-            except Exception as e:
-                # logger.warning(f"Memory storage failed: {e}")
-                pass
+    async def _after_stream(
+        self,
+        agent_id: str,
+        messages: List[Dict[str, str]],
+        agent_config: Agent,
+        full_content: str,
+        cache_lookup: Optional[CacheLookup],
+        context: PromptContext,
+        chat_id: Optional[str],
+        capsule_id: Optional[str],
+        memory_engine: Optional[str],
+        wallet_address: Optional[str],
+        model_name: str,
+        usage: Dict[str, Any]
+    ) -> None:
+        await self._store_response_cache(agent_id, messages, agent_config, full_content, cache_lookup, context)
+        await self._store_memory(agent_id, chat_id, messages, full_content, capsule_id, memory_engine)
+        await self._record_usage(agent_id, wallet_address, chat_id, model_name, usage)
+
+    async def stream_prompt(
+        self,
+        agent_id: str,
+        prompt: List[Dict[str, Any]],
+        agent_config: Agent,
+        usage: Optional[Dict[str, Any]] = None,
+        wallet_address: Optional[str] = None,
+        chat_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream a completion for a prompt the caller already assembled (e.g. a capsule query),
+        with the same usage/latency accounting as chats but no memory extraction or response cache.
+        """
+        started = time.perf_counter()
+        model_name = agent_config.model or "google/gemma-3-27b-it:free"
+        if usage is None:
+            usage = {}
+
+        parts: List[str] = []
+        raw_usage: Dict[str, Any] = {}
+        first_token_at: Optional[float] = None
+        failed = False
+        try:
+            async for chunk in self._stream_completion(prompt, agent_config, agent_id, usage=raw_usage):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(chunk)
+                yield chunk
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Recorded on disconnect too
+            usage.update(self._finalize_usage(raw_usage, prompt, "".join(parts), started, first_token_at))
+            _run_in_background(
+                self._record_usage(agent_id, wallet_address, chat_id, model_name, dict(usage), error=failed)
+            )
 
     # ---------------------------------------------------------------------
     # SINGLE STREAM ROUTER (THE FIX)
     # ---------------------------------------------------------------------
 
+    @staticmethod
+    def resolve_provider(agent_config: Agent, agent_id: str) -> str:
+        platform = (agent_config.platform or "").lower()
+
+        # 🔥 Canonical provider resolution
+        if (
+            platform == "openrouter"
+            or "openrouter" in platform
+            or agent_id in {"gpt", "mistral"}
+        ):
+            return "openrouter"
+        return "openrouter"  # default fallback to openrouter
+
     async def _stream_completion(
         self,
         messages: List[Dict[str, str]],
         agent_config: Agent,
-        agent_id: str
+        agent_id: str,
+        usage: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[str, None]:
 
-        platform = agent_config.platform.lower()
         model = agent_config.model
         api_key = agent_config.api_key
-
-        # 🔥 Canonical provider resolution
-        if (
-            platform == "openrouter"
-            or "openrouter" in platform
-            or agent_id in {"gpt", "mistral"}
-        ):
-            provider = "openrouter"
-        else:
-            provider = "openrouter"  # default fallback to openrouter
+        provider = self.resolve_provider(agent_config, agent_id)
 
         async for chunk in self._provider_stream(
             provider,
             messages,
             model,
-            api_key
+            api_key,
+            usage
         ):
             yield chunk
 
@@ -215,22 +642,23 @@ class LLMService:
         provider: str,
         messages: List[Dict[str, str]],
         model: Optional[str],
-        api_key: Optional[str]
+        api_key: Optional[str],
+        usage: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[str, None]:
 
         if provider == "openrouter":
-            async for c in self._openrouter_stream(messages, model, api_key):
+            async for c in self._openrouter_stream(messages, model, api_key, usage):
                 yield c
         else:
             # Default to openrouter for all providers
-            async for c in self._openrouter_stream(messages, model, api_key):
+            async for c in self._openrouter_stream(messages, model, api_key, usage):
                 yield c
 
     # ---------------------------------------------------------------------
     # PROVIDER-SPECIFIC STREAMS (MINIMAL, CLEAN)
     # ---------------------------------------------------------------------
 
-    async def _openrouter_stream(self, messages, model, api_key):
+    async def _openrouter_stream(self, messages, model, api_key, usage=None):
         model = model or "openai/gpt-4-turbo"
         api_key = api_key or settings.OPENROUTER_API_KEY
 
@@ -247,40 +675,27 @@ class LLMService:
                 json={
                     "model": model,
                     "messages": messages,
-                    "stream": True
+                    "stream": True,
+                    # Final chunk carries token usage (incl. cached prompt tokens)
+                    "stream_options": {"include_usage": True},
+                    "usage": {"include": True}
                 },
                 timeout=60
             ) as response:
 
+                # Hot loop: keep per-line work minimal (prefix check + one orjson parse).
                 async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]
-                        if data.strip() == "[DONE]":
-                            break
-                        payload = json.loads(data)
-                        delta = payload["choices"][0].get("delta", {})
-                        if content := delta.get("content"):
-                            yield content
-
-    # ---------------------------------------------------------------------
-
-    def _inject_system_prompt(self, messages, memory_context="", web_search_context=""):
-        system_prompt = "You are a helpful assistant. Please keep your responses concise and aim for approximately 100 words. Complete your thoughts naturally within this limit."
-        
-        if web_search_context:
-            system_prompt += "\n\nYou are a web-enabled research assistant. Use the following web results to answer the question accurately. Do NOT hallucinate. Base answers strictly on the data provided.\n\nWeb results:\n" + web_search_context
-        
-        if memory_context:
-            system_prompt += f"\n\nRelevant context from memory:\n{memory_context}"
-
-        if any(m["role"] == "system" for m in messages):
-            for m in messages:
-                if m["role"] == "system":
-                    m["content"] += "\n\nPlease keep your responses concise and aim for approximately 100 words. Complete your thoughts naturally within this limit."
-                    if web_search_context:
-                        m["content"] += "\n\nYou are a web-enabled research assistant. Use the following web results to answer the question accurately. Do NOT hallucinate. Base answers strictly on the data provided.\n\nWeb results:\n" + web_search_context
-                    if memory_context:
-                        m["content"] += f"\n\nRelevant context from memory:\n{memory_context}"
-            return messages
-
-        return [{"role": "system", "content": system_prompt}] + messages
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[6:]
+                    if data.startswith("[DONE]"):
+                        break
+                    payload = fastjson.loads(data)
+                    if usage is not None and payload.get("usage"):
+                        usage.update(payload["usage"])
+                    choices = payload.get("choices")
+                    if not choices:
+                        continue
+                    delta = choices[0].get("delta")
+                    if delta and (content := delta.get("content")):
+                        yield content
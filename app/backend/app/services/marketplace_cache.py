@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Anonymous marketplace reads (browse, trending, categories, facets), keyed by normalized
+# filters. Capsule and staking writes invalidate it; query-count bumps only age out via TTL.
+marketplace_cache = TTLCache(settings.MARKETPLACE_CACHE_TTL_SECONDS, settings.MARKETPLACE_CACHE_MAX_ENTRIES)
+
+
+def invalidate_marketplace_cache() -> None:
+    marketplace_cache.invalidate()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import List
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.models.schemas import FacetCount, MarketplaceFacets, PriceBucket
+from app.services.qdrant_service import get_qdrant_service
+
+COLLECTION = "capsules"
+
+
+def _price_boundaries() -> List[float]:
+    out: List[float] = []
+    for part in settings.MARKETPLACE_PRICE_BUCKETS.split(","):
+        try:
+            out.append(float(part))
+        except ValueError:
+            continue
+    return sorted(set(b for b in out if b > 0))
+
+
+def get_facets() -> MarketplaceFacets:
+    """Category counts (Qdrant facet on the keyword index) and price bucket counts for listed capsules."""
+    qdrant = get_qdrant_service()
+    listed = qm.FieldCondition(key="stake_amount", range=qm.Range(gt=0))
+
+    categories = [
+        FacetCount(value=str(hit.value), count=hit.count)
+        for hit in qdrant.facet(COLLECTION, "category", qm.Filter(must=[listed]))
+        if hit.value not in (None, "")
+    ]
+
+    buckets: List[PriceBucket] = []
+    lower = 0.0
+    for upper in _price_boundaries() + [None]:
+        price_range = qm.Range(gte=lower, lt=upper) if upper is not None else qm.Range(gte=lower)
+        count = qdrant.count(
+            COLLECTION,
+            qm.Filter(must=[listed, qm.FieldCondition(key="price_per_query", range=price_range)]),
+        )
+        buckets.append(PriceBucket(min_price=lower, max_price=upper, count=count))
+        if upper is not None:
+            lower = upper
+
+    return MarketplaceFacets(categories=categories, price_buckets=buckets)
@@ -1,12 +1,62 @@
 from __future__ import annotations
 
-from typing import List
+import asyncio
+import base64
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 
 from qdrant_client.http import models as qm
 
-from app.models.schemas import Capsule, MarketplaceFilters
+from app.core.config import settings
+from app.models.schemas import Capsule, MarketplaceFacets, MarketplaceFilters
 from app.services.capsule_service import CapsuleService
-from app.services.qdrant_service import get_qdrant_service
+from app.services.marketplace_facets import get_facets
+from app.services.similar_capsules import SIMILAR_FIELD, is_fresh, refresh_similar
+from app.services.qdrant_service import QdrantService, get_qdrant_service
+from app.services.trending_service import TRENDING_FIELD
+
+
+# sort_by -> (indexed payload key, direction)
+_SORT_KEYS = {
+    "popular": ("query_count", qm.Direction.DESC),
+    "newest": ("created_at", qm.Direction.DESC),
+    "price_low": ("price_per_query", qm.Direction.ASC),
+    "price_high": ("price_per_query", qm.Direction.DESC),
+    "rating": ("rating", qm.Direction.DESC),
+}
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+        if not isinstance(state, dict) or "v" not in state or not isinstance(state.get("a"), (str, int, type(None))):
+            raise ValueError
+        return state
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _value_condition(key: str, value: Any, **bounds: bool) -> qm.FieldCondition:
+    """Range condition on a sort key; `bounds` maps gt/gte/lt/lte to True to compare with `value`."""
+    limits = {op: value for op, on in bounds.items() if on}
+    if isinstance(value, str):
+        return qm.FieldCondition(key=key, range=qm.DatetimeRange(**limits))
+    return qm.FieldCondition(key=key, range=qm.Range(**limits))
 
 
 class MarketplaceService:
@@ -16,9 +66,21 @@ class MarketplaceService:
         self.qdrant = get_qdrant_service()
         self.capsules = CapsuleService()
 
-    async def browse_capsules(self, filters: MarketplaceFilters, limit: int, offset: int) -> List[Capsule]:
-        """Browse marketplace with filters - only shows capsules that have been staked"""
-        must = [qm.FieldCondition(key="stake_amount", range=qm.Range(gt=0))]
+    async def browse_capsules(
+        self,
+        filters: MarketplaceFilters,
+        limit: int,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Capsule], Optional[str]]:
+        """
+        Browse staked capsules, sorted by Qdrant (`order_by` on an indexed payload field).
+        Returns (page, next_cursor). Pass the cursor back to continue; `offset` is kept for
+        older clients and only applies to the first page.
+        The cursor holds the boundary sort value plus, while inside a group of capsules
+        sharing that value, the next point id of that group.
+        """
+        must = [self._listed_condition()]
         if filters.category:
             must.append(qm.FieldCondition(key="category", match=qm.MatchValue(value=filters.category)))
         if filters.min_reputation is not None:
@@ -26,60 +88,187 @@ class MarketplaceService:
         if filters.max_price is not None:
             must.append(qm.FieldCondition(key="price_per_query", range=qm.Range(lte=filters.max_price)))
 
-        qfilter = qm.Filter(must=must)
+        key, direction = _SORT_KEYS.get(filters.sort_by or "popular", _SORT_KEYS["popular"])
+        descending = direction == qm.Direction.DESC
+        page: List[qm.Record] = []
+        if cursor:
+            state = _decode_cursor(cursor)
+            if state.get("k") != key or state.get("d") != direction.value:
+                raise ValueError("Cursor does not match sort order")
+            boundary, after = state["v"], state.get("a")
+            if after is not None:
+                # Resume inside the tie group at the boundary value
+                page, after = self._tie_group(must, key, boundary, after, limit)
+                if after is not None or len(page) >= limit:
+                    return self._page(page), self._cursor(key, direction, boundary, after)
+            # Everything at the boundary value has been returned
+            must = must + [_value_condition(key, boundary, lt=descending, gt=not descending)]
+            offset = 0
+
+        # `offset` (first page only) is read through and dropped afterwards
+        wanted = offset + limit - len(page)
+        points, _ = self.qdrant.query_by_filter(
+            self.COLLECTION,
+            qfilter=qm.Filter(must=must),
+            limit=wanted,
+            order_by=qm.OrderBy(key=key, direction=direction),
+        )
+        points = [p for p in points if p.payload]
+        if len(points) < wanted:
+            return self._page((page + points)[offset:]), None
 
-        # Pull a window large enough for sorting + pagination (simple & predictable)
-        fetch_limit = min(max(offset + limit, 50), 1000)
-        points, _ = self.qdrant.query_by_filter(self.COLLECTION, qfilter=qfilter, limit=fetch_limit)
-        capsules = [self.capsules._to_capsule(p.payload or {}) for p in points if p.payload]
+        # The last value may continue past this read; its group is paged by point id instead,
+        # so each page costs two bounded reads however many capsules share a value.
+        last_value = points[-1].payload.get(key)
+        page += [p for p in points if p.payload.get(key) != last_value]
+        ties, after = self._tie_group(must, key, last_value, None, offset + limit - len(page))
+        return self._page((page + ties)[offset:]), self._cursor(key, direction, last_value, after)
 
-        # Apply sorting
-        sort_by = filters.sort_by or "popular"
-        if sort_by == "popular":
-            capsules.sort(key=lambda c: c.query_count, reverse=True)
-        elif sort_by == "newest":
-            capsules.sort(key=lambda c: c.created_at, reverse=True)
-        elif sort_by == "price_low":
-            capsules.sort(key=lambda c: c.price_per_query)
-        elif sort_by == "price_high":
-            capsules.sort(key=lambda c: c.price_per_query, reverse=True)
-        elif sort_by == "rating":
-            capsules.sort(key=lambda c: c.rating, reverse=True)
+    def _tie_group(
+        self,
+        must: List[qm.FieldCondition],
+        key: str,
+        value: Any,
+        after: Any,
+        limit: int,
+    ) -> Tuple[List[qm.Record], Any]:
+        """Points whose sort key equals `value`, in point-id order from `after`; returns (points, next id)."""
+        points, next_id = self.qdrant.query_by_filter(
+            self.COLLECTION,
+            qfilter=qm.Filter(must=must + [_value_condition(key, value, gte=True, lte=True)]),
+            limit=limit,
+            offset=after,
+        )
+        return [p for p in points if p.payload], next_id
 
-        return capsules[offset : offset + limit]
+    def _page(self, points: List[qm.Record]) -> List[Capsule]:
+        return [self.capsules._to_capsule(p.payload) for p in points]
+
+    @staticmethod
+    def _cursor(key: str, direction: qm.Direction, value: Any, after: Any) -> str:
+        # `a`: next point id inside the tie group at `v`; None once the group is done
+        return _encode_cursor({"k": key, "d": direction.value, "v": value, "a": after})
 
     async def get_trending_capsules(self, limit: int) -> List[Capsule]:
-        must = [qm.FieldCondition(key="stake_amount", range=qm.Range(gt=0))]
-        points, _ = self.qdrant.query_by_filter(self.COLLECTION, qfilter=qm.Filter(must=must), limit=min(limit * 5, 200))
-        capsules = [self.capsules._to_capsule(p.payload or {}) for p in points if p.payload]
-        capsules.sort(key=lambda c: c.query_count, reverse=True)
-        return capsules[:limit]
+        """Staked capsules by decayed activity: one ordered read of the materialized score."""
+        points, _ = self.qdrant.query_by_filter(
+            self.COLLECTION,
+            qfilter=qm.Filter(must=[self._listed_condition()]),
+            limit=limit,
+            order_by=qm.OrderBy(key=TRENDING_FIELD, direction=qm.Direction.DESC),
+        )
+        return [self.capsules._to_capsule(p.payload) for p in points if p.payload]
+
+    async def get_facets(self) -> MarketplaceFacets:
+        return await asyncio.to_thread(get_facets)
 
     async def get_categories(self) -> List[str]:
-        # Qdrant doesn't have an easy "distinct" payload query; scan a reasonable set.
-        points, _ = self.qdrant.query_by_filter(self.COLLECTION, qfilter=None, limit=1000)
-        cats = set()
-        for p in points:
-            if p.payload and p.payload.get("category"):
-                cats.add(str(p.payload["category"]))
-        if not cats:
-            return ["Finance", "Gaming", "Health", "Technology", "Education"]
-        return sorted(cats)
-
-    async def search_capsules(self, query: str, limit: int) -> List[Capsule]:
-        """Search capsules by name or description - only shows capsules that have been staked"""
-        q = (query or "").strip().lower()
-        must = [qm.FieldCondition(key="stake_amount", range=qm.Range(gt=0))]
-        points, _ = self.qdrant.query_by_filter(self.COLLECTION, qfilter=qm.Filter(must=must), limit=1000)
-        capsules = [self.capsules._to_capsule(p.payload or {}) for p in points if p.payload]
+        facets = await self.get_facets()
+        return sorted(c.value for c in facets.categories)
+
+    async def get_similar_capsules(self, capsule_ids: List[str], limit: int) -> Dict[str, List[Capsule]]:
+        """
+        "More like this" for several capsules at once (staked neighbours only).
+        Uses each capsule's precomputed `similar_ids`; missing or expired lists are
+        recomputed together in one batched recommend request.
+        """
+        capsule_ids = [cid for cid in dict.fromkeys(capsule_ids) if _is_uuid(cid)]
+        records = {str(r.id): r.payload or {} for r in self.qdrant.get_by_ids(self.COLLECTION, capsule_ids)}
+        known = [cid for cid in capsule_ids if cid in records]
+
+        neighbours: Dict[str, List[str]] = {}
+        stale = []
+        for cid in known:
+            if is_fresh(records[cid]):
+                neighbours[cid] = records[cid][SIMILAR_FIELD]
+            else:
+                stale.append(cid)
+        if stale:
+            neighbours.update(await asyncio.to_thread(refresh_similar, stale))
+
+        wanted = list(dict.fromkeys(nid for cid in known for nid in neighbours.get(cid, [])))
+        by_id = {
+            str(r.id): self.capsules._to_capsule(r.payload)
+            for r in self.qdrant.get_by_ids(self.COLLECTION, wanted)
+            # Lists can predate an unstake; only currently staked capsules are shown
+            if r.payload and float(r.payload.get("stake_amount") or 0) > 0
+        }
+        return {
+            cid: [by_id[nid] for nid in neighbours.get(cid, []) if nid in by_id][:limit]
+            for cid in known
+        }
+
+    @staticmethod
+    def _listed_condition() -> qm.FieldCondition:
+        return qm.FieldCondition(key="stake_amount", range=qm.Range(gt=0))
 
+    @staticmethod
+    def _text_filter(field: str, query: str) -> qm.Filter:
+        return qm.Filter(
+            must=[
+                MarketplaceService._listed_condition(),
+                qm.FieldCondition(key=field, match=qm.MatchText(text=query)),
+            ]
+        )
+
+    async def search_capsules(self, query: str, limit: int, offset: int = 0) -> List[Capsule]:
+        """
+        Hybrid search over staked capsules:
+        - vector similarity against the capsule's name/description/category embedding,
+          with the stake filter applied inside the Qdrant query;
+        - plus a boost for full-text matches on name / description (text payload indexes).
+        """
+        q = (query or "").strip()
+        window = offset + limit
         if not q:
-            return capsules[:limit]
+            points, _ = self.qdrant.query_by_filter(
+                self.COLLECTION, qfilter=qm.Filter(must=[self._listed_condition()]), limit=window
+            )
+            return [self.capsules._to_capsule(p.payload) for p in points[offset:] if p.payload]
+
+        try:
+            vec = await self.capsules.embedder.embed_text(q, expected_dim=settings.QDRANT_CAPSULE_VECTOR_SIZE)
+        except Exception:
+            vec = None
+        if vec is None:
+            return await self._keyword_search(q, limit, offset)
+
+        def _search(qfilter: qm.Filter) -> List[qm.ScoredPoint]:
+            return self.qdrant.search(
+                self.COLLECTION,
+                vector_name=QdrantService.CAPSULE_VECTOR_NAME,
+                query_vector=vec,
+                qfilter=qfilter,
+                limit=window,
+            )
+
+        # Vector-ranked candidates, and the best keyword matches so exact hits are never cut off
+        semantic = _search(qm.Filter(must=[self._listed_condition()]))
+        by_name = _search(self._text_filter("name", q))
+        by_description = _search(self._text_filter("description", q))
+
+        scores: Dict[str, float] = {}
+        payloads: Dict[str, Dict[str, Any]] = {}
+        for hit in semantic + by_name + by_description:
+            key = str(hit.id)
+            scores[key] = hit.score
+            payloads[key] = hit.payload or {}
+        for hit in by_name:
+            scores[str(hit.id)] += settings.MARKETPLACE_SEARCH_NAME_BOOST
+        for hit in by_description:
+            scores[str(hit.id)] += settings.MARKETPLACE_SEARCH_DESCRIPTION_BOOST
 
-        filtered = [
-            c
-            for c in capsules
-            if q in (c.name or "").lower() or q in (c.description or "").lower()
-        ]
-        return filtered[:limit]
+        ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+        return [self.capsules._to_capsule(payloads[key]) for key in ranked[offset:window] if payloads[key]]
 
+    async def _keyword_search(self, query: str, limit: int, offset: int) -> List[Capsule]:
+        """Full-text match only (embedding call failed)."""
+        qfilter = qm.Filter(
+            must=[self._listed_condition()],
+            should=[
+                qm.FieldCondition(key="name", match=qm.MatchText(text=query)),
+                qm.FieldCondition(key="description", match=qm.MatchText(text=query)),
+            ],
+        )
+        points, _ = self.qdrant.query_by_filter(self.COLLECTION, qfilter=qfilter, limit=offset + limit)
+        return [self.capsules._to_capsule(p.payload) for p in points[offset:] if p.payload]
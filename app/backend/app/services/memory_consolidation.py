@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import logging
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.services.memory_hot_cache import hot_cache, unit_vectors
+from app.services.memory_service import MEM0_COLLECTION
+from app.services.qdrant_service import QdrantService, get_qdrant_service, make_base_payload
+
+logger = logging.getLogger(__name__)
+
+POINTERS_COLLECTION = "mem0_pointers"
+WATERMARK_KEY = "mem0_consolidation:watermark"
+
+# Memories are only merged within one scope, so deleting a chat never removes another chat's facts.
+Scope = Tuple[str, str, Optional[str]]  # (user_id/agent_id, chat_id, capsule_id)
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _record_id(key: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+
+def _scope_of(payload: Dict[str, Any]) -> Optional[Scope]:
+    user_id, chat_id = payload.get("user_id"), payload.get("chat_id")
+    if not user_id or not chat_id:
+        return None
+    return (str(user_id), str(chat_id), payload.get("capsule_id"))
+
+
+# New memories compared per similarity block; bounds the (rows, n) matrix held at once
+SIMILARITY_CHUNK_ROWS = 256
+
+
+def near_duplicate_clusters(vectors: np.ndarray, new_mask: np.ndarray, threshold: float) -> List[List[int]]:
+    """
+    Union-find over pairs with cosine similarity >= threshold where at least one side is new
+    (old memories were already consolidated against each other). Returns clusters of size > 1.
+    CPU-bound: callers on the event loop run it in a worker thread.
+    """
+    n = len(vectors)
+    if n < 2 or not new_mask.any():
+        return []
+    unit = unit_vectors(vectors)
+
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    new_idx = np.flatnonzero(new_mask)
+    for start in range(0, len(new_idx), SIMILARITY_CHUNK_ROWS):
+        chunk = new_idx[start:start + SIMILARITY_CHUNK_ROWS]
+        rows, cols = np.nonzero(unit[chunk] @ unit.T >= threshold)  # (chunk, all)
+        for row, j in zip(rows, cols):
+            i = int(chunk[row])
+            if j == i:
+                continue
+            ri, rj = find(i), find(int(j))
+            if ri != rj:
+                parent[ri] = rj
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def _keeper(records: List[qm.Record], cluster: List[int]) -> int:
+    """Longest memory wins (most detail); the newest breaks ties."""
+    def key(i: int) -> Tuple[int, str]:
+        payload = records[i].payload or {}
+        return (len(str(payload.get("data") or "")), str(payload.get("updated_at") or payload.get("created_at") or ""))
+    return max(cluster, key=key)
+
+
+@dataclass
+class ConsolidationStats:
+    scanned: int = 0
+    scopes: int = 0
+    clusters: int = 0
+    dropped: int = 0
+    watermark: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+
+
+class MemoryConsolidationService:
+    """
+    Background deduplication of `mem0_memories`.
+
+    - Incremental: only memories created after the stored watermark are scanned; each is
+      compared (NumPy cosine, off the event loop, in row chunks) against the rest of its
+      agent/chat scope. Duplicates across an agent's chats are deliberately not merged.
+    - Near-duplicates (MEMORY_CONSOLIDATION_SIMILARITY) are clustered; the longest memory is
+      kept (with a `consolidated_count`), the others are deleted.
+    - Every drop is recorded in `mem0_pointers` (type `mem0_consolidation`) with the memory
+      it was merged into, so the action is traceable.
+    - Rate-limited: Qdrant reads/deletes are throttled to MEMORY_CONSOLIDATION_POINTS_PER_SECOND.
+    """
+
+    def __init__(self) -> None:
+        self.qdrant: QdrantService = get_qdrant_service()
+
+    async def _throttle(self, points: int) -> None:
+        rate = settings.MEMORY_CONSOLIDATION_POINTS_PER_SECOND
+        if rate > 0 and points:
+            await asyncio.sleep(points / rate)
+
+    async def _scroll_all(self, qfilter: qm.Filter) -> List[qm.Record]:
+        out: List[qm.Record] = []
+        offset = None
+        while True:
+            points, offset = await asyncio.to_thread(
+                self.qdrant.query_by_filter,
+                MEM0_COLLECTION,
+                qfilter,
+                settings.MEMORY_CONSOLIDATION_BATCH_SIZE,
+                offset,
+                True,
+            )
+            out.extend(points)
+            await self._throttle(len(points))
+            if not offset:
+                return out
+
+    # ------------------------------------------------------------------
+    # Watermark
+    # ------------------------------------------------------------------
+
+    def get_watermark(self) -> Optional[str]:
+        record = self.qdrant.get_by_id(POINTERS_COLLECTION, _record_id(WATERMARK_KEY))
+        return (record.payload or {}).get("watermark") if record else None
+
+    def _set_watermark(self, watermark: str, stats: ConsolidationStats) -> None:
+        payload = {
+            **make_base_payload("mem0_consolidation_watermark"),
+            "id": WATERMARK_KEY,
+            "watermark": watermark,
+            "last_run": {"scanned": stats.scanned, "clusters": stats.clusters, "dropped": stats.dropped},
+        }
+        self.qdrant.upsert_record(POINTERS_COLLECTION, _record_id(WATERMARK_KEY), payload)
+
+    # ------------------------------------------------------------------
+    # Run
+    # ------------------------------------------------------------------
+
+    async def _new_memories_by_scope(self, watermark: Optional[str], stats: ConsolidationStats) -> Dict[Scope, set]:
+        qfilter = qm.Filter(must=[qm.FieldCondition(key="created_at", range=qm.DatetimeRange(gt=watermark))]) \
+            if watermark else None
+        by_scope: Dict[Scope, set] = {}
+        latest: Optional[datetime] = None
+        offset = None
+        while True:
+            points, offset = await asyncio.to_thread(
+                self.qdrant.query_by_filter,
+                MEM0_COLLECTION,
+                qfilter,
+                settings.MEMORY_CONSOLIDATION_BATCH_SIZE,
+                offset,
+            )
+            for p in points:
+                payload = p.payload or {}
+                scope = _scope_of(payload)
+                if scope is not None:
+                    by_scope.setdefault(scope, set()).add(str(p.id))
+                try:
+                    ts = datetime.fromisoformat(str(payload.get("created_at")).replace("Z", "+00:00"))
+                    ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+                    latest = ts if latest is None or ts > latest else latest
+                except ValueError:
+                    pass
+            stats.scanned += len(points)
+            await self._throttle(len(points))
+            if not offset:
+                break
+        stats.watermark = latest.isoformat() if latest else watermark
+        return by_scope
+
+    async def _consolidate_scope(self, scope: Scope, new_ids: set, stats: ConsolidationStats) -> None:
+        user_id, chat_id, capsule_id = scope
+        must = [
+            qm.FieldCondition(key="user_id", match=qm.MatchValue(value=user_id)),
+            qm.FieldCondition(key="chat_id", match=qm.MatchValue(value=chat_id)),
+        ]
+        if capsule_id:
+            must.append(qm.FieldCondition(key="capsule_id", match=qm.MatchValue(value=capsule_id)))
+        records = [r for r in await self._scroll_all(qm.Filter(must=must)) if r.vector is not None]
+        if len(records) < 2:
+            return
+
+        vectors = np.array([r.vector for r in records], dtype=np.float32)
+        new_mask = np.array([str(r.id) in new_ids for r in records])
+        clusters = await asyncio.to_thread(
+            near_duplicate_clusters, vectors, new_mask, settings.MEMORY_CONSOLIDATION_SIMILARITY
+        )
+
+        if clusters:
+            # Cached candidates may include memories about to be deleted
+            hot_cache.invalidate(user_id, chat_id)
+        run_at = _utc_now_iso()
+        for cluster in clusters:
+            keep = _keeper(records, cluster)
+            kept = records[keep]
+            drop = [records[i] for i in cluster if i != keep]
+            kept_payload = kept.payload or {}
+
+            for record in drop:
+                payload = record.payload or {}
+                pointer_key = f"mem0_consolidation:{record.id}"
+                self.qdrant.upsert_record(POINTERS_COLLECTION, _record_id(pointer_key), {
+                    **make_base_payload("mem0_consolidation"),
+                    "id": pointer_key,
+                    "action": "merged",
+                    "mem0_memory_id": str(record.id),
+                    "merged_into": str(kept.id),
+                    "memory": payload.get("data"),
+                    "agent_id": user_id,
+                    "chat_id": chat_id,
+                    "capsule_id": capsule_id,
+                })
+            await asyncio.to_thread(
+                self.qdrant.client.delete,
+                collection_name=MEM0_COLLECTION,
+                points_selector=qm.PointIdsList(points=[r.id for r in drop]),
+                wait=True,
+            )
+            self.qdrant.set_payload(MEM0_COLLECTION, kept.id, {
+                "consolidated_count": int(kept_payload.get("consolidated_count") or 0) + len(drop),
+                "consolidated_at": run_at,
+            })
+            stats.clusters += 1
+            stats.dropped += len(drop)
+            await self._throttle(len(drop))
+
+    async def run_once(self) -> ConsolidationStats:
+        stats = ConsolidationStats()
+        if not self.qdrant.client.collection_exists(MEM0_COLLECTION):
+            return stats
+
+        watermark = self.get_watermark()
+        by_scope = await self._new_memories_by_scope(watermark, stats)
+        stats.scopes = len(by_scope)
+        for scope, new_ids in by_scope.items():
+            try:
+                await self._consolidate_scope(scope, new_ids, stats)
+            except Exception as e:
+                # Keep the old watermark so the failed scope is retried next run
+                stats.errors.append(f"{scope[0]}/{scope[1]}: {e}")
+
+        if stats.watermark and not stats.errors:
+            self._set_watermark(stats.watermark, stats)
+        logger.info(
+            "memory consolidation scanned=%d scopes=%d clusters=%d dropped=%d errors=%d",
+            stats.scanned, stats.scopes, stats.clusters, stats.dropped, len(stats.errors),
+        )
+        return stats
+
+
+async def consolidation_loop() -> None:
+    """Run consolidation every MEMORY_CONSOLIDATION_INTERVAL_SECONDS until cancelled."""
+    while True:
+        await asyncio.sleep(settings.MEMORY_CONSOLIDATION_INTERVAL_SECONDS)
+        try:
+            await MemoryConsolidationService().run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Memory consolidation failed: {e}")
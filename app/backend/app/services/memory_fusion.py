@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from app.core.config import settings
+from app.core.tokens import count_tokens
+from app.models.schemas import Message
+
+# Standard RRF damping constant; keeps a single top rank from dominating.
+RRF_K = 60
+
+# Memory context budget relative to MEMORY_CONTEXT_TOKEN_BUDGET, per chat memory_size.
+_BUDGET_SCALE = {"Small": 0.5, "Medium": 1.0, "Large": 2.0}
+
+# Longest single recalled snippet, so one message cannot take the whole budget.
+_MAX_ITEM_WORDS = 120
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+
+def _truncate_words(text: str, max_words: int) -> str:
+    words = text.split()
+    if len(words) <= max_words:
+        return text
+    return " ".join(words[:max_words]) + "..."
+
+
+@dataclass
+class RecallItem:
+    """One retrieved snippet; `key` identifies it across sources for fusion."""
+
+    key: str
+    text: str
+    source: str  # "mem0" | "messages"
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[List[RecallItem]], k: int = RRF_K) -> List[RecallItem]:
+    """Fuse best-first lists: score = sum(1 / (k + rank)) over the lists an item appears in."""
+    scores: Dict[str, float] = {}
+    items: Dict[str, RecallItem] = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked, start=1):
+            scores[item.key] = scores.get(item.key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item.key, item)
+    return [items[key] for key in sorted(scores, key=lambda key: scores[key], reverse=True)]
+
+
+def token_budget(memory_size: str) -> int:
+    return int(settings.MEMORY_CONTEXT_TOKEN_BUDGET * _BUDGET_SCALE.get(memory_size, 1.0))
+
+
+def mem0_items(memories: List[Dict]) -> List[RecallItem]:
+    out: List[RecallItem] = []
+    for mem in memories or []:
+        text = str(mem.get("memory") or "").strip()
+        if text:
+            # Keyed by text so the same fact from both sources fuses into one item
+            out.append(RecallItem(key=_normalize(text), text=text, source="mem0"))
+    return out
+
+
+def message_items(messages: List[Message]) -> List[RecallItem]:
+    out: List[RecallItem] = []
+    for msg in messages or []:
+        text = (msg.content or "").strip()
+        if not text:
+            continue
+        role = msg.role.value if hasattr(msg.role, "value") else str(msg.role)
+        snippet = _truncate_words(text, _MAX_ITEM_WORDS)
+        out.append(RecallItem(key=_normalize(text), text=f"({role}, earlier) {snippet}", source="messages"))
+    return out
+
+
+def fuse_memory_context(
+    ranked_lists: Sequence[List[RecallItem]],
+    history: List[Dict[str, str]],
+    memory_size: str = "Medium",
+    budget: Optional[int] = None,
+) -> str:
+    """
+    RRF-fuse retrieval results, drop anything already in the prompt history,
+    and keep the best items that fit the token budget.
+    """
+    in_history = {_normalize(str(m.get("content") or "")) for m in history}
+    budget = token_budget(memory_size) if budget is None else budget
+
+    lines: List[str] = []
+    used = 0
+    for item in reciprocal_rank_fusion(ranked_lists):
+        if item.key in in_history:
+            continue
+        line = f"- {item.text}"
+        cost = count_tokens(line)
+        if used + cost > budget:
+            continue
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+ChatKey = Tuple[str, str, Optional[str]]  # (agent_id, chat_id, capsule_id)
+
+
+@dataclass
+class _HotEntry:
+    query: np.ndarray  # unit vector of the query that filled the entry
+    hits: List[qm.ScoredPoint]
+    vectors: np.ndarray  # unit vectors of `hits`
+    filled_at: float
+
+
+class HotMemoryCache:
+    """
+    In-process LRU of each active chat's last over-fetched memory candidates (with vectors).
+
+    A new query is answered locally when it is close to the query that filled the entry
+    (MEMORY_HOT_CACHE_QUERY_SIMILARITY): the over-fetched neighbourhood then also covers it.
+    Entries expire after MEMORY_HOT_CACHE_TTL_SECONDS. Memories a chat writes are merged
+    into its entries (`merge`); entries are dropped when memories are deleted or consolidated.
+    """
+
+    def __init__(self, max_chats: int) -> None:
+        self.max_chats = max_chats
+        self._entries: "OrderedDict[ChatKey, _HotEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key: ChatKey, query_unit: np.ndarray) -> Optional[List[qm.ScoredPoint]]:
+        """Cached candidates re-scored against the new query, or None when not confident."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.filled_at > settings.MEMORY_HOT_CACHE_TTL_SECONDS:
+                del self._entries[key]
+                return None
+            if float(entry.query @ query_unit) < settings.MEMORY_HOT_CACHE_QUERY_SIMILARITY:
+                return None
+            self._entries.move_to_end(key)
+
+        if not entry.hits:
+            return []
+        scores = entry.vectors @ query_unit
+        return [
+            hit.model_copy(update={"score": float(score)})
+            for hit, score in zip(entry.hits, scores)
+            if score >= settings.MEMORY_MIN_SCORE
+        ]
+
+    def fill(self, key: ChatKey, query_unit: np.ndarray, hits: List[qm.ScoredPoint]) -> None:
+        if self.max_chats <= 0:
+            return
+        vectors = np.array([h.vector for h in hits], dtype=np.float32) if hits else np.zeros((0, len(query_unit)))
+        entry = _HotEntry(query=query_unit, hits=hits, vectors=unit_vectors(vectors), filled_at=time.monotonic())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_chats:
+                self._entries.popitem(last=False)
+
+    def merge(
+        self,
+        agent_id: str,
+        chat_id: str,
+        points: Sequence[Union[qm.Record, qm.PointStruct]] = (),
+        removed: Iterable[str] = (),
+    ) -> None:
+        """
+        Fold a chat's newly written memories (with vectors) into its cached candidates,
+        replacing older versions of the same ids, and drop `removed` ids. Scores are
+        recomputed on lookup, so new points enter unscored.
+        """
+        points = [p for p in points if isinstance(p.vector, list) and p.vector]
+        replaced = {str(p.id) for p in points} | {str(i) for i in removed}
+        if not replaced:
+            return
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key[0] != agent_id or key[1] != chat_id:
+                    continue
+                # A capsule chat's entry only covers memories tagged with that capsule
+                added = [p for p in points if key[2] is None or (p.payload or {}).get("capsule_id") == key[2]]
+                keep = [i for i, h in enumerate(entry.hits) if str(h.id) not in replaced]
+                hits = [entry.hits[i] for i in keep] + [
+                    qm.ScoredPoint(id=p.id, version=0, score=0.0, payload=p.payload, vector=p.vector) for p in added
+                ]
+                vectors = entry.vectors[keep]
+                if added:
+                    vectors = np.vstack([vectors, unit_vectors(np.array([p.vector for p in added], dtype=np.float32))])
+                self._entries[key] = _HotEntry(query=entry.query, hits=hits, vectors=vectors, filled_at=entry.filled_at)
+
+    def invalidate(self, agent_id: Optional[str] = None, chat_id: Optional[str] = None) -> None:
+        """Drop entries of a chat (agent_id + chat_id), of an agent (agent_id only), or all."""
+        with self._lock:
+            for key in list(self._entries):
+                if (agent_id is None or key[0] == agent_id) and (chat_id is None or key[1] == chat_id):
+                    del self._entries[key]
+
+
+hot_cache = HotMemoryCache(settings.MEMORY_HOT_CACHE_MAX_CHATS)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.core.tokens import count_tokens
+from app.services.embedding_service import EmbeddingService
+from app.services.memory_fusion import token_budget
+from app.services.memory_hot_cache import ChatKey, hot_cache, unit_vectors
+from app.services.memory_service import MEM0_COLLECTION
+from app.services.qdrant_service import get_qdrant_service
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def recency_decay(payload: Dict[str, Any], now: datetime, half_life_days: float) -> float:
+    """exp(-ln2 * age / half_life) from updated_at/created_at; 1.0 when undated."""
+    ts = _parse_ts(payload.get("updated_at")) or _parse_ts(payload.get("created_at"))
+    if ts is None or half_life_days <= 0:
+        return 1.0
+    age_days = max(0.0, (now - ts).total_seconds() / 86400.0)
+    return math.exp(-math.log(2) * age_days / half_life_days)
+
+
+def mmr_order(relevance: np.ndarray, vectors: np.ndarray, lam: float) -> List[int]:
+    """
+    Maximal marginal relevance: greedily pick the item maximizing
+    lam * relevance - (1 - lam) * max cosine similarity to what is already picked.
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    unit = unit_vectors(vectors)
+    sim = unit @ unit.T
+
+    selected: List[int] = []
+    remaining = np.ones(n, dtype=bool)
+    redundancy = np.zeros(n)
+    for _ in range(n):
+        scores = np.where(remaining, lam * relevance - (1.0 - lam) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, sim[best])
+    return selected
+
+
+@dataclass
+class RetrievalResult:
+    """Selected memories (mem0-shaped, best first) plus per-stage stats."""
+
+    memories: List[Dict[str, Any]]
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+class MemoryRetriever:
+    """
+    Reads `mem0_memories` directly instead of taking mem0's top-N as-is.
+
+    - Over-fetches MEMORY_RETRIEVAL_OVERFETCH candidates (with their vectors) above
+      MEMORY_MIN_SCORE cosine similarity.
+    - Re-scores them with exponential recency decay (MEMORY_RECENCY_HALF_LIFE_DAYS,
+      blended in by MEMORY_RECENCY_WEIGHT).
+    - Orders them with MMR (MEMORY_MMR_LAMBDA) so near-duplicates don't crowd the set.
+    - Keeps the best that fit the memory token budget for the chat's memory_size,
+      instead of a fixed 3/5/10.
+    - Consecutive turns of a chat are served from the in-process `hot_cache` when the
+      query stays on topic, skipping the Qdrant search.
+    """
+
+    def __init__(self) -> None:
+        self.qdrant = get_qdrant_service()
+        self.embedder = EmbeddingService()
+
+    @staticmethod
+    def _scope_filter(agent_id: str, chat_id: str, capsule_id: Optional[str]) -> qm.Filter:
+        must = [
+            qm.FieldCondition(key="user_id", match=qm.MatchValue(value=agent_id)),
+            qm.FieldCondition(key="chat_id", match=qm.MatchValue(value=chat_id)),
+        ]
+        if capsule_id:
+            must.append(qm.FieldCondition(key="capsule_id", match=qm.MatchValue(value=capsule_id)))
+        return qm.Filter(must=must)
+
+    async def retrieve(
+        self,
+        agent_id: str,
+        chat_id: str,
+        query: str,
+        memory_size: str = "Medium",
+        capsule_id: Optional[str] = None,
+    ) -> RetrievalResult:
+        if not query:
+            return RetrievalResult(memories=[])
+
+        t0 = time.perf_counter()
+        vec = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        t1 = time.perf_counter()
+        key: ChatKey = (agent_id, chat_id, capsule_id)
+        query_unit = unit_vectors(np.asarray(vec, dtype=np.float32))
+        hits = hot_cache.lookup(key, query_unit)
+        source = "hot_cache"
+        if hits is None:
+            source = "qdrant"
+            if not self.qdrant.client.collection_exists(MEM0_COLLECTION):
+                return RetrievalResult(memories=[])
+            hits = self._search(vec, self._scope_filter(agent_id, chat_id, capsule_id))
+            hot_cache.fill(key, query_unit, hits)
+        t2 = time.perf_counter()
+        return self._select(hits, memory_size, source, chat_id, t0, t1, t2)
+
+    async def retrieve_capsule(
+        self,
+        capsule_id: str,
+        query: str,
+        memory_size: str = "Large",
+        agent_id: Optional[str] = None,
+    ) -> RetrievalResult:
+        """
+        A capsule's knowledge: memories tagged with `capsule_id` across all of its creator's
+        capsule chats (restricted to the capsule's agent when known). Skips the hot cache,
+        which is per chat; repeated capsule prompts are cached as answers instead.
+        """
+        if not query:
+            return RetrievalResult(memories=[])
+
+        t0 = time.perf_counter()
+        vec = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        t1 = time.perf_counter()
+        if not self.qdrant.client.collection_exists(MEM0_COLLECTION):
+            return RetrievalResult(memories=[])
+        must = [qm.FieldCondition(key="capsule_id", match=qm.MatchValue(value=capsule_id))]
+        if agent_id:
+            must.append(qm.FieldCondition(key="user_id", match=qm.MatchValue(value=agent_id)))
+        # Off the event loop so it overlaps with whatever the caller runs alongside (payment checks)
+        hits = await asyncio.to_thread(self._search, vec, qm.Filter(must=must))
+        t2 = time.perf_counter()
+        return self._select(hits, memory_size, "qdrant", f"capsule:{capsule_id}", t0, t1, t2)
+
+    def _search(self, vec: List[float], qfilter: qm.Filter) -> List[qm.ScoredPoint]:
+        hits = self.qdrant.search(
+            MEM0_COLLECTION,
+            vector_name=None,
+            query_vector=vec,
+            qfilter=qfilter,
+            limit=settings.MEMORY_RETRIEVAL_OVERFETCH,
+            score_threshold=settings.MEMORY_MIN_SCORE,
+            with_vectors=True,
+        )
+        return [h for h in hits if h.vector is not None]
+
+    def _select(
+        self,
+        hits: List[qm.ScoredPoint],
+        memory_size: str,
+        source: str,
+        scope: str,
+        t0: float,
+        t1: float,
+        t2: float,
+    ) -> RetrievalResult:
+        """Recency re-score, MMR order and token-budget cut; `t0..t2` are embed/search timestamps."""
+        candidates = [h for h in hits if (h.payload or {}).get("data") and h.vector is not None]
+        memories: List[Dict[str, Any]] = []
+        scored: List[Dict[str, Any]] = []
+        used = 0
+        budget = token_budget(memory_size)
+        if candidates:
+            # Sort first: every array below is indexed in this order
+            candidates.sort(key=lambda h: h.score, reverse=True)
+            now = datetime.now(timezone.utc)
+            weight = min(1.0, max(0.0, settings.MEMORY_RECENCY_WEIGHT))
+            similarity = np.array([h.score for h in candidates], dtype=np.float64)
+            decay = np.array(
+                [recency_decay(h.payload or {}, now, settings.MEMORY_RECENCY_HALF_LIFE_DAYS) for h in candidates]
+            )
+            relevance = similarity * (1.0 - weight + weight * decay)
+            vectors = np.array([h.vector for h in candidates], dtype=np.float32)
+
+            for i in mmr_order(relevance, vectors, settings.MEMORY_MMR_LAMBDA):
+                hit = candidates[i]
+                text = str(hit.payload["data"])
+                cost = count_tokens(f"- {text}")
+                if used + cost > budget:
+                    continue
+                used += cost
+                memories.append({"id": str(hit.id), "memory": text, "score": float(relevance[i])})
+                scored.append({
+                    "id": str(hit.id),
+                    "similarity": round(float(similarity[i]), 4),
+                    "recency": round(float(decay[i]), 4),
+                    "score": round(float(relevance[i]), 4),
+                })
+        t3 = time.perf_counter()
+
+        stats = {
+            "source": source,
+            "candidates": len(candidates),
+            "selected": len(memories),
+            "tokens": used,
+            "budget": budget,
+            "timings_ms": {
+                "embed": round((t1 - t0) * 1000, 2),
+                "search": round((t2 - t1) * 1000, 2),
+                "rerank": round((t3 - t2) * 1000, 2),
+            },
+            "scores": scored,
+        }
+        logger.info(
+            "memory retrieval scope=%s source=%s candidates=%d selected=%d tokens=%d/%d embed=%.1fms search=%.1fms rerank=%.1fms",
+            scope, source, stats["candidates"], stats["selected"], used, budget,
+            stats["timings_ms"]["embed"], stats["timings_ms"]["search"], stats["timings_ms"]["rerank"],
+        )
+        return RetrievalResult(memories=memories, stats=stats)
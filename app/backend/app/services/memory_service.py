@@ -1,15 +1,31 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import logging
+import uuid
 
 from qdrant_client.http import models as qm
 
 from app.core.config import settings
+from app.services.memory_hot_cache import hot_cache
 from app.services.qdrant_service import get_qdrant_service, make_base_payload
 
 logger = logging.getLogger(__name__)
 
+# Qdrant collection mem0 stores its memory vectors in
+MEM0_COLLECTION = "mem0_memories"
+
+_indexes_ready = False
+
+
+def _result_items(result: Any) -> List[Dict[str, Any]]:
+    """Memory items of a mem0 `add` result (`{"results": [...]}`, a list, or a single item)."""
+    if isinstance(result, dict):
+        result = result["results"] if isinstance(result.get("results"), list) else [result]
+    if not isinstance(result, list):
+        return []
+    return [item for item in result if isinstance(item, dict)]
+
 
 class MemoryService:
     """
@@ -45,7 +61,7 @@ class MemoryService:
             "vector_store": {
                 "provider": "qdrant",
                 "config": {
-                    "collection_name": "mem0_memories",
+                    "collection_name": MEM0_COLLECTION,
                     "url": settings.QDRANT_URL,
                     "api_key": settings.QDRANT_API_KEY or None,
                     "embedding_model_dims": settings.QDRANT_MESSAGE_VECTOR_SIZE,
@@ -71,6 +87,20 @@ class MemoryService:
             self.memory = Memory.from_config(config)
         except Exception:
             self.memory = None
+            return
+        self._ensure_indexes()
+
+    @staticmethod
+    def _ensure_indexes() -> None:
+        """mem0 creates its collection on init, after startup ran; index the filter fields once it exists."""
+        global _indexes_ready
+        if _indexes_ready:
+            return
+        try:
+            get_qdrant_service().ensure_payload_indexes(MEM0_COLLECTION)
+            _indexes_ready = True
+        except Exception as e:
+            logger.warning(f"Could not index {MEM0_COLLECTION}: {e}")
 
     def _is_available(self) -> bool:
         return self.memory is not None
@@ -99,6 +129,28 @@ class MemoryService:
         except Exception:
             return []
 
+    @staticmethod
+    def _update_hot_cache(agent_id: str, chat_id: str, items: List[Dict[str, Any]]) -> None:
+        """
+        Apply an add's ADD/UPDATE/DELETE events to the chat's cached candidates;
+        NONE (nothing changed) leaves them as they are.
+        """
+        changed = [str(i["id"]) for i in items if i.get("id") and i.get("event") in ("ADD", "UPDATE")]
+        removed = [str(i["id"]) for i in items if i.get("id") and i.get("event") == "DELETE"]
+        if any(i.get("event") is None for i in items):
+            # No event info: the cached set can't be patched reliably
+            hot_cache.invalidate(agent_id, chat_id)
+            return
+        if not changed and not removed:
+            return
+        try:
+            points = get_qdrant_service().get_by_ids(MEM0_COLLECTION, changed, with_vectors=True)
+        except Exception:
+            hot_cache.invalidate(agent_id, chat_id)
+            return
+        # Ids that could not be re-read are dropped rather than left stale
+        hot_cache.merge(agent_id, chat_id, points, removed=changed + removed)
+
     def store_chat_memory(
         self,
         agent_id: str,
@@ -117,19 +169,15 @@ class MemoryService:
                 metadata["capsule_id"] = capsule_id
 
             result = self.memory.add(messages=messages, user_id=agent_id, metadata=metadata)  # type: ignore[misc]
+            items = _result_items(result)
+            self._update_hot_cache(agent_id, chat_id, items)
 
             # Persist "pointer" records to Qdrant for traceability/linkage
             mem_ids: List[str] = []
-            if isinstance(result, dict):
-                mid = result.get("id") or result.get("memory_id")
+            for item in items:
+                mid = item.get("id") or item.get("memory_id")
                 if mid:
                     mem_ids.append(str(mid))
-            elif isinstance(result, list):
-                for item in result:
-                    if isinstance(item, dict):
-                        mid = item.get("id") or item.get("memory_id")
-                        if mid:
-                            mem_ids.append(str(mid))
 
             if mem_ids:
                 qdrant = get_qdrant_service()
@@ -159,31 +207,92 @@ class MemoryService:
                 lines.append(f"- {text}")
         return "\n".join(lines)
 
+    @staticmethod
+    def _chat_filter(agent_id: str, chat_id: str, capsule_id: Optional[str] = None) -> qm.Filter:
+        must = [
+            qm.FieldCondition(key="user_id", match=qm.MatchValue(value=agent_id)),
+            qm.FieldCondition(key="chat_id", match=qm.MatchValue(value=chat_id)),
+        ]
+        if capsule_id:
+            must.append(qm.FieldCondition(key="capsule_id", match=qm.MatchValue(value=capsule_id)))
+        return qm.Filter(must=must)
+
+    @staticmethod
+    def _memory_from_record(record: qm.Record) -> Dict[str, Any]:
+        payload = record.payload or {}
+        return {
+            "id": str(record.id),
+            "memory": payload.get("data", ""),
+            "hash": payload.get("hash"),
+            "created_at": payload.get("created_at"),
+            "updated_at": payload.get("updated_at"),
+            "user_id": payload.get("user_id"),
+            "metadata": {
+                k: payload.get(k)
+                for k in ("chat_id", "agent_id", "capsule_id", "source")
+                if payload.get(k) is not None
+            },
+        }
+
+    def list_chat_memories(
+        self,
+        agent_id: str,
+        chat_id: str,
+        capsule_id: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        One page of a chat's memories, scrolled straight from `mem0_memories` by metadata filter
+        (no embedding call; works for both memory engines). Returns (memories, next_cursor).
+        """
+        offset: Optional[qm.PointId] = None
+        if cursor:
+            # Cursors are Qdrant point ids (UUID or unsigned int)
+            offset = int(cursor) if cursor.isdigit() else str(uuid.UUID(cursor))
+
+        qdrant = get_qdrant_service()
+        if not qdrant.client.collection_exists(MEM0_COLLECTION):
+            return [], None
+        records, next_offset = qdrant.query_by_filter(
+            MEM0_COLLECTION,
+            qfilter=self._chat_filter(agent_id, chat_id, capsule_id),
+            limit=limit,
+            offset=offset,
+        )
+        memories = [self._memory_from_record(r) for r in records]
+        return memories, (str(next_offset) if next_offset is not None else None)
+
     def get_all_chat_memories(
         self,
         agent_id: str,
         chat_id: str,
         capsule_id: Optional[str] = None,
     ) -> List[Dict]:
-        if not self._is_available():
-            return []
+        out: List[Dict] = []
+        cursor: Optional[str] = None
         try:
-            metadata = {"chat_id": chat_id, "agent_id": agent_id}
-            if capsule_id:
-                metadata["capsule_id"] = capsule_id
-            # Open-source mem0 doesn't guarantee a get_all API; use a broad search.
-            return self.memory.search(query="", user_id=agent_id, metadata=metadata, limit=100)  # type: ignore[misc]
+            while True:
+                page, cursor = self.list_chat_memories(agent_id, chat_id, capsule_id, limit=256, cursor=cursor)
+                out.extend(page)
+                if not cursor:
+                    return out
         except Exception:
-            return []
+            return out
 
     def delete_chat_memories(self, agent_id: str, chat_id: str) -> bool:
-        """
-        Best-effort:
-        - Delete pointer records (always possible).
-        - Actual mem0 memory deletion depends on mem0 capabilities.
-        """
+        """Delete a chat's memory vectors and pointer records by filter."""
+        hot_cache.invalidate(agent_id, chat_id)
+        qdrant = get_qdrant_service()
+        deleted = False
+        try:
+            if qdrant.client.collection_exists(MEM0_COLLECTION):
+                qdrant.delete_by_filter(MEM0_COLLECTION, self._chat_filter(agent_id, chat_id))
+            deleted = True
+        except Exception as e:
+            logger.warning(f"mem0 memory deletion failed for chat {chat_id}: {e}")
+
         try:
-            qdrant = get_qdrant_service()
             qdrant.delete_by_filter(
                 "mem0_pointers",
                 qm.Filter(
@@ -195,7 +304,28 @@ class MemoryService:
             )
         except Exception:
             pass
+        return deleted
 
-        # mem0 OSS delete-by-metadata is not guaranteed; keep behavior non-fatal.
-        return False
+    def delete_agent_memories(self, agent_id: str) -> bool:
+        """Delete every memory vector and pointer of an agent, including ones orphaned by earlier chat deletes."""
+        hot_cache.invalidate(agent_id)
+        qdrant = get_qdrant_service()
+        deleted = False
+        try:
+            if qdrant.client.collection_exists(MEM0_COLLECTION):
+                qdrant.delete_by_filter(
+                    MEM0_COLLECTION,
+                    qm.Filter(must=[qm.FieldCondition(key="user_id", match=qm.MatchValue(value=agent_id))]),
+                )
+            deleted = True
+        except Exception as e:
+            logger.warning(f"mem0 memory deletion failed for agent {agent_id}: {e}")
 
+        try:
+            qdrant.delete_by_filter(
+                "mem0_pointers",
+                qm.Filter(must=[qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id))]),
+            )
+        except Exception:
+            pass
+        return deleted
@@ -132,15 +132,20 @@ class MessageService:
         wallet: str,
         query: str,
         k: int = 5,
+        across_chats: bool = False,
     ) -> List[Message]:
+        """
+        Messages most similar to `query`, best first.
+        Always scoped to `wallet`; with `across_chats` the search covers the agent's
+        other chats for it (the current chat is already in the prompt history).
+        """
         vec = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
-        qfilter = qm.Filter(
-            must=[
-                qm.FieldCondition(key="chat_id", match=qm.MatchValue(value=chat_id)),
-                qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id)),
-                qm.FieldCondition(key="wallet", match=qm.MatchValue(value=wallet)),
-            ]
-        )
+        must = [
+            qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id)),
+            qm.FieldCondition(key="wallet", match=qm.MatchValue(value=wallet)),
+        ]
+        this_chat = qm.FieldCondition(key="chat_id", match=qm.MatchValue(value=chat_id))
+        qfilter = qm.Filter(must=must, must_not=[this_chat]) if across_chats else qm.Filter(must=must + [this_chat])
         hits = self.qdrant.search(
             self.COLLECTION,
             vector_name=QdrantService.MESSAGE_VECTOR_NAME,
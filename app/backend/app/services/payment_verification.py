@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+import logging
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.qdrant_service import get_qdrant_service, make_base_payload
+from app.services.solana_rpc import SolanaRPCError, get_solana_rpc
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "payment_signatures"
+
+VERIFIED = "verified"
+FAILED = "failed"
+
+_TX_CONFIG = {"encoding": "json", "maxSupportedTransactionVersion": 0}
+
+Payment = Tuple[str, str, str, int]  # (signature, sender, recipient, min_lamports)
+
+
+class PaymentReplayError(Exception):
+    """The payment signature has already paid for a query."""
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _record_id(signature: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"payment_signature:{signature}"))
+
+
+def _facts_of(tx: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    What a getTransaction result settles: its verdict, fee payer and the lamports each
+    account gained. None while the transaction isn't visible yet.
+    """
+    if not tx:
+        return None
+    meta = tx.get("meta")
+    if not meta or meta.get("err"):
+        return {"verdict": FAILED}
+    keys = list(((tx.get("transaction") or {}).get("message") or {}).get("accountKeys") or [])
+    # v0 transactions list lookup-table accounts after the static keys, writable first
+    loaded = meta.get("loadedAddresses") or {}
+    keys += list(loaded.get("writable") or []) + list(loaded.get("readonly") or [])
+    pre, post = meta.get("preBalances") or [], meta.get("postBalances") or []
+    credits: Dict[str, int] = {}
+    for key, before, after in zip(keys, pre, post):
+        if int(after) > int(before):
+            credits[str(key)] = credits.get(str(key), 0) + int(after) - int(before)
+    return {"verdict": VERIFIED, "fee_payer": str(keys[0]) if keys else None, "credits": credits}
+
+
+def _pays(record: Optional[Dict[str, Any]], sender: str, recipient: str, min_lamports: int) -> bool:
+    """Whether a stored transaction succeeded, was paid for by `sender` and credited `recipient` enough."""
+    if record is None or record.get("verdict") != VERIFIED:
+        return False
+    if record.get("fee_payer") != sender:
+        return False
+    return int((record.get("credits") or {}).get(recipient, 0)) >= min_lamports
+
+
+class PaymentVerifier:
+    """
+    Verified-signature store for capsule payments.
+
+    - Verdicts are final once a transaction is visible, so they are kept in an in-process
+      LRU (PAYMENT_VERDICT_CACHE_SIZE) backed by the `payment_signatures` collection
+      (point id = uuid5 of the signature); repeat checks never hit the RPC. The record keeps
+      the transaction's fee payer and per-account credits, so every check is matched against
+      the parties and amount it claims.
+    - Signatures not found on chain yet are not remembered; the next attempt asks again.
+    - Concurrent checks of one signature share a single `getTransaction`; checks of different
+      signatures go out together through the micro-batching RPC client (`verify_many`
+      sends one batch explicitly).
+    - `claim()` binds a verified signature to the query it paid for and rejects any reuse;
+      `release()` undoes a claim whose query could not be answered. Both read the shared
+      record; replay protection is exact on a single worker (see `claim`).
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    # ------------------------------------------------------------------
+    # Store
+    # ------------------------------------------------------------------
+
+    def _remember(self, signature: str, record: Dict[str, Any]) -> None:
+        self._records[signature] = record
+        self._records.move_to_end(signature)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+    def _lookup(self, signature: str) -> Optional[Dict[str, Any]]:
+        record = self._records.get(signature)
+        if record is not None:
+            self._records.move_to_end(signature)
+            return record
+        return self._stored(signature)
+
+    def _stored(self, signature: str) -> Optional[Dict[str, Any]]:
+        """The shared record, bypassing the LRU (another worker may have changed it)."""
+        stored = get_qdrant_service().get_by_id(COLLECTION, _record_id(signature))
+        if not stored or not stored.payload:
+            return None
+        self._remember(signature, dict(stored.payload))
+        return self._records[signature]
+
+    def _save(self, signature: str, record: Dict[str, Any]) -> None:
+        self._remember(signature, record)
+        get_qdrant_service().upsert_record(COLLECTION, _record_id(signature), record)
+
+    def _new_record(self, signature: str, facts: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            **make_base_payload("payment_signature"),
+            "id": signature,
+            "signature": signature,
+            **facts,
+            "checked_at": _utc_now_iso(),
+            "consumed": False,
+        }
+
+    # ------------------------------------------------------------------
+    # Verification
+    # ------------------------------------------------------------------
+
+    async def verify(self, signature: str, sender: str, recipient: str, min_lamports: int) -> bool:
+        """Whether `signature` is a successful transaction from `sender` crediting `recipient` >= `min_lamports`."""
+        return _pays(await self._transaction(signature), sender, recipient, min_lamports)
+
+    async def _transaction(self, signature: str) -> Optional[Dict[str, Any]]:
+        record = self._lookup(signature)
+        if record is not None:
+            return record
+
+        inflight = self._inflight.get(signature)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # this waiter itself was cancelled
+                # The fetching request went away; fetch it here instead
+                return await self._transaction(signature)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[signature] = future
+        try:
+            try:
+                tx = await get_solana_rpc().call("getTransaction", [signature, _TX_CONFIG])
+            except Exception as e:
+                logger.warning(f"Payment lookup failed for {signature[:16]}…: {e}")
+                tx = None
+            facts = _facts_of(tx)
+            if facts is not None:
+                record = self._new_record(signature, facts)
+                self._save(signature, record)
+            future.set_result(record)
+            return record
+        finally:
+            self._inflight.pop(signature, None)
+            if not future.done():
+                future.cancel()
+
+    async def verify_many(self, payments: Sequence[Payment]) -> Dict[str, bool]:
+        """Results for several payments; signatures not seen before are fetched in one RPC batch."""
+        records: Dict[str, Optional[Dict[str, Any]]] = {}
+        unknown: List[str] = []
+        for signature, _, _, _ in payments:
+            if signature in records:
+                continue
+            records[signature] = self._lookup(signature)
+            if records[signature] is None:
+                unknown.append(signature)
+        if unknown:
+            try:
+                results = await get_solana_rpc().batch(
+                    [("getTransaction", [signature, _TX_CONFIG]) for signature in unknown]
+                )
+            except Exception as e:
+                logger.warning(f"Batched payment lookup failed: {e}")
+                results = [None] * len(unknown)
+            for signature, tx in zip(unknown, results):
+                facts = None if isinstance(tx, SolanaRPCError) else _facts_of(tx)
+                if facts is not None:
+                    records[signature] = self._new_record(signature, facts)
+                    self._save(signature, records[signature])
+        return {
+            signature: _pays(records[signature], sender, recipient, min_lamports)
+            for signature, sender, recipient, min_lamports in payments
+        }
+
+    def claim(self, signature: str, sender: str, recipient: str, amount: float, capsule_id: str) -> None:
+        """
+        Mark a verified signature as spent on this query. Raises PaymentReplayError if it
+        already paid for one.
+
+        The spent flag is read from `payment_signatures`, not the LRU, and the claim is
+        re-read after writing to check that it was not overwritten. Check and mark happen
+        without an await in between, so replay protection is exact within one process.
+        Qdrant has no compare-and-set, so across several API workers two claims racing
+        within the same few milliseconds can both succeed: run a single worker where that
+        matters.
+        """
+        record = self._stored(signature)
+        if record is None or record.get("verdict") != VERIFIED:
+            raise ValueError("Payment signature has not been verified")
+        if record.get("consumed"):
+            raise PaymentReplayError("Payment signature has already been used")
+        claim_id = str(uuid.uuid4())
+        self._save(signature, {
+            **record,
+            "consumed": True,
+            "consumed_at": _utc_now_iso(),
+            "claim_id": claim_id,
+            "sender": sender,
+            "recipient": recipient,
+            "amount": float(amount),
+            "capsule_id": capsule_id,
+        })
+        current = self._stored(signature)
+        if current is None or current.get("claim_id") != claim_id:
+            raise PaymentReplayError("Payment signature has already been used")
+
+    def release(self, signature: str) -> None:
+        """Undo a claim whose query was not answered, so the payment can be used for a retry."""
+        record = self._stored(signature)
+        if record is None or not record.get("consumed"):
+            return
+        record = {**record, "consumed": False, "released_at": _utc_now_iso()}
+        for key in ("consumed_at", "claim_id", "sender", "recipient", "amount", "capsule_id"):
+            record.pop(key, None)
+        self._save(signature, record)
+
+_verifier: Optional[PaymentVerifier] = None
+
+
+def get_payment_verifier() -> PaymentVerifier:
+    global _verifier
+    if _verifier is None:
+        _verifier = PaymentVerifier(settings.PAYMENT_VERDICT_CACHE_SIZE)
+    return _verifier
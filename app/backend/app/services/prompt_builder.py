@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+LENGTH_INSTRUCTION = (
+    "Please keep your responses concise and aim for approximately 100 words. "
+    "Complete your thoughts naturally within this limit."
+)
+DEFAULT_SYSTEM_PROMPT = f"You are a helpful assistant. {LENGTH_INSTRUCTION}"
+WEB_SEARCH_INSTRUCTION = (
+    "You are a web-enabled research assistant. Use the following web results to answer the question "
+    "accurately. Do NOT hallucinate. Base answers strictly on the data provided."
+)
+
+# Model prefixes (OpenRouter ids) that honour explicit `cache_control` breakpoints.
+# OpenAI/DeepSeek/Grok cache prompt prefixes automatically and need no hints.
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
+
+@dataclass
+class PromptContext:
+    """Volatile, per-turn context injected after the stable prompt prefix."""
+
+    memory_context: str = ""
+    web_search_context: str = ""
+    # Retrieval instrumentation (scores, timings); not part of the prompt
+    memory_stats: Dict[str, Any] = field(default_factory=dict)
+
+    def is_empty(self) -> bool:
+        return not self.memory_context and not self.web_search_context
+
+
+def supports_cache_control(model: Optional[str]) -> bool:
+    return bool(model) and str(model).lower().startswith(CACHE_CONTROL_MODEL_PREFIXES)
+
+
+def _with_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    content = message.get("content")
+    if isinstance(content, list):
+        blocks = [dict(b) for b in content]
+    else:
+        blocks = [{"type": "text", "text": content or ""}]
+    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return {**message, "content": blocks}
+
+
+def _format_context(context: PromptContext) -> str:
+    sections: List[str] = []
+    if context.web_search_context:
+        sections.append(f"{WEB_SEARCH_INSTRUCTION}\n\nWeb results:\n{context.web_search_context}")
+    if context.memory_context:
+        sections.append(f"Relevant context from memory:\n{context.memory_context}")
+    return "\n\n".join(sections)
+
+
+def build_prompt(
+    messages: List[Dict[str, Any]],
+    context: Optional[PromptContext] = None,
+    model: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Build provider messages with a stable prefix so provider-side prompt caching can hit.
+
+    Layout (stable first, volatile last):
+    1. system: agent persona (caller system messages) + fixed instructions
+    2. conversation history (unchanged between turns apart from new messages)
+    3. final user turn, with web results / memory context placed in front of the question
+
+    Caller messages are never mutated. For models that support explicit cache
+    breakpoints, `cache_control` hints are added to the system prompt and to the
+    last history message.
+    """
+    context = context or PromptContext()
+
+    persona = [str(m.get("content") or "") for m in messages if m.get("role") == "system"]
+    conversation = [dict(m) for m in messages if m.get("role") != "system"]
+
+    if persona:
+        system_content = "\n\n".join(persona) + f"\n\n{LENGTH_INSTRUCTION}"
+    else:
+        system_content = DEFAULT_SYSTEM_PROMPT
+    system_message: Dict[str, Any] = {"role": "system", "content": system_content}
+
+    final_turn: Optional[Dict[str, Any]] = None
+    if conversation and conversation[-1].get("role") == "user":
+        final_turn = conversation.pop()
+
+    volatile = _format_context(context)
+    if volatile:
+        if final_turn is not None:
+            final_turn["content"] = f"{volatile}\n\n---\n\n{final_turn.get('content') or ''}"
+        else:
+            conversation.append({"role": "user", "content": volatile})
+
+    if supports_cache_control(model):
+        system_message = _with_cache_control(system_message)
+        if conversation:
+            conversation[-1] = _with_cache_control(conversation[-1])
+
+    out = [system_message] + conversation
+    if final_turn is not None:
+        out.append(final_turn)
+    return out
+
+
+def normalize_usage(raw: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Flatten an OpenAI/OpenRouter `usage` object, surfacing cached prompt tokens
+    (`prompt_tokens_details.cached_tokens`) as `cached_tokens`.
+    """
+    if not raw:
+        return None
+    details = raw.get("prompt_tokens_details") or {}
+    usage: Dict[str, Any] = {
+        "prompt_tokens": int(raw.get("prompt_tokens") or 0),
+        "completion_tokens": int(raw.get("completion_tokens") or 0),
+        "total_tokens": int(raw.get("total_tokens") or 0),
+        "cached_tokens": int(details.get("cached_tokens") or raw.get("cached_tokens") or 0),
+    }
+    if raw.get("cost") is not None:
+        usage["cost"] = raw["cost"]
+    return usage
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qm
@@ -20,6 +20,13 @@ class CollectionSpec:
     vectors: Dict[str, qm.VectorParams]
 
 
+@dataclass(frozen=True)
+class PayloadIndexSpec:
+    collection: str
+    field: str
+    schema: Union[qm.PayloadSchemaType, qm.TextIndexParams]
+
+
 class QdrantService:
     """
     Single persistence layer for the backend.
@@ -35,6 +42,8 @@ class QdrantService:
 
     MESSAGE_VECTOR_NAME = "content"
     CAPSULE_VECTOR_NAME = "description"
+    RESPONSE_CACHE_VECTOR_NAME = "prompt"
+    BLACKBOARD_VECTOR_NAME = "content"
 
     def __init__(self) -> None:
         if not settings.QDRANT_URL:
@@ -46,6 +55,7 @@ class QdrantService:
         # Fail loudly if unreachable and ensure collections exist.
         self.ping()
         self._ensure_collections()
+        self.ensure_payload_indexes()
 
     def ping(self) -> None:
         # Any request that hits the server is fine; collections is lightweight.
@@ -68,8 +78,73 @@ class QdrantService:
             CollectionSpec("capsules", {self.CAPSULE_VECTOR_NAME: cap}),
             CollectionSpec("staking", {self.DUMMY_VECTOR_NAME: dummy}),
             CollectionSpec("earnings", {self.DUMMY_VECTOR_NAME: dummy}),
+            # Verified payment signatures (verdict + the query each one paid for; payload-only)
+            CollectionSpec("payment_signatures", {self.DUMMY_VECTOR_NAME: dummy}),
             # Link mem0 memory IDs back to chats/agents (payload-only)
             CollectionSpec("mem0_pointers", {self.DUMMY_VECTOR_NAME: dummy}),
+            # Semantic response cache (vector = embedding of the final user message)
+            CollectionSpec("response_cache", {self.RESPONSE_CACHE_VECTOR_NAME: msg}),
+            # Daily token/latency rollups per agent, wallet and chat (payload-only)
+            CollectionSpec("usage_rollups", {self.DUMMY_VECTOR_NAME: dummy}),
+            # Workflow run state and step outputs keyed by input hash (payload-only)
+            CollectionSpec("workflow_runs", {self.DUMMY_VECTOR_NAME: dummy}),
+            CollectionSpec("workflow_step_cache", {self.DUMMY_VECTOR_NAME: dummy}),
+            # Shared memory between collaborating agents (vector = entry content)
+            CollectionSpec("blackboard", {self.BLACKBOARD_VECTOR_NAME: msg}),
+        ]
+
+    def _payload_index_specs(self) -> List[PayloadIndexSpec]:
+        keyword = qm.PayloadSchemaType.KEYWORD
+        integer = qm.PayloadSchemaType.INTEGER
+        float_ = qm.PayloadSchemaType.FLOAT
+        text = qm.TextIndexParams(
+            type=qm.TextIndexType.TEXT,
+            tokenizer=qm.TokenizerType.WORD,
+            lowercase=True,
+            min_token_len=2,
+        )
+        return [
+            PayloadIndexSpec("blackboard", "board_id", keyword),
+            PayloadIndexSpec("blackboard", "wallet", keyword),
+            PayloadIndexSpec("blackboard", "hash", keyword),
+            # Monotonic sequence; readers poll incrementally with seq > cursor
+            PayloadIndexSpec("blackboard", "seq", integer),
+            # Response cache lookups filter on the full key plus expiry
+            PayloadIndexSpec("response_cache", "agent_id", keyword),
+            PayloadIndexSpec("response_cache", "model", keyword),
+            PayloadIndexSpec("response_cache", "system_hash", keyword),
+            PayloadIndexSpec("response_cache", "config_hash", keyword),
+            PayloadIndexSpec("response_cache", "expires_at", float_),
+            # Marketplace: stake filter runs inside vector search; name/description back keyword matching
+            PayloadIndexSpec("capsules", "stake_amount", float_),
+            PayloadIndexSpec("capsules", "category", keyword),
+            # Capsule-by-agent lookups (staking) filter on owner + agent
+            PayloadIndexSpec("capsules", "creator_wallet", keyword),
+            PayloadIndexSpec("capsules", "agent_id", keyword),
+            # Browse filters and server-side sort keys (order_by requires an index)
+            PayloadIndexSpec("capsules", "reputation", float_),
+            PayloadIndexSpec("capsules", "price_per_query", float_),
+            PayloadIndexSpec("capsules", "query_count", integer),
+            PayloadIndexSpec("capsules", "rating", float_),
+            PayloadIndexSpec("capsules", "created_at", qm.PayloadSchemaType.DATETIME),
+            PayloadIndexSpec("capsules", "trending_score", float_),
+            PayloadIndexSpec("capsules", "name", text),
+            PayloadIndexSpec("capsules", "description", text),
+            # mem0 stores user_id=agent_id and metadata top-level; listing/deletes filter on them.
+            # The collection is created lazily by mem0 / the lite engine, which ensure these
+            # once it exists.
+            PayloadIndexSpec("mem0_memories", "user_id", keyword),
+            PayloadIndexSpec("mem0_memories", "chat_id", keyword),
+            # Paid capsule queries retrieve a capsule's memories across its chats
+            PayloadIndexSpec("mem0_memories", "capsule_id", keyword),
+            # Consolidation scans incrementally by created_at watermark
+            PayloadIndexSpec("mem0_memories", "created_at", qm.PayloadSchemaType.DATETIME),
+            # Usage reads sum every process's shard of a (scope, key, day)
+            PayloadIndexSpec("usage_rollups", "scope", keyword),
+            PayloadIndexSpec("usage_rollups", "key", keyword),
+            PayloadIndexSpec("usage_rollups", "day", keyword),
+            PayloadIndexSpec("mem0_pointers", "agent_id", keyword),
+            PayloadIndexSpec("mem0_pointers", "chat_id", keyword),
         ]
 
     def _ensure_collections(self) -> None:
@@ -81,6 +156,29 @@ class QdrantService:
                 vectors_config=spec.vectors,
             )
 
+    def ensure_payload_indexes(self, collection: Optional[str] = None) -> None:
+        """
+        Create missing payload indexes (only those of `collection` when given).
+        Collections that don't exist yet are skipped; call again once they do.
+        """
+        existing: Dict[str, Optional[set]] = {}
+        for spec in self._payload_index_specs():
+            if collection is not None and spec.collection != collection:
+                continue
+            if spec.collection not in existing:
+                if not self.client.collection_exists(spec.collection):
+                    existing[spec.collection] = None
+                    continue
+                info = self.client.get_collection(spec.collection)
+                existing[spec.collection] = set((info.payload_schema or {}).keys())
+            if existing[spec.collection] is None or spec.field in existing[spec.collection]:
+                continue
+            self.client.create_payload_index(
+                collection_name=spec.collection,
+                field_name=spec.field,
+                field_schema=spec.schema,
+            )
+
     # ---------------------------------------------------------------------
     # CRUD helpers
     # ---------------------------------------------------------------------
@@ -122,6 +220,16 @@ class QdrantService:
         )
         return records[0] if records else None
 
+    def get_by_ids(self, collection: str, ids: List[str], with_vectors: bool = False) -> List[qm.Record]:
+        if not ids:
+            return []
+        return self.client.retrieve(
+            collection_name=collection,
+            ids=ids,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+
     def query_by_filter(
         self,
         collection: str,
@@ -129,7 +237,9 @@ class QdrantService:
         limit: int = 100,
         offset: Optional[qm.PointId] = None,
         with_vectors: bool = False,
+        order_by: Optional[qm.OrderBy] = None,
     ) -> Tuple[List[qm.Record], Optional[qm.PointId]]:
+        """`order_by` needs a payload index on its key; Qdrant then returns no next offset."""
         points, next_offset = self.client.scroll(
             collection_name=collection,
             scroll_filter=qfilter,
@@ -137,9 +247,46 @@ class QdrantService:
             offset=offset,
             with_payload=True,
             with_vectors=with_vectors,
+            order_by=order_by,
         )
         return points, next_offset
 
+    def recommend_batch(
+        self,
+        collection: str,
+        vector_name: str,
+        positive_ids: List[str],
+        qfilter: Optional[qm.Filter],
+        limit: int = 10,
+    ) -> List[List[qm.ScoredPoint]]:
+        """One "more like this" query per id, in a single request; each id is excluded from its own results."""
+        if not positive_ids:
+            return []
+        requests = [
+            qm.RecommendRequest(positive=[pid], filter=qfilter, limit=limit, using=vector_name, with_payload=True)
+            for pid in positive_ids
+        ]
+        return self.client.recommend_batch(collection_name=collection, requests=requests)
+
+    def count(self, collection: str, qfilter: Optional[qm.Filter] = None) -> int:
+        return self.client.count(collection_name=collection, count_filter=qfilter, exact=True).count
+
+    def facet(
+        self,
+        collection: str,
+        key: str,
+        qfilter: Optional[qm.Filter] = None,
+        limit: int = 100,
+    ) -> List[qm.FacetValueHit]:
+        """Distinct values of a keyword-indexed payload field with their counts."""
+        return self.client.facet(
+            collection_name=collection,
+            key=key,
+            facet_filter=qfilter,
+            limit=limit,
+            exact=True,
+        ).hits
+
     def delete_by_filter(self, collection: str, qfilter: qm.Filter) -> None:
         self.client.delete(
             collection_name=collection,
@@ -157,18 +304,22 @@ class QdrantService:
     def search(
         self,
         collection: str,
-        vector_name: str,
+        vector_name: Optional[str],
         query_vector: List[float],
         qfilter: Optional[qm.Filter],
         limit: int = 10,
+        score_threshold: Optional[float] = None,
+        with_vectors: bool = False,
     ) -> List[qm.ScoredPoint]:
+        """`vector_name=None` searches a collection with a single unnamed vector (e.g. mem0_memories)."""
         return self.client.search(
             collection_name=collection,
-            query_vector=qm.NamedVector(name=vector_name, vector=query_vector),
+            query_vector=qm.NamedVector(name=vector_name, vector=query_vector) if vector_name else query_vector,
             query_filter=qfilter,
             limit=limit,
+            score_threshold=score_threshold,
             with_payload=True,
-            with_vectors=False,
+            with_vectors=with_vectors,
         )
 
 
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import hashlib
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.models.schemas import Agent
+from app.services.embedding_service import EmbeddingService
+from app.services.qdrant_service import QdrantService, get_qdrant_service, make_base_payload
+
+
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_BYPASS = "bypass"
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheLookup:
+    """
+    Result of a response cache lookup.
+    - status: hit | miss | bypass
+    - content: cached answer (hit only)
+    - vector: query embedding, reused when storing the fresh answer after a miss
+    """
+
+    status: str
+    content: Optional[str] = None
+    vector: Optional[List[float]] = None
+
+
+class ResponseCacheService:
+    """
+    Opt-in semantic response cache stored in the `response_cache` collection.
+
+    An entry is keyed by agent, model, a hash of the caller's system prompt and a
+    fingerprint of the agent config; the user message is matched by vector similarity
+    (RESPONSE_CACHE_SIMILARITY). Entries expire after the agent's TTL.
+
+    Only context-free prompts take part (a lone user message after the system prompt,
+    answered without memory or web context), so an answer can be reused across chats:
+    the FAQ / SDK case. Any prompt with history bypasses the cache entirely.
+    """
+
+    COLLECTION = "response_cache"
+
+    def __init__(self) -> None:
+        self.qdrant = get_qdrant_service()
+        self.embedder = EmbeddingService()
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_enabled(agent_config: Agent) -> bool:
+        return bool(agent_config.response_cache_enabled)
+
+    @staticmethod
+    def _ttl_seconds(agent_config: Agent) -> int:
+        return int(agent_config.response_cache_ttl_seconds or settings.RESPONSE_CACHE_DEFAULT_TTL_SECONDS)
+
+    @staticmethod
+    def _config_hash(agent_config: Agent) -> str:
+        # Anything that changes the answer for the same prompt belongs here.
+        return _sha256(f"{agent_config.platform}|{agent_config.model or ''}|{ResponseCacheService._ttl_seconds(agent_config)}")
+
+    @staticmethod
+    def _system_hash(messages: List[Dict[str, str]]) -> str:
+        system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        return _sha256(system)
+
+    @staticmethod
+    def is_context_free(messages: List[Dict[str, str]]) -> bool:
+        """True when the conversation is just one user message (besides system prompts)."""
+        conversation = [m for m in messages if m.get("role") != "system"]
+        return len(conversation) == 1 and conversation[0].get("role") == "user"
+
+    @staticmethod
+    def _final_user_message(messages: List[Dict[str, str]]) -> str:
+        for m in reversed(messages):
+            if m.get("role") == "user":
+                return m.get("content", "") or ""
+        return ""
+
+    def _key_filter(
+        self,
+        agent_id: str,
+        agent_config: Agent,
+        messages: List[Dict[str, str]],
+    ) -> List[qm.FieldCondition]:
+        return [
+            qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id)),
+            qm.FieldCondition(key="model", match=qm.MatchValue(value=agent_config.model or "")),
+            qm.FieldCondition(key="system_hash", match=qm.MatchValue(value=self._system_hash(messages))),
+            qm.FieldCondition(key="config_hash", match=qm.MatchValue(value=self._config_hash(agent_config))),
+        ]
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+
+    async def lookup(
+        self,
+        agent_id: str,
+        agent_config: Agent,
+        messages: List[Dict[str, str]],
+    ) -> CacheLookup:
+        query = self._final_user_message(messages).strip()
+        if not query or not self.is_context_free(messages):
+            return CacheLookup(status=CACHE_BYPASS)
+
+        vec = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+        must = self._key_filter(agent_id, agent_config, messages)
+        must.append(qm.FieldCondition(key="expires_at", range=qm.Range(gt=time.time())))
+
+        hits = self.qdrant.search(
+            self.COLLECTION,
+            vector_name=QdrantService.RESPONSE_CACHE_VECTOR_NAME,
+            query_vector=vec,
+            qfilter=qm.Filter(must=must),
+            limit=1,
+            score_threshold=settings.RESPONSE_CACHE_SIMILARITY,
+        )
+        if hits and hits[0].payload and hits[0].payload.get("response"):
+            return CacheLookup(status=CACHE_HIT, content=str(hits[0].payload["response"]), vector=vec)
+        return CacheLookup(status=CACHE_MISS, vector=vec)
+
+    async def store(
+        self,
+        agent_id: str,
+        agent_config: Agent,
+        messages: List[Dict[str, str]],
+        response: str,
+        vector: Optional[List[float]] = None,
+    ) -> None:
+        query = self._final_user_message(messages).strip()
+        if not query or not response or not self.is_context_free(messages):
+            return
+        if vector is None:
+            vector = await self.embedder.embed_text(query, expected_dim=settings.QDRANT_MESSAGE_VECTOR_SIZE)
+
+        now = time.time()
+        entry_id = str(uuid.uuid4())
+        payload = {
+            **make_base_payload("response_cache"),
+            "id": entry_id,
+            "agent_id": agent_id,
+            "model": agent_config.model or "",
+            "system_hash": self._system_hash(messages),
+            "config_hash": self._config_hash(agent_config),
+            "prompt": query,
+            "response": response,
+            "expires_at": now + self._ttl_seconds(agent_config),
+        }
+        self.qdrant.upsert_record(
+            self.COLLECTION,
+            entry_id,
+            payload,
+            vector={QdrantService.RESPONSE_CACHE_VECTOR_NAME: vector},
+        )
+
+        # Opportunistically drop this agent's expired entries.
+        self.qdrant.delete_by_filter(
+            self.COLLECTION,
+            qm.Filter(
+                must=[
+                    qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id)),
+                    qm.FieldCondition(key="expires_at", range=qm.Range(lt=now)),
+                ]
+            ),
+        )
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def invalidate_agent(cls, agent_id: str) -> None:
+        """Drop every cached answer for an agent (model/config change or deletion)."""
+        try:
+            get_qdrant_service().delete_by_filter(
+                cls.COLLECTION,
+                qm.Filter(must=[qm.FieldCondition(key="agent_id", match=qm.MatchValue(value=agent_id))]),
+            )
+        except Exception:
+            # Cache is best-effort; config_hash already prevents stale matches.
+            pass
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import logging
+from typing import Dict, List, Set
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.services.qdrant_service import QdrantService, get_qdrant_service
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "capsules"
+SIMILAR_FIELD = "similar_ids"
+SIMILAR_REFRESHED_FIELD = "similar_refreshed_at"
+
+# Keep references so background refreshes aren't garbage-collected mid-flight
+_pending: Set[asyncio.Task] = set()
+
+# Last time the set of recommendable capsules changed in this process (stake, create, edit).
+# Lists computed before it are recomputed on next read; the TTL covers other processes.
+_catalogue_changed_at: datetime = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def mark_catalogue_changed() -> None:
+    global _catalogue_changed_at
+    _catalogue_changed_at = _utc_now()
+
+
+def is_fresh(payload: Dict) -> bool:
+    refreshed = payload.get(SIMILAR_REFRESHED_FIELD)
+    if not refreshed or not isinstance(payload.get(SIMILAR_FIELD), list):
+        return False
+    try:
+        at = datetime.fromisoformat(str(refreshed))
+    except ValueError:
+        return False
+    if at < _catalogue_changed_at:
+        return False
+    return (_utc_now() - at).total_seconds() < settings.MARKETPLACE_SIMILAR_TTL_SECONDS
+
+
+def refresh_similar(capsule_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    Recompute neighbour lists with one batched recommend query (staked capsules only)
+    and store them on each capsule as `similar_ids`.
+    """
+    qdrant = get_qdrant_service()
+    listed = qm.Filter(must=[qm.FieldCondition(key="stake_amount", range=qm.Range(gt=0))])
+    results = qdrant.recommend_batch(
+        COLLECTION,
+        QdrantService.CAPSULE_VECTOR_NAME,
+        capsule_ids,
+        listed,
+        limit=settings.MARKETPLACE_SIMILAR_PRECOMPUTE,
+    )
+    now = _utc_now().isoformat()
+    out: Dict[str, List[str]] = {}
+    for capsule_id, hits in zip(capsule_ids, results):
+        neighbours = [str(h.id) for h in hits]
+        out[capsule_id] = neighbours
+        qdrant.set_payload(COLLECTION, capsule_id, {SIMILAR_FIELD: neighbours, SIMILAR_REFRESHED_FIELD: now})
+    return out
+
+
+def schedule_similar_refresh(capsule_id: str) -> None:
+    """Refresh a capsule's neighbours in the background after its vector changed."""
+    mark_catalogue_changed()
+
+    async def _run() -> None:
+        try:
+            await asyncio.to_thread(refresh_similar, [capsule_id])
+        except Exception as e:
+            logger.warning(f"Similar-capsule refresh failed for {capsule_id}: {e}")
+
+    try:
+        task = asyncio.get_running_loop().create_task(_run())
+    except RuntimeError:
+        # No running loop (e.g. scripts); the list is computed on first read instead
+        return
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
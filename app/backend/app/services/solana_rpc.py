@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import httpx
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RPCCall = Tuple[str, List[Any]]  # (method, params)
+
+LAMPORTS_PER_SOL = 1_000_000_000
+
+
+class SolanaRPCError(Exception):
+    """A JSON-RPC error object returned for one call (or a failed batch request)."""
+
+    def __init__(self, message: str, code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+class TokenBucket:
+    """Requests-per-second limiter with bursts; `rate <= 0` disables it."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self, n: int = 1) -> None:
+        """Take `n` tokens; more than the burst capacity are taken a capacity-sized chunk at a time."""
+        if self.rate <= 0:
+            return
+        remaining = float(n)
+        while remaining > 0:
+            chunk = min(remaining, self.capacity)
+            await self._take(chunk)
+            remaining -= chunk
+
+    async def _take(self, n: float) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= n:
+                self._tokens -= n
+                return
+            await asyncio.sleep((n - self._tokens) / self.rate)
+
+
+class SolanaRPCClient:
+    """
+    Shared JSON-RPC client for one Solana endpoint.
+
+    - One pooled `httpx.AsyncClient` (keep-alive) per event loop instead of a client per call.
+    - `call()` micro-batches: calls issued within SOLANA_RPC_BATCH_WINDOW_MS of each other go
+      out as a single JSON-RPC batch request (up to SOLANA_RPC_MAX_BATCH per request).
+    - `batch()` sends an explicit list of calls in one request.
+    - Every request waits on the endpoint's token bucket (SOLANA_RPC_RATE_LIMIT_RPS, counted
+      per call inside a batch) so bursts are smoothed instead of throttled by the provider.
+    - `get_balances()` caches balances briefly, sharing in-flight lookups.
+    Per-call errors are raised as `SolanaRPCError`; `result: null` comes back as None.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        batch_window_ms: float = 0,
+        max_batch: int = 50,
+        timeout: float = 10.0,
+        rate_limit_rps: float = 0,
+        rate_limit_burst: float = 1,
+        balance_ttl_seconds: float = 0,
+    ) -> None:
+        self.url = url
+        self.batch_window_ms = batch_window_ms
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sending: Set[asyncio.Task] = set()
+        self._limiter = TokenBucket(rate_limit_rps, rate_limit_burst)
+        self._balances = TTLCache(balance_ttl_seconds, max_entries=10_000)
+        self._balance_inflight: Dict[str, asyncio.Future] = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        # Connections belong to the loop that opened them (tests run several loops)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            try:
+                await self._client.aclose()
+            except RuntimeError:
+                # Opened on a loop that is already gone
+                pass
+        self._client = None
+
+    def _request(self, method: str, params: List[Any]) -> Dict[str, Any]:
+        return {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+
+    async def _post(self, requests: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """POST one request (or a batch) and return responses keyed by id."""
+        body: Any = requests[0] if len(requests) == 1 else requests
+        await self._limiter.acquire(len(requests))
+        response = await self._http().post(self.url, json=body)
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, dict):
+            data = [data]
+        return {item.get("id"): item for item in data if isinstance(item, dict)}
+
+    @staticmethod
+    def _result(response: Optional[Dict[str, Any]]) -> Any:
+        if response is None:
+            raise SolanaRPCError("No response for request")
+        error = response.get("error")
+        if error:
+            raise SolanaRPCError(str(error.get("message") or error), error.get("code"))
+        return response.get("result")
+
+    async def batch(self, calls: Sequence[RPCCall]) -> List[Any]:
+        """
+        Send `calls` as JSON-RPC batch requests (chunked by max_batch). Returns one entry per
+        call in order: the result, or the `SolanaRPCError` for calls that failed.
+        """
+        out: List[Any] = []
+        for start in range(0, len(calls), self.max_batch):
+            requests = [self._request(method, params) for method, params in calls[start:start + self.max_batch]]
+            responses = await self._post(requests)
+            for req in requests:
+                try:
+                    out.append(self._result(responses.get(req["id"])))
+                except SolanaRPCError as e:
+                    out.append(e)
+        return out
+
+    async def call(self, method: str, params: List[Any]) -> Any:
+        if self.batch_window_ms <= 0:
+            request = self._request(method, params)
+            return self._result((await self._post([request])).get(request["id"]))
+
+        loop = asyncio.get_running_loop()
+        if self._batch_loop is not loop:
+            # A window left open by a loop that has since stopped never flushes
+            self._pending, self._flush_handle, self._batch_loop = [], None, loop
+        future: asyncio.Future = loop.create_future()
+        self._pending.append((self._request(method, params), future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window_ms / 1000.0, self._flush_now)
+        return await future
+
+    def _flush_now(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.get_running_loop().create_task(self._send(pending))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, pending: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        try:
+            responses = await self._post([request for request, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(SolanaRPCError(f"RPC request failed: {e}"))
+            return
+        for request, future in pending:
+            if future.done():
+                continue
+            try:
+                future.set_result(self._result(responses.get(request["id"])))
+            except SolanaRPCError as e:
+                future.set_exception(e)
+
+    # ------------------------------------------------------------------
+    # Balances
+    # ------------------------------------------------------------------
+
+    async def get_balances(self, addresses: Sequence[str]) -> Dict[str, Optional[int]]:
+        """
+        Lamports per address (None when the lookup failed; failures are not cached).
+        Misses go out together (a lone miss joins the micro-batch window), and concurrent
+        lookups of the same address share one request.
+        """
+        out: Dict[str, Optional[int]] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+        for address in dict.fromkeys(addresses):
+            hit = self._balances.get(address)
+            if hit is not None:
+                out[address] = hit.value
+            elif address in self._balance_inflight:
+                waiting[address] = self._balance_inflight[address]
+            else:
+                missing.append(address)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {address: loop.create_future() for address in missing}
+            self._balance_inflight.update(futures)
+            try:
+                try:
+                    if len(missing) == 1:
+                        results: List[Any] = [await self.call("getBalance", [missing[0]])]
+                    else:
+                        results = await self.batch([("getBalance", [address]) for address in missing])
+                except Exception as e:
+                    logger.warning(f"Balance lookup failed: {e}")
+                    results = [None] * len(missing)
+                for address, result in zip(missing, results):
+                    lamports = int(result.get("value") or 0) if isinstance(result, dict) else None
+                    if lamports is not None:
+                        self._balances.set(address, lamports)
+                    futures[address].set_result(lamports)
+                    out[address] = lamports
+            finally:
+                for address, future in futures.items():
+                    self._balance_inflight.pop(address, None)
+                    if not future.done():
+                        future.cancel()
+
+        for address, future in waiting.items():
+            try:
+                out[address] = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The request that was fetching it went away
+                out[address] = None
+        return out
+
+
+_clients: Dict[str, SolanaRPCClient] = {}
+
+
+def get_solana_rpc(url: Optional[str] = None) -> SolanaRPCClient:
+    """Shared client for `url` (default SOLANA_RPC_URL); each endpoint has its own pool, limiter and cache."""
+    url = url or settings.SOLANA_RPC_URL
+    client = _clients.get(url)
+    if client is None:
+        client = SolanaRPCClient(
+            url,
+            batch_window_ms=settings.SOLANA_RPC_BATCH_WINDOW_MS,
+            max_batch=settings.SOLANA_RPC_MAX_BATCH,
+            timeout=settings.SOLANA_RPC_TIMEOUT_SECONDS,
+            rate_limit_rps=settings.SOLANA_RPC_RATE_LIMIT_RPS,
+            rate_limit_burst=settings.SOLANA_RPC_RATE_LIMIT_BURST,
+            balance_ttl_seconds=settings.SOLANA_BALANCE_CACHE_TTL_SECONDS,
+        )
+        _clients[url] = client
+    return client
+
+
+async def close_solana_rpc() -> None:
+    for client in list(_clients.values()):
+        await client.aclose()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import math
+from typing import Any, Dict, Optional
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.services.qdrant_service import get_qdrant_service
+
+# Time-decayed popularity without periodic rescoring.
+#
+# A capsule's trending score is sum(w_i * exp(-lambda * (now - t_i))) over its query/stake
+# events. Factoring out exp(-lambda * now) leaves log(sum(w_i * exp(lambda * t_i))), which
+# only changes when an event happens and orders capsules exactly like the decayed score at
+# any moment. That log value is stored as the indexed `trending_score` payload field,
+# bumped with logaddexp on each event, so `/marketplace/trending` is a single order_by read.
+
+TRENDING_FIELD = "trending_score"
+
+# Time origin for the log score; keeps lambda * t small.
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# New capsules enter the leaderboard as if they had a tenth of a query.
+_SEED_WEIGHT = 0.1
+
+
+def _decay_rate() -> float:
+    half_life_seconds = max(settings.TRENDING_HALF_LIFE_HOURS, 0.01) * 3600.0
+    return math.log(2) / half_life_seconds
+
+
+def _log_event(weight: float, at: datetime) -> float:
+    return math.log(weight) + _decay_rate() * (at - _EPOCH).total_seconds()
+
+
+def bump_trending(payload: Dict[str, Any], weight: float, at: Optional[datetime] = None) -> Optional[float]:
+    """
+    Add an event of `weight` to a capsule payload's trending score (in place); returns it.
+    Events without positive weight (a zero stake, a weight set to 0) leave it unchanged.
+    """
+    if weight <= 0:
+        current = payload.get(TRENDING_FIELD)
+        return None if current is None else float(current)
+    event = _log_event(weight, at or datetime.now(timezone.utc))
+    current = payload.get(TRENDING_FIELD)
+    if current is None:
+        score = event
+    else:
+        hi, lo = max(float(current), event), min(float(current), event)
+        score = hi + math.log1p(math.exp(lo - hi))
+    payload[TRENDING_FIELD] = score
+    return score
+
+
+def seed_trending(at: Optional[datetime] = None) -> float:
+    return _log_event(_SEED_WEIGHT, at or datetime.now(timezone.utc))
+
+
+def backfill_trending_scores() -> int:
+    """Give capsules created before trending existed a score, from lifetime query_count at updated_at."""
+    qdrant = get_qdrant_service()
+    qfilter = qm.Filter(must=[qm.IsEmptyCondition(is_empty=qm.PayloadField(key=TRENDING_FIELD))])
+    updated = 0
+    while True:
+        # Updated points drop out of the filter, so always read the first page
+        points, _ = qdrant.query_by_filter("capsules", qfilter=qfilter, limit=256)
+        if not points:
+            return updated
+        for p in points:
+            payload = p.payload or {}
+            try:
+                at = datetime.fromisoformat(str(payload.get("updated_at")))
+                at = at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+            except ValueError:
+                at = datetime.now(timezone.utc)
+            queries = settings.TRENDING_QUERY_WEIGHT * int(payload.get("query_count") or 0)
+            weight = _SEED_WEIGHT + max(0.0, queries)
+            qdrant.set_payload("capsules", p.id, {TRENDING_FIELD: _log_event(weight, at)})
+            updated += 1
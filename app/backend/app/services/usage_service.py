@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.services.qdrant_service import get_qdrant_service, make_base_payload
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat()
+
+
+logger = logging.getLogger(__name__)
+
+# Each process accumulates deltas in memory and periodically adds them to rollup records
+# of its own (one shard per process), so workers never read-modify-write the same record.
+_SHARD = uuid.uuid4().hex
+
+RollupKey = Tuple[str, str, str]  # (scope, key, day)
+
+_pending: Dict[RollupKey, Dict[str, Any]] = {}
+_pending_lock = threading.Lock()  # guards _pending only; held for dict merges, never across I/O
+_flush_lock = threading.Lock()  # one flush at a time per process
+
+_COUNTERS = (
+    "requests",
+    "errors",
+    "cache_hits",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "total_tokens",
+    "ttft_ms_sum",
+    "ttft_count",
+    "latency_ms_sum",
+)
+
+
+def _merge(into: Dict[str, Any], delta: Dict[str, Any]) -> None:
+    """Add one rollup delta (counters, latency max, model counts) into another."""
+    for counter in _COUNTERS:
+        into[counter] = (into.get(counter) or 0) + (delta.get(counter) or 0)
+    into["latency_ms_max"] = max(float(into.get("latency_ms_max") or 0.0), float(delta.get("latency_ms_max") or 0.0))
+    models = dict(into.get("models") or {})
+    for model, count in (delta.get("models") or {}).items():
+        models[model] = int(models.get(model) or 0) + int(count)
+    into["models"] = models
+
+
+class UsageService:
+    """
+    Daily token/latency rollups per agent, wallet and chat (payload-only collection `usage_rollups`).
+
+    Additive counters per (scope, key, UTC day), so averages are derived as sum / count at
+    read time. `record()` only adds to an in-process buffer; `flush()` (every
+    USAGE_FLUSH_INTERVAL_SECONDS, and on shutdown) adds the buffer to this process's
+    shard record for each key, and reads sum the shards.
+    """
+
+    COLLECTION = "usage_rollups"
+    SCOPES = ("agent", "wallet", "chat")
+
+    def __init__(self) -> None:
+        self.qdrant = get_qdrant_service()
+
+    @staticmethod
+    def _rollup_id(scope: str, key: str, day: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"usage:{scope}:{key}:{day}:{_SHARD}"))
+
+    def record(
+        self,
+        agent_id: str,
+        wallet: Optional[str],
+        chat_id: Optional[str],
+        model: Optional[str],
+        usage: Dict[str, Any],
+        error: bool = False,
+        cache_hit: bool = False,
+    ) -> None:
+        day = _utc_now().date().isoformat()
+        delta = {
+            "requests": 1,
+            "errors": 1 if error else 0,
+            "cache_hits": 1 if cache_hit else 0,
+            "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+            "completion_tokens": int(usage.get("completion_tokens") or 0),
+            "cached_tokens": int(usage.get("cached_tokens") or 0),
+            "total_tokens": int(usage.get("total_tokens") or 0),
+            "ttft_ms_sum": float(usage.get("ttft_ms") or 0.0),
+            "ttft_count": 1 if usage.get("ttft_ms") is not None else 0,
+            "latency_ms_sum": float(usage.get("latency_ms") or 0.0),
+            "latency_ms_max": float(usage.get("latency_ms") or 0.0),
+            "models": {model: 1} if model else {},
+        }
+        keys = {"agent": agent_id, "wallet": wallet, "chat": chat_id}
+        with _pending_lock:
+            for scope in self.SCOPES:
+                key = keys.get(scope)
+                if not key:
+                    continue
+                pending = _pending.setdefault((scope, key, day), {"agent_id": agent_id})
+                _merge(pending, delta)
+
+    def flush(self) -> int:
+        """Write buffered deltas to this process's shard records; returns how many keys were written."""
+        with _flush_lock:
+            with _pending_lock:
+                batch = dict(_pending)
+                _pending.clear()
+            written = 0
+            try:
+                for (scope, key, day), delta in list(batch.items()):
+                    self._apply(scope, key, day, delta)
+                    del batch[(scope, key, day)]
+                    written += 1
+            finally:
+                if batch:
+                    # Not written (Qdrant error): keep for the next flush
+                    with _pending_lock:
+                        for rollup_key, delta in batch.items():
+                            _merge(_pending.setdefault(rollup_key, {"agent_id": delta.get("agent_id")}), delta)
+            return written
+
+    def _apply(self, scope: str, key: str, day: str, delta: Dict[str, Any]) -> None:
+        rec_id = self._rollup_id(scope, key, day)
+        rec = self.qdrant.get_by_id(self.COLLECTION, rec_id)
+        if rec and rec.payload:
+            payload = dict(rec.payload)
+        else:
+            payload = {
+                **make_base_payload("usage_rollup"),
+                "id": rec_id,
+                "scope": scope,
+                "key": key,
+                "day": day,
+                "shard": _SHARD,
+                "agent_id": delta.get("agent_id"),
+                "latency_ms_max": 0.0,
+                "models": {},
+                **{c: 0 for c in _COUNTERS},
+            }
+        _merge(payload, delta)
+        payload["updated_at"] = _iso(_utc_now())
+        self.qdrant.upsert_record(self.COLLECTION, rec_id, payload)
+
+    def _shards(self, scope: str, key: str, days: Iterable[str]) -> List[Dict[str, Any]]:
+        qfilter = qm.Filter(must=[
+            qm.FieldCondition(key="scope", match=qm.MatchValue(value=scope)),
+            qm.FieldCondition(key="key", match=qm.MatchValue(value=key)),
+            qm.FieldCondition(key="day", match=qm.MatchAny(any=list(days))),
+        ])
+        out: List[Dict[str, Any]] = []
+        offset = None
+        while True:
+            points, offset = self.qdrant.query_by_filter(self.COLLECTION, qfilter=qfilter, limit=256, offset=offset)
+            out.extend(p.payload for p in points if p.payload)
+            if not offset:
+                return out
+
+    def get_rollups(self, scope: str, key: str, days: int = 7) -> List[Dict[str, Any]]:
+        today = _utc_now().date()
+        wanted = [(today - timedelta(days=i)).isoformat() for i in range(days)]
+        totals: Dict[str, Dict[str, Any]] = {}
+        for shard in self._shards(scope, key, wanted):
+            _merge(totals.setdefault(shard["day"], {"day": shard["day"]}), shard)
+        # Include this process's deltas that have not been flushed yet
+        with _pending_lock:
+            for day in wanted:
+                delta = _pending.get((scope, key, day))
+                if delta:
+                    _merge(totals.setdefault(day, {"day": day}), delta)
+
+        out: List[Dict[str, Any]] = []
+        for payload in totals.values():
+            ttft_count = int(payload.get("ttft_count") or 0)
+            requests = int(payload.get("requests") or 0)
+            out.append(
+                {
+                    "day": payload.get("day"),
+                    "requests": requests,
+                    "errors": int(payload.get("errors") or 0),
+                    "cache_hits": int(payload.get("cache_hits") or 0),
+                    "prompt_tokens": int(payload.get("prompt_tokens") or 0),
+                    "completion_tokens": int(payload.get("completion_tokens") or 0),
+                    "cached_tokens": int(payload.get("cached_tokens") or 0),
+                    "total_tokens": int(payload.get("total_tokens") or 0),
+                    "avg_ttft_ms": (float(payload.get("ttft_ms_sum") or 0.0) / ttft_count) if ttft_count else None,
+                    "avg_latency_ms": (float(payload.get("latency_ms_sum") or 0.0) / requests) if requests else None,
+                    "max_latency_ms": float(payload.get("latency_ms_max") or 0.0),
+                    "models": payload.get("models") or {},
+                }
+            )
+        out.sort(key=lambda r: r["day"] or "", reverse=True)
+        return out
+
+
+async def usage_flush_loop() -> None:
+    """Flush buffered usage every USAGE_FLUSH_INTERVAL_SECONDS until cancelled."""
+    while True:
+        await asyncio.sleep(settings.USAGE_FLUSH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(UsageService().flush)
+        except Exception as e:
+            logger.warning(f"Usage flush failed: {e}")
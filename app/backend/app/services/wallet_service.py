@@ -4,12 +4,15 @@ from datetime import datetime, timezone
 import uuid
 from typing import Any, Dict, List, Optional
 
-import httpx
 from qdrant_client.http import models as qm
 
 from app.core.config import settings
 from app.models.schemas import WalletBalance, Earnings, StakingInfo, StakingCreate
+from app.services.marketplace_cache import invalidate_marketplace_cache
 from app.services.qdrant_service import get_qdrant_service, make_base_payload
+from app.services.similar_capsules import mark_catalogue_changed
+from app.services.solana_rpc import LAMPORTS_PER_SOL, get_solana_rpc
+from app.services.trending_service import TRENDING_FIELD, bump_trending
 
 
 def _utc_now() -> datetime:
@@ -41,22 +44,20 @@ class WalletService:
         self.solana_rpc_url = settings.SOLANA_RPC_URL
 
     async def get_balance(self, wallet_address: str) -> WalletBalance:
-        """Get SOL balance for a wallet (unchanged)"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.solana_rpc_url,
-                    json={"jsonrpc": "2.0", "id": 1, "method": "getBalance", "params": [wallet_address]},
-                    timeout=10.0,
-                )
-                data = response.json()
-                if "result" in data:
-                    balance_lamports = data["result"]["value"]
-                    balance_sol = balance_lamports / 1e9
-                    return WalletBalance(wallet_address=wallet_address, balance=balance_sol, currency="SOL")
-        except Exception:
-            pass
-        return WalletBalance(wallet_address=wallet_address, balance=0.0, currency="SOL")
+        """Get SOL balance for a wallet (0 when the RPC lookup fails)"""
+        return (await self.get_balances([wallet_address]))[0]
+
+    async def get_balances(self, wallet_addresses: List[str]) -> List[WalletBalance]:
+        """SOL balances for several wallets via one batched, cached RPC lookup"""
+        lamports = await get_solana_rpc(self.solana_rpc_url).get_balances(wallet_addresses)
+        return [
+            WalletBalance(
+                wallet_address=address,
+                balance=(lamports.get(address) or 0) / LAMPORTS_PER_SOL,
+                currency="SOL",
+            )
+            for address in dict.fromkeys(wallet_addresses)
+        ]
 
     async def get_earnings(self, wallet_address: str, period: Optional[str] = None) -> Earnings:
         must = [qm.FieldCondition(key="wallet", match=qm.MatchValue(value=wallet_address))]
@@ -143,13 +144,23 @@ class WalletService:
         # Update capsule stake_amount (+ listed)
         capsule = self.qdrant.get_by_id(self.CAPSULES_COLLECTION, staking.capsule_id)
         if capsule and capsule.payload:
-            cap = capsule.payload
-            current = float(cap.get("stake_amount") or 0.0)
+            current = float(capsule.payload.get("stake_amount") or 0.0)
             new_stake = current + float(staking.stake_amount)
-            cap["stake_amount"] = new_stake
-            cap["is_listed"] = bool(new_stake > 0)
-            cap["updated_at"] = _iso(_utc_now())
-            self.qdrant.set_payload(self.CAPSULES_COLLECTION, staking.capsule_id, cap)
+            # Only the staking fields; a full-payload write would clobber concurrent updates
+            update: Dict[str, Any] = {
+                "stake_amount": new_stake,
+                "is_listed": bool(new_stake > 0),
+                "updated_at": _iso(_utc_now()),
+            }
+            if TRENDING_FIELD in capsule.payload:
+                update[TRENDING_FIELD] = capsule.payload[TRENDING_FIELD]
+            if staking.stake_amount > 0:
+                bump_trending(update, settings.TRENDING_STAKE_WEIGHT * float(staking.stake_amount))
+            self.qdrant.set_payload(self.CAPSULES_COLLECTION, staking.capsule_id, update)
+            invalidate_marketplace_cache()
+            if (current > 0) != (new_stake > 0):
+                # Similar-capsule lists only cover listed capsules
+                mark_catalogue_changed()
 
         return StakingInfo(
             capsule_id=staking.capsule_id,
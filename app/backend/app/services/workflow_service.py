@@ -0,0 +1,531 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from qdrant_client.http import models as qm
+
+from app.core.config import settings
+from app.models.schemas import (
+    Agent,
+    LLMResponse,
+    WorkflowRun,
+    WorkflowRunCreate,
+    WorkflowStatus,
+    WorkflowStep,
+    WorkflowStepState,
+    WorkflowStepStatus,
+)
+from app.services.admission_service import Priority, get_admission_controller
+from app.services.agent_service import AgentService
+from app.services.blackboard_service import BlackboardService
+from app.services.llm_service import LLMService
+from app.services.qdrant_service import get_qdrant_service, make_base_payload
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*([A-Za-z0-9_.\-]+)\s*\}\}")
+_INPUT_PLACEHOLDER = "input"
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class WorkflowValidationError(ValueError):
+    """Invalid workflow definition (unknown dependency, cycle, bad placeholder...)."""
+
+
+class WorkflowService:
+    """
+    DAG-based multi-agent workflows.
+
+    - A run is a set of agent steps with `depends_on` edges; every step whose
+      dependencies have completed is started, so independent branches run
+      concurrently (bounded by the run's max_concurrency).
+    - Each step has a timeout; a failed step marks its dependents as skipped
+      while unrelated branches keep going.
+    - Step outputs are cached in `workflow_step_cache` by a hash of the agent
+      config and the rendered prompt, so re-running identical work is free.
+    - Run state lives in `workflow_runs` and is saved after every transition;
+      resuming a run re-executes only the steps that did not complete.
+    - With a blackboard, each step reads relevant findings other steps already
+      posted and posts its own output, so parallel branches share results.
+    """
+
+    RUNS_COLLECTION = "workflow_runs"
+    CACHE_COLLECTION = "workflow_step_cache"
+
+    def __init__(self) -> None:
+        self.qdrant = get_qdrant_service()
+        self.agents = AgentService()
+
+    # ------------------------------------------------------------------
+    # Definition
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def validate_steps(steps: List[WorkflowStep]) -> List[str]:
+        """Validate the DAG and return step ids in topological order."""
+        if len(steps) > settings.WORKFLOW_MAX_STEPS:
+            raise WorkflowValidationError(f"Too many steps (max {settings.WORKFLOW_MAX_STEPS})")
+
+        by_id: Dict[str, WorkflowStep] = {}
+        for step in steps:
+            if step.id == _INPUT_PLACEHOLDER:
+                raise WorkflowValidationError(f"'{_INPUT_PLACEHOLDER}' is reserved and cannot be a step id")
+            if step.id in by_id:
+                raise WorkflowValidationError(f"Duplicate step id '{step.id}'")
+            by_id[step.id] = step
+
+        for step in steps:
+            for dep in step.depends_on:
+                if dep not in by_id:
+                    raise WorkflowValidationError(f"Step '{step.id}' depends on unknown step '{dep}'")
+                if dep == step.id:
+                    raise WorkflowValidationError(f"Step '{step.id}' depends on itself")
+            for name in _PLACEHOLDER_RE.findall(step.prompt):
+                if name != _INPUT_PLACEHOLDER and name not in step.depends_on:
+                    raise WorkflowValidationError(
+                        f"Step '{step.id}' references '{{{{{name}}}}}' but does not depend on it"
+                    )
+
+        # Kahn's algorithm; leftovers mean a cycle
+        indegree = {sid: len(set(s.depends_on)) for sid, s in by_id.items()}
+        dependents: Dict[str, List[str]] = {sid: [] for sid in by_id}
+        for step in steps:
+            for dep in set(step.depends_on):
+                dependents[dep].append(step.id)
+        order: List[str] = []
+        ready = [sid for sid, n in indegree.items() if n == 0]
+        while ready:
+            sid = ready.pop()
+            order.append(sid)
+            for child in dependents[sid]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if len(order) != len(by_id):
+            cyclic = sorted(sid for sid, n in indegree.items() if n > 0)
+            raise WorkflowValidationError(f"Workflow has a cycle involving: {', '.join(cyclic)}")
+        return order
+
+    @staticmethod
+    def render_prompt(step: WorkflowStep, run_input: str, outputs: Dict[str, str]) -> str:
+        """
+        Fill "{{input}}" and "{{<step id>}}" placeholders. Dependency outputs that the
+        template does not reference are appended so the step still sees them.
+        """
+        values = {_INPUT_PLACEHOLDER: run_input, **outputs}
+        referenced = set(_PLACEHOLDER_RE.findall(step.prompt))
+        prompt = _PLACEHOLDER_RE.sub(lambda m: values.get(m.group(1), ""), step.prompt)
+
+        extra = [
+            f"Output of step '{dep}':\n{outputs.get(dep, '')}"
+            for dep in step.depends_on
+            if dep not in referenced
+        ]
+        if extra:
+            prompt = prompt + "\n\n---\n\n" + "\n\n".join(extra)
+        return prompt
+
+    @staticmethod
+    def _input_hash(agent: Agent, step: WorkflowStep, prompt: str) -> str:
+        key = {
+            "agent_id": agent.id,
+            "platform": agent.platform,
+            "model": agent.model,
+            "system_prompt": step.system_prompt,
+            "prompt": prompt,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _cache_id(input_hash: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"workflow-step:{input_hash}"))
+
+    def _save(self, run: WorkflowRun) -> None:
+        run.updated_at = _utc_now()
+        payload = {
+            **make_base_payload("workflow_run"),
+            **run.model_dump(mode="json"),
+            "wallet": run.user_wallet,
+        }
+        self.qdrant.upsert_record(self.RUNS_COLLECTION, run.id, payload)
+
+    def _cache_get(self, input_hash: str) -> Optional[str]:
+        try:
+            record = self.qdrant.get_by_id(self.CACHE_COLLECTION, self._cache_id(input_hash))
+        except Exception as e:
+            # A cache that can't be read is a miss
+            logger.warning(f"Workflow step cache lookup failed: {e}")
+            return None
+        if not record or not record.payload:
+            return None
+        if float(record.payload.get("expires_at") or 0) <= time.time():
+            return None
+        return record.payload.get("output")
+
+    def _cache_put(self, input_hash: str, agent_id: str, output: str) -> None:
+        cache_id = self._cache_id(input_hash)
+        payload = {
+            **make_base_payload("workflow_step_output"),
+            "id": cache_id,
+            "input_hash": input_hash,
+            "agent_id": agent_id,
+            "output": output,
+            "expires_at": time.time() + settings.WORKFLOW_STEP_CACHE_TTL_SECONDS,
+        }
+        try:
+            self.qdrant.upsert_record(self.CACHE_COLLECTION, cache_id, payload)
+        except Exception as e:
+            # The step still completed; it just won't be reused
+            logger.warning(f"Workflow step cache write failed: {e}")
+
+    async def create_run(self, data: WorkflowRunCreate, wallet: str) -> WorkflowRun:
+        self.validate_steps(data.steps)
+        for agent_id in {s.agent_id for s in data.steps}:
+            if not await self.agents.get_agent(agent_id, wallet):
+                raise WorkflowValidationError(f"Agent not found (agent_id: {agent_id})")
+
+        now = _utc_now()
+        run_id = str(uuid.uuid4())
+        run = WorkflowRun(
+            id=run_id,
+            name=data.name,
+            status=WorkflowStatus.PENDING,
+            input=data.input,
+            steps=data.steps,
+            step_states={s.id: WorkflowStepState() for s in data.steps},
+            max_concurrency=data.max_concurrency,
+            blackboard_id=(data.blackboard_id or run_id) if data.blackboard else None,
+            user_wallet=wallet,
+            created_at=now,
+            updated_at=now,
+        )
+        self._save(run)
+        return run
+
+    async def get_run(self, run_id: str, wallet: Optional[str]) -> Optional[WorkflowRun]:
+        record = self.qdrant.get_by_id(self.RUNS_COLLECTION, run_id)
+        if not record or not record.payload:
+            return None
+        if wallet and record.payload.get("wallet") != wallet:
+            return None
+        return WorkflowRun(**record.payload)
+
+    async def list_runs(self, wallet: str, limit: int = 50) -> List[WorkflowRun]:
+        qfilter = qm.Filter(must=[qm.FieldCondition(key="wallet", match=qm.MatchValue(value=wallet))])
+        out: List[WorkflowRun] = []
+        offset = None
+        while True:
+            points, next_offset = self.qdrant.query_by_filter(
+                self.RUNS_COLLECTION, qfilter=qfilter, limit=200, offset=offset
+            )
+            out.extend(WorkflowRun(**p.payload) for p in points if p.payload)
+            if not next_offset:
+                break
+            offset = next_offset
+        out.sort(key=lambda r: r.created_at, reverse=True)
+        return out[:limit]
+
+    # ------------------------------------------------------------------
+    # Blackboard
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _get_blackboard() -> Optional[BlackboardService]:
+        try:
+            return BlackboardService()
+        except Exception:
+            # Embeddings not configured -> no shared memory
+            return None
+
+    async def _read_blackboard(
+        self,
+        board: BlackboardService,
+        run: WorkflowRun,
+        step: WorkflowStep,
+        prompt: str,
+    ) -> str:
+        try:
+            entries = await board.search(
+                run.user_wallet or "",
+                run.blackboard_id or run.id,
+                prompt,
+                k=settings.BLACKBOARD_CONTEXT_ENTRIES,
+            )
+        except Exception as e:
+            logger.warning(f"Blackboard read failed: {e}")
+            return ""
+        # Dependency outputs are already part of the prompt
+        entries = [
+            e for e in entries
+            if (e.get("source") or {}).get("step_id") not in step.depends_on
+            or (e.get("source") or {}).get("run_id") != run.id
+        ]
+        return BlackboardService.format_context(entries)
+
+    async def _write_blackboard(
+        self,
+        board: BlackboardService,
+        run: WorkflowRun,
+        step: WorkflowStep,
+        output: str,
+    ) -> None:
+        try:
+            await board.write(
+                run.user_wallet or "",
+                run.blackboard_id or run.id,
+                output,
+                author_agent_id=step.agent_id,
+                source={"run_id": run.id, "step_id": step.id},
+            )
+        except Exception as e:
+            logger.warning(f"Blackboard write failed: {e}")
+
+    def reset_unfinished(self, run: WorkflowRun) -> None:
+        """Prepare a run for resume: keep completed outputs, retry everything else."""
+        for state_id, state in run.step_states.items():
+            if state.status != WorkflowStepStatus.COMPLETED:
+                run.step_states[state_id] = WorkflowStepState()
+        run.status = WorkflowStatus.PENDING
+        run.error = None
+        self._save(run)
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _skip_blocked(run: WorkflowRun) -> None:
+        blocked = {WorkflowStepStatus.FAILED, WorkflowStepStatus.SKIPPED}
+        changed = True
+        while changed:
+            changed = False
+            for step in run.steps:
+                state = run.step_states[step.id]
+                if state.status != WorkflowStepStatus.PENDING:
+                    continue
+                failed = next((d for d in step.depends_on if run.step_states[d].status in blocked), None)
+                if failed:
+                    run.step_states[step.id] = WorkflowStepState(
+                        status=WorkflowStepStatus.SKIPPED,
+                        error=f"Upstream step '{failed}' did not complete",
+                        finished_at=_utc_now(),
+                    )
+                    changed = True
+
+    async def _complete(
+        self,
+        llm: LLMService,
+        agent: Agent,
+        messages: List[Dict[str, str]],
+        wallet: str,
+    ) -> LLMResponse:
+        if not settings.ADMISSION_ENABLED:
+            return await llm.get_completion(agent.id, messages, agent, wallet_address=wallet)
+        async with get_admission_controller().slot(
+            wallet, LLMService.resolve_provider(agent, agent.id), Priority.BATCH
+        ):
+            return await llm.get_completion(agent.id, messages, agent, wallet_address=wallet)
+
+    async def _run_step(
+        self,
+        run: WorkflowRun,
+        step: WorkflowStep,
+        agent: Optional[Agent],
+        llm: LLMService,
+    ) -> WorkflowStepState:
+        state = WorkflowStepState(status=WorkflowStepStatus.RUNNING, started_at=_utc_now())
+        if agent is None:
+            state.status = WorkflowStepStatus.FAILED
+            state.error = f"Agent not found (agent_id: {step.agent_id})"
+            state.finished_at = _utc_now()
+            return state
+
+        outputs = {dep: run.step_states[dep].output or "" for dep in step.depends_on}
+        prompt = self.render_prompt(step, run.input, outputs)
+        state.input_hash = self._input_hash(agent, step, prompt)
+
+        board = self._get_blackboard() if run.blackboard_id else None
+
+        cached = self._cache_get(state.input_hash)
+        if cached is not None:
+            state.status = WorkflowStepStatus.COMPLETED
+            state.output = cached
+            state.cached = True
+            state.finished_at = _utc_now()
+            if board is not None:
+                await self._write_blackboard(board, run, step, cached)
+            return state
+
+        # Shared findings are volatile context; they are not part of the cache key
+        if board is not None:
+            findings = await self._read_blackboard(board, run, step, prompt)
+            if findings:
+                prompt = f"{findings}\n\n---\n\n{prompt}"
+
+        messages: List[Dict[str, str]] = []
+        if step.system_prompt:
+            messages.append({"role": "system", "content": step.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+
+        timeout = step.timeout_seconds or settings.WORKFLOW_STEP_TIMEOUT_SECONDS
+        try:
+            response = await asyncio.wait_for(
+                self._complete(llm, agent, messages, run.user_wallet or ""), timeout
+            )
+        except asyncio.TimeoutError:
+            state.status = WorkflowStepStatus.FAILED
+            state.error = f"Timed out after {timeout:g}s"
+        except Exception as e:
+            state.status = WorkflowStepStatus.FAILED
+            state.error = str(e) or e.__class__.__name__
+        else:
+            state.status = WorkflowStepStatus.COMPLETED
+            state.output = response.content
+            state.usage = response.usage
+            if response.content:
+                self._cache_put(state.input_hash, agent.id, response.content)
+                if board is not None:
+                    await self._write_blackboard(board, run, step, response.content)
+        state.finished_at = _utc_now()
+        return state
+
+    async def execute(self, run_id: str, wallet: str) -> Optional[WorkflowRun]:
+        run = await self.get_run(run_id, wallet)
+        if not run:
+            return None
+
+        steps = {s.id: s for s in run.steps}
+        agents: Dict[str, Optional[Agent]] = {}
+        for agent_id in {s.agent_id for s in run.steps}:
+            agents[agent_id] = await self.agents.get_agent(agent_id, wallet)
+
+        limit = run.max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY
+        llm = LLMService()
+        running: Dict[asyncio.Task, str] = {}
+
+        run.status = WorkflowStatus.RUNNING
+        run.error = None
+        self._save(run)
+
+        try:
+            while True:
+                self._skip_blocked(run)
+                ready = [
+                    s.id
+                    for s in run.steps
+                    if run.step_states[s.id].status == WorkflowStepStatus.PENDING
+                    and all(run.step_states[d].status == WorkflowStepStatus.COMPLETED for d in s.depends_on)
+                ]
+                for step_id in ready[: max(0, limit - len(running))]:
+                    step = steps[step_id]
+                    run.step_states[step_id] = WorkflowStepState(
+                        status=WorkflowStepStatus.RUNNING, started_at=_utc_now()
+                    )
+                    task = asyncio.create_task(self._run_step(run, step, agents.get(step.agent_id), llm))
+                    running[task] = step_id
+                if not running:
+                    break
+                self._save(run)
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step_id = running.pop(task)
+                    try:
+                        run.step_states[step_id] = task.result()
+                    except Exception as e:
+                        logger.error(f"Workflow step {step_id} of run {run.id} crashed: {e}", exc_info=True)
+                        run.step_states[step_id] = WorkflowStepState(
+                            status=WorkflowStepStatus.FAILED,
+                            error=str(e) or e.__class__.__name__,
+                            finished_at=_utc_now(),
+                        )
+                self._save(run)
+        except Exception as e:
+            # Never leave the run persisted as running with orphaned steps
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+            for step_id in running.values():
+                run.step_states[step_id] = WorkflowStepState(
+                    status=WorkflowStepStatus.FAILED, error="Run aborted", finished_at=_utc_now()
+                )
+            run.status = WorkflowStatus.FAILED
+            run.error = str(e) or e.__class__.__name__
+            self._save(run)
+            raise
+        except asyncio.CancelledError:
+            for task in running:
+                task.cancel()
+            # In-flight steps go back to pending so a resume picks them up
+            for step_id in running.values():
+                run.step_states[step_id] = WorkflowStepState()
+            run.status = WorkflowStatus.CANCELLED
+            self._save(run)
+            raise
+
+        failed = [sid for sid, st in run.step_states.items() if st.status != WorkflowStepStatus.COMPLETED]
+        if failed:
+            run.status = WorkflowStatus.FAILED
+            run.error = f"{len(failed)} step(s) did not complete: {', '.join(sorted(failed))}"
+        else:
+            run.status = WorkflowStatus.COMPLETED
+        self._save(run)
+        return run
+
+
+# -------------------------------------------------------------------------
+# Background execution (process-local task registry)
+# -------------------------------------------------------------------------
+
+_active_runs: Dict[str, asyncio.Task] = {}
+
+
+def is_run_active(run_id: str) -> bool:
+    task = _active_runs.get(run_id)
+    return task is not None and not task.done()
+
+
+def start_run(run_id: str, wallet: str) -> asyncio.Task:
+    """Execute a run in the background; keeps a reference so the task is not collected."""
+    if is_run_active(run_id):
+        return _active_runs[run_id]
+
+    async def _execute() -> Optional[WorkflowRun]:
+        try:
+            return await WorkflowService().execute(run_id, wallet)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Workflow run {run_id} crashed: {e}", exc_info=True)
+            return None
+
+    task = asyncio.create_task(_execute())
+    _active_runs[run_id] = task
+    task.add_done_callback(lambda _: _active_runs.pop(run_id, None))
+    return task
+
+
+async def cancel_run(run_id: str) -> bool:
+    """Cancel a running run and wait until its cancelled state has been saved."""
+    task = _active_runs.get(run_id)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    await asyncio.wait([task])
+    return True
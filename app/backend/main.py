@@ -2,11 +2,12 @@ from fastapi import FastAPI, status as http_status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import logging
 import os
 
-from app.api.v1 import agents, marketplace, capsules, wallet, auth, preferences
+from app.api.v1 import agents, marketplace, capsules, wallet, auth, preferences, workflows, blackboards
 from app.core.config import settings
 from app.services.qdrant_service import init_qdrant_service, get_qdrant_service
 
@@ -41,9 +42,46 @@ async def lifespan(app: FastAPI):
             logger.warning("Memory service not available (mem0 may not be configured)")
     except Exception as e:
         logger.warning(f"Memory service initialization failed: {e}")
+
+    # Capsules created before the trending leaderboard need a score to be ordered
+    try:
+        from app.services.trending_service import backfill_trending_scores
+        backfilled = backfill_trending_scores()
+        if backfilled:
+            logger.info(f"Backfilled trending scores for {backfilled} capsules")
+    except Exception as e:
+        logger.warning(f"Trending score backfill failed: {e}")
+
+    # Staking looks capsules up by the indexed top-level agent_id; older capsules only have it in metadata
+    try:
+        from app.services.capsule_service import backfill_capsule_agent_ids
+        backfilled = backfill_capsule_agent_ids()
+        if backfilled:
+            logger.info(f"Backfilled agent_id for {backfilled} capsules")
+    except Exception as e:
+        logger.warning(f"Capsule agent_id backfill failed: {e}")
+
+    # Background dedup of near-duplicate memories
+    consolidation_task = None
+    if settings.MEMORY_CONSOLIDATION_ENABLED:
+        from app.services.memory_consolidation import consolidation_loop
+        consolidation_task = asyncio.create_task(consolidation_loop())
+    
+    # Usage rollups are buffered in memory and written periodically
+    from app.services.usage_service import UsageService, usage_flush_loop
+    usage_task = asyncio.create_task(usage_flush_loop())
     
     yield
     # Shutdown
+    if consolidation_task:
+        consolidation_task.cancel()
+    usage_task.cancel()
+    try:
+        await asyncio.to_thread(UsageService().flush)
+    except Exception as e:
+        logger.warning(f"Final usage flush failed: {e}")
+    from app.services.solana_rpc import close_solana_rpc
+    await close_solana_rpc()
     logger.info("Shutting down Mantlememo API...")
 
 
@@ -61,6 +99,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "X-Wallet-Address"],
+    expose_headers=["X-Cache", "X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
 # Include routers
@@ -70,6 +109,8 @@ app.include_router(capsules.router, prefix="/api/v1/capsules", tags=["Capsules"]
 app.include_router(marketplace.router, prefix="/api/v1/marketplace", tags=["Marketplace"])
 app.include_router(wallet.router, prefix="/api/v1/wallet", tags=["Wallet"])
 app.include_router(preferences.router, prefix="/api/v1", tags=["Preferences"])
+app.include_router(workflows.router, prefix="/api/v1/workflows", tags=["Workflows"])
+app.include_router(blackboards.router, prefix="/api/v1/blackboards", tags=["Blackboards"])
 
 
 @app.get("/")
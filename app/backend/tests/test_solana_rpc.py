@@ -0,0 +1,140 @@
+"""SolanaRPCClient against a local JSON-RPC stub: batching, balance cache, singleflight, rate limit."""
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+from app.services.solana_rpc import SolanaRPCClient, SolanaRPCError, TokenBucket
+
+
+class _StubRPC(BaseHTTPRequestHandler):
+    """getBalance returns len(address) SOL; addresses starting with "bad" get a JSON-RPC error."""
+
+    posts: list = []
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).posts.append(body)
+        time.sleep(type(self).delay)
+        items = body if isinstance(body, list) else [body]
+        out = []
+        for item in items:
+            address = item["params"][0]
+            if address.startswith("bad"):
+                out.append({"jsonrpc": "2.0", "id": item["id"], "error": {"code": -32602, "message": "Invalid param"}})
+            else:
+                out.append({"jsonrpc": "2.0", "id": item["id"], "result": {"value": len(address) * 1_000_000_000}})
+        data = json.dumps(out if isinstance(body, list) else out[0]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope="module")
+def rpc_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubRPC)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_stub():
+    _StubRPC.posts = []
+    _StubRPC.delay = 0.0
+
+
+def _batch_sizes():
+    return [len(body) if isinstance(body, list) else 1 for body in _StubRPC.posts]
+
+
+def test_calls_within_the_window_share_one_batch(rpc_url):
+    client = SolanaRPCClient(rpc_url, batch_window_ms=20)
+
+    async def run():
+        try:
+            return await asyncio.gather(
+                client.call("getBalance", ["a"]),
+                client.call("getBalance", ["bb"]),
+                client.call("getBalance", ["bad"]),
+                return_exceptions=True,
+            )
+        finally:
+            await client.aclose()
+
+    a, bb, bad = asyncio.run(run())
+    assert _batch_sizes() == [3]
+    assert a == {"value": 1_000_000_000}
+    assert bb == {"value": 2_000_000_000}
+    assert isinstance(bad, SolanaRPCError) and bad.code == -32602
+
+
+def test_batch_is_chunked_by_max_batch(rpc_url):
+    client = SolanaRPCClient(rpc_url, max_batch=2)
+
+    async def run():
+        try:
+            return await client.batch([("getBalance", [address]) for address in ["a", "bb", "ccc", "bad"]])
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+    assert _batch_sizes() == [2, 2]
+    assert [r["value"] for r in results[:3]] == [1_000_000_000, 2_000_000_000, 3_000_000_000]
+    assert isinstance(results[3], SolanaRPCError)
+
+
+def test_balances_are_cached_and_failures_are_not(rpc_url):
+    client = SolanaRPCClient(rpc_url, balance_ttl_seconds=60)
+
+    async def run():
+        try:
+            first = await client.get_balances(["a", "bb", "bad", "a"])
+            second = await client.get_balances(["a", "bb", "bad"])
+            return first, second
+        finally:
+            await client.aclose()
+
+    first, second = asyncio.run(run())
+    assert first == {"a": 1_000_000_000, "bb": 2_000_000_000, "bad": None}
+    assert second == first
+    # One batch for the three misses, then only the failed lookup is retried
+    assert _batch_sizes() == [3, 1]
+    assert _StubRPC.posts[1]["params"] == ["bad"]
+
+
+def test_concurrent_lookups_of_an_address_share_one_request(rpc_url):
+    _StubRPC.delay = 0.05
+    client = SolanaRPCClient(rpc_url, batch_window_ms=5, balance_ttl_seconds=60)
+
+    async def run():
+        try:
+            return await asyncio.gather(*[client.get_balances(["ccc"]) for _ in range(5)])
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+    assert results == [{"ccc": 3_000_000_000}] * 5
+    assert _batch_sizes() == [1]
+
+
+def test_token_bucket_charges_requests_larger_than_the_burst():
+    bucket = TokenBucket(rate=100, burst=5)
+
+    async def run():
+        started = time.monotonic()
+        await bucket.acquire(15)
+        return time.monotonic() - started
+
+    # 5 tokens from the full bucket, then 10 more at 100/s
+    assert asyncio.run(run()) >= 0.09